@@ -1,38 +1,45 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, HTTPException, Header, status, Depends
-from api.auth.schemas import UserCreate, UserLogin, UserOut
+from api.auth.schemas import SessionOut, UserCreate, UserLogin, UserOut
 from api.auth.services.auth_service import create_new_user, get_current_user, login_user
-from api.core.db import get_session
+from api.core.db import SessionReleasingRoute, get_session
 from sqlalchemy.ext.asyncio import AsyncSession
 from api.auth.services.jwt_service import (
     create_token,
+    get_active_sessions,
+    remove_all_refresh_tokens_from_redis,
     remove_refresh_token_from_redis,
     validate_refresh_token,
     add_refresh_token_to_redis,
 )
 from api.core.config import settings
-from api.core.redis_client import get_redis
-from redis.asyncio import Redis
+from api.core.cache import CacheBackend, get_cache
+from api.core.rate_limit import RateLimiter
 
 router = APIRouter(
     
     prefix="/auth",
     tags=["auth"],
+    route_class=SessionReleasingRoute,
 )
 
 
-@router.post("/register", response_model=UserOut)
+@router.post(
+    "/register",
+    response_model=UserOut,
+    dependencies=[Depends(RateLimiter("auth_register"))]
+)
 async def register(
     user_in: UserCreate,
     db : AsyncSession = Depends(get_session)
 ):
     return await create_new_user(db, user_in)
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(RateLimiter("auth_login"))])
 async def login(
     user_in: UserLogin,
     db : AsyncSession = Depends(get_session),
-    redis_client = Depends(get_redis)
+    cache: CacheBackend = Depends(get_cache)
 ):
     user_in_db: UserOut = await login_user(
         user_in,
@@ -54,7 +61,7 @@ async def login(
     # ? Add refresh token to redis for later logout or refresh
     
     await add_refresh_token_to_redis(
-        redis_client=redis_client,
+        cache=cache,
         user_id=user_in_db.id,
         jti=refresh_payload["jti"],
         expires_delta=timedelta(days=30)
@@ -69,7 +76,7 @@ async def login(
     
 @router.post("/logout")    
 async def logout(
-    redis_client = Depends(get_redis), 
+    cache: CacheBackend = Depends(get_cache),
     refresh_token: str = Header(..., alias="Authorization")
 ):
     if not refresh_token.startswith("Bearer "):
@@ -77,19 +84,46 @@ async def logout(
 
     token = refresh_token.split(" ")[1]
     try:
-        payload = await validate_refresh_token(token, redis_client)
+        payload = await validate_refresh_token(token, cache)
     except HTTPException:
         return {"message": "Token already invalid"}
 
-    await remove_refresh_token_from_redis(redis_client, payload['user_id'], payload['jti'])
+    await remove_refresh_token_from_redis(cache, payload['user_id'], payload['jti'])
     return {"message": "Logged out"}
 
+@router.post("/logout-all")
+async def logout_all(
+    user: UserOut = Depends(get_current_user),
+    cache: CacheBackend = Depends(get_cache)
+):
+    """
+    Invalidates every refresh token of the current user ("log out everywhere")
+    """
+    revoked = await remove_all_refresh_tokens_from_redis(cache, user.id)
+    return {"message": "Logged out from all sessions", "revoked": revoked}
+
+@router.get("/sessions", response_model=list[SessionOut])
+async def get_sessions(
+    user: UserOut = Depends(get_current_user),
+    cache: CacheBackend = Depends(get_cache)
+):
+    """
+    Returns active sessions (refresh tokens) of the current user
+    """
+    sessions = await get_active_sessions(cache, user.id)
+    return [
+        SessionOut(
+            jti=jti,
+            expires_at=datetime.fromtimestamp(expires_at, tz=timezone.utc)
+        ) for jti, expires_at in sessions
+    ]
+
 @router.post("/refresh")
 async def refresh_access_token(
     refresh_token: str = Header(..., alias="Authorization"),
-    redis_client: Redis = Depends(get_redis)
+    cache: CacheBackend = Depends(get_cache)
 ):
-    payload = await validate_refresh_token(refresh_token, redis_client)
+    payload = await validate_refresh_token(refresh_token, cache)
     new_access, _ = create_token(payload['user_id'], timedelta(minutes=15))
     return {"access_token": new_access}
 
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, ConfigDict, EmailStr, field_validator
 
 
@@ -31,4 +32,8 @@ class UserLogin(BaseModel):
 class UserOut(UserBase):
     id: int
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+    
+class SessionOut(BaseModel):
+    jti: str
+    expires_at: datetime
@@ -8,12 +8,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
 from api.auth.security import get_password_hash, verify_password
 from api.core.config import settings
-from api.core.db import get_session
+from api.core.db import LazySession, current_user_id, get_session, read_session_for
 from api.core.models import User
-from redis.asyncio import Redis
-from typing import Annotated
+from typing import Annotated, AsyncGenerator
 from api.auth.services.jwt_service import validate_refresh_token
-from api.core.redis_client import get_redis
+from api.core.cache import CacheBackend, get_cache
+from api.core.metrics import CACHE_REQUESTS
 
 async def create_new_user(
     db: AsyncSession,
@@ -110,7 +110,7 @@ async def login_user(
 
 async def get_current_user(
     access_token: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    cache: CacheBackend = Depends(get_cache),
     db: AsyncSession = Depends(get_session)
 ) -> UserOut:
     
@@ -130,8 +130,12 @@ async def get_current_user(
         raise HTTPException(401, "Invalid token")
     
     
-    if user_data := await redis_client.get(f"user:{payload['user_id']}"):
-        return UserOut.model_validate_json(user_data)
+    current_user_id.set(int(payload['user_id']))
+    
+    if user_out := await cache.get(f"user:{payload['user_id']}", UserOut):
+        CACHE_REQUESTS.labels("user", "hit").inc()
+        return user_out
+    CACHE_REQUESTS.labels("user", "miss").inc()
     
     user = await db.execute(
         select(User).where(User.id == int(payload['user_id']))
@@ -141,13 +145,16 @@ async def get_current_user(
     if not user:
         raise HTTPException(404, "User not found")
     
-    await redis_client.set(
-        f"user:{user.id}",
-        UserOut(
-            id=user.id,
-            username=user.username,
-            email=user.email
-        ).model_dump_json(),
-        ex=3600
-    )
-    return UserOut.model_validate(user)
\ No newline at end of file
+    user_out = UserOut.model_validate(user)
+    await cache.set(f"user:{user.id}", user_out, ex=3600)
+    return user_out
+
+async def get_read_session(
+    user: UserOut = Depends(get_current_user)
+) -> AsyncGenerator[LazySession, None]:
+    """
+    Session for GET endpoints, served by the read replica when it is configured.
+    Reads stick to the primary for a few seconds after the user's commit (read-your-writes).
+    """
+    async for session in read_session_for(user.id):
+        yield session
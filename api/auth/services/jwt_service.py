@@ -1,10 +1,12 @@
 from fastapi import HTTPException, status
-from redis.asyncio import ConnectionPool, Redis
 from uuid import uuid4
 import jwt
+import time
 from typing import Annotated
 from datetime import datetime, timedelta, timezone
 from api.core.config import settings 
+from redis.asyncio import Redis
+from api.core.cache import CacheBackend, RedisCacheBackend
 
 def create_token(
     user_id: Annotated[int, "User ID to include in token"],
@@ -46,7 +48,7 @@ def create_token(
 
 async def validate_refresh_token(
     token: Annotated[str, "Token to validate"],    
-    redis_client: Annotated[Redis, "Redis client"]
+    cache: Annotated[CacheBackend, "Cache backend"]
 ) -> Annotated[dict, "Payload of the token"]:
     """
     Validate a refresh token by checking if it exists in Redis and with jwt.decode
@@ -73,10 +75,15 @@ async def validate_refresh_token(
             detail="Could not validate credentials"
         )
     
-    # check passed, check redis
+    # check passed, check the user's session index (single ZSCORE)
     
-    redis_token = await redis_client.get(f"token:{payload['user_id']}:{payload['jti']}")
-    if redis_token is None:
+    expires_at = await cache.zscore(
+        sessions_key(payload['user_id']),
+        payload['jti']
+    )
+    if expires_at is None:
+        expires_at = await _migrate_legacy_token(cache, payload)
+    if expires_at is None or expires_at <= time.time():
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
@@ -84,27 +91,120 @@ async def validate_refresh_token(
     
     return payload
 
+def _legacy_redis(cache: CacheBackend) -> Redis | None:
+    """
+    Refresh tokens issued before the session index existed are token:{user_id}:{jti} keys
+    set through the raw Redis client (no namespace). They are moved into the index when
+    they are first used, unless a logout-all happened after they were issued (see
+    revoked_before_key). This can go once jwt_refresh_token_expires_days have passed
+    since the session index was deployed.
+    """
+    return cache.client if isinstance(cache, RedisCacheBackend) else None
+
+async def _migrate_legacy_token(cache: CacheBackend, payload: dict) -> float | None:
+    """
+    Moves a pre-index refresh token into the session index.
+
+    Returns:
+        float | None: its expiration timestamp, None if there is no such token
+    """
+    client = _legacy_redis(cache)
+    if client is None:
+        return None
+    if not await client.delete(f"token:{payload['user_id']}:{payload['jti']}"):
+        # A concurrent request may have just moved it
+        return await cache.zscore(sessions_key(payload['user_id']), payload['jti'])
+    revoked_before = await cache.get(revoked_before_key(payload['user_id']))
+    if revoked_before is not None and payload['iat'] <= revoked_before:
+        return None
+
+    expires_at = float(payload['exp'])
+    key = sessions_key(payload['user_id'])
+    async with cache.pipeline() as pipe:
+        pipe.zadd(key, {payload['jti']: expires_at})
+        pipe.zrevrange(key, 0, 0, withscores=True)
+    [(_, latest)] = pipe.results[1]
+    # The index expires with its longest-lived session, which may be another one
+    await cache.expire(key, max(1, int(latest - time.time())))
+    return expires_at
+
+def sessions_key(user_id: int | str) -> str:
+    """
+    Key of the per-user session index.
+    It is a sorted set: member is refresh token's JTI, score is its expiration timestamp.
+    """
+    return f"sessions:{user_id}"
+
+def revoked_before_key(user_id: int | str) -> str:
+    """
+    Key of the timestamp of the user's last logout-all. Pre-index refresh tokens
+    issued before it are rejected, so logout-all needs no scan for them.
+    """
+    return f"revoked_before:{user_id}"
+
 async def add_refresh_token_to_redis(
-    redis_client: Redis,
+    cache: CacheBackend,
     user_id: int,
     jti: str,
     expires_delta: timedelta
 ):
     """
-    Adds a refresh token's JTI to Redis with an expiration time.
+    Adds a refresh token's JTI to the user's session index.
+    Expired sessions are pruned in the same round trip.
     """
-    await redis_client.set(
-        f"token:{user_id}:{jti}", # Use a unique key
-        "valid",                  # Store a simple value to mark it as valid
-        ex=int(expires_delta.total_seconds()) # Set the expiration time
-    )
+    now = time.time()
+    key = sessions_key(user_id)
+    async with cache.pipeline() as pipe:
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zadd(key, {jti: int(now + expires_delta.total_seconds())})
+        # The newest token always lives the longest, so the index expires together with it
+        pipe.expire(key, int(expires_delta.total_seconds()))
 
 async def remove_refresh_token_from_redis(
-    redis_client: Redis,
+    cache: CacheBackend,
     user_id: int,
     jti: str
 ):
     """
-    Removes a refresh token's JTI from Redis, invalidating it.
+    Removes a refresh token's JTI from the session index, invalidating it.
+    """
+    await cache.zrem(sessions_key(user_id), jti)
+
+async def remove_all_refresh_tokens_from_redis(
+    cache: CacheBackend,
+    user_id: int
+) -> int:
+    """
+    Invalidates every refresh token of the user by dropping the whole session index
+    and recording the time, which revokes the pre-index tokens as well.
+
+    Returns:
+        int: number of sessions in the index that were still active
+    """
+    now = time.time()
+    key = sessions_key(user_id)
+    async with cache.pipeline() as pipe:
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zcard(key)
+        pipe.delete(key)
+        # Outlives every refresh token issued before now
+        pipe.set(revoked_before_key(user_id), now, ex=settings.jwt_refresh_token_expires_days * 86400)
+    _, active, _, _ = pipe.results
+    return active
+
+async def get_active_sessions(
+    cache: CacheBackend,
+    user_id: int
+) -> list[tuple[str, float]]:
+    """
+    Prunes expired sessions and returns the active ones in one round trip.
+
+    Returns:
+        list: (jti, expiration timestamp) pairs ordered by expiration
     """
-    await redis_client.delete(f"token:{user_id}:{jti}")
\ No newline at end of file
+    key = sessions_key(user_id)
+    async with cache.pipeline() as pipe:
+        pipe.zremrangebyscore(key, "-inf", time.time())
+        pipe.zrange(key, 0, -1, withscores=True)
+    _, sessions = pipe.results
+    return sessions
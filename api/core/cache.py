@@ -0,0 +1,786 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import AbstractSet, Any, TypeVar
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from api.core.config import settings
+from api.core.metrics import REDIS_COMMANDS, REDIS_LATENCY
+from api.core.redis_client import close_redis, get_redis
+
+T = TypeVar("T", bound=BaseModel)
+
+# KEYS: buckets that all have to pay for the request (e.g. user and ip)
+# ARGV: capacity, refill rate (tokens per second), cost
+# Returns {1, "0"} if the request is allowed or {0, "<seconds to wait>"}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local levels = {}
+local wait = 0
+
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate))
+end
+return {1, '0'}
+"""
+
+
+class LocalTokenBucket:
+    """
+    In-process token buckets with the same semantics as TOKEN_BUCKET_SCRIPT.
+    Used by the in-memory backend and by the Redis backend when Redis is unavailable:
+    limits are per worker then, but expensive endpoints still cannot starve the DB pool.
+    """
+    max_buckets = 10_000
+
+    def __init__(self):
+        # key -> (tokens, timestamp of last update)
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def consume(
+        self,
+        keys: list[str],
+        capacity: float,
+        rate: float,
+        cost: float = 1
+    ) -> float:
+        """
+        Returns:
+            float: seconds to wait, 0 if the request is allowed
+        """
+        now = time.monotonic()
+        if len(self._buckets) > self.max_buckets:
+            self._evict_full(now, capacity / rate)
+
+        levels = []
+        wait = 0.0
+        for key in keys:
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+            levels.append(tokens)
+            if tokens < cost:
+                wait = max(wait, (cost - tokens) / rate)
+
+        if wait > 0:
+            return wait
+
+        for key, tokens in zip(keys, levels):
+            self._buckets[key] = (tokens - cost, now)
+        return 0.0
+
+    def _evict_full(self, now: float, refill_time: float):
+        # Buckets idle for a full refill period are full again, storing them is pointless
+        self._buckets = {
+            key: (tokens, ts) for key, (tokens, ts) in self._buckets.items()
+            if now - ts < refill_time
+        }
+
+
+def dumps(value: Any) -> str:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    return json.dumps(value, default=str)
+
+def loads(raw: str | None, model: type[T] | None = None) -> Any:
+    if raw is None:
+        return None
+    if model is not None:
+        return model.model_validate_json(raw)
+    return json.loads(raw)
+
+
+class _Constant:
+    """
+    Result of a queued operation that needs no round trip (e.g. mget of no keys)
+    """
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class CachePipeline:
+    """
+    Queues cache operations and executes them in one round trip (atomically on Redis).
+    Results are available in `results` after the block, in the order operations were queued.
+
+    Usage:
+        async with cache.pipeline() as pipe:
+            pipe.get("user:1", UserOut)
+            pipe.delete("user:2")
+        user, deleted = pipe.results
+    """
+
+    def __init__(self, backend: "CacheBackend"):
+        self._backend = backend
+        self._ops: list[tuple[str, tuple]] = []
+        self.results: list[Any] = []
+
+    async def __aenter__(self) -> "CachePipeline":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.results = await self.execute()
+
+    async def execute(self) -> list[Any]:
+        ops, self._ops = self._ops, []
+        return await self._backend._execute(ops) if ops else []
+
+    def _queue(self, op: str, *args) -> "CachePipeline":
+        self._ops.append((op, args))
+        return self
+
+    def get(self, key: str, model: type[T] | None = None):
+        return self._queue("get", key, model)
+
+    def set(self, key: str, value: Any, ex: int | None = None, nx: bool = False):
+        return self._queue("set", key, value, ex, nx)
+
+    def delete(self, *keys: str):
+        return self._queue("delete", *keys)
+
+    def mget(self, keys: list[str], model: type[T] | None = None):
+        return self._queue("mget", keys, model)
+
+    def exists(self, key: str):
+        return self._queue("exists", key)
+
+    def incr(self, key: str):
+        return self._queue("incr", key)
+
+    def expire(self, key: str, seconds: int):
+        return self._queue("expire", key, seconds)
+
+    def zadd(self, key: str, mapping: dict[str, float]):
+        return self._queue("zadd", key, mapping)
+
+    def zrem(self, key: str, *members: str):
+        return self._queue("zrem", key, *members)
+
+    def zscore(self, key: str, member: str):
+        return self._queue("zscore", key, member)
+
+    def zcard(self, key: str):
+        return self._queue("zcard", key)
+
+    def zrange(self, key: str, start: int, end: int, withscores: bool = False):
+        return self._queue("zrange", key, start, end, withscores)
+
+    def zremrangebyscore(self, key: str, min: float | str, max: float | str):
+        return self._queue("zremrangebyscore", key, min, max)
+
+    def zrevrange(self, key: str, start: int, end: int, withscores: bool = False):
+        return self._queue("zrevrange", key, start, end, withscores)
+
+    def zincrby(self, key: str, amount: float, member: str):
+        return self._queue("zincrby", key, amount, member)
+
+    def zmscore(self, key: str, members: list[str]):
+        return self._queue("zmscore", key, members)
+
+    def zrangebylex(self, key: str, min: str, max: str, start: int | None = None, num: int | None = None):
+        return self._queue("zrangebylex", key, min, max, start, num)
+
+    def sadd(self, key: str, *members: str):
+        return self._queue("sadd", key, *members)
+
+    def srem(self, key: str, *members: str):
+        return self._queue("srem", key, *members)
+
+    def smembers(self, key: str):
+        return self._queue("smembers", key)
+
+    def scard(self, key: str):
+        return self._queue("scard", key)
+
+    def smismember(self, key: str, members: list[str]):
+        return self._queue("smismember", key, members)
+
+    def sinterstore(self, dest: str, *keys: str):
+        return self._queue("sinterstore", dest, *keys)
+
+    def sunionstore(self, dest: str, *keys: str):
+        return self._queue("sunionstore", dest, *keys)
+
+    def sdiffstore(self, dest: str, *keys: str):
+        return self._queue("sdiffstore", dest, *keys)
+
+    def sort(self, key: str, desc: bool = False, store: str | None = None):
+        return self._queue("sort", key, desc, store)
+
+    def lrange(self, key: str, start: int, end: int):
+        return self._queue("lrange", key, start, end)
+
+
+class CacheBackend(ABC):
+    """
+    Key-value cache used by the whole API.
+
+    Keys passed in are logical ("user:1"), the backend prefixes them with the namespace.
+    get/set/mget (de)serialize values as JSON, pydantic models are supported via `model`.
+    Set and sorted set members are plain strings.
+    Every operation can be queued into pipeline() to share one round trip with others.
+    """
+
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+
+    def key(self, key: str) -> str:
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    def pipeline(self) -> CachePipeline:
+        return CachePipeline(self)
+
+    async def _single(self, op: str, *args) -> Any:
+        return (await self._execute([(op, args)]))[0]
+
+    async def get(self, key: str, model: type[T] | None = None) -> Any:
+        return await self._single("get", key, model)
+
+    async def set(self, key: str, value: Any, ex: int | None = None, nx: bool = False) -> bool:
+        return await self._single("set", key, value, ex, nx)
+
+    async def delete(self, *keys: str) -> int:
+        return await self._single("delete", *keys)
+
+    async def mget(self, keys: list[str], model: type[T] | None = None) -> list[Any]:
+        return await self._single("mget", keys, model)
+
+    async def exists(self, key: str) -> bool:
+        return await self._single("exists", key)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return await self._single("expire", key, seconds)
+
+    async def incr(self, key: str) -> int:
+        """
+        Adds 1 to the integer at key (0 if missing), get() reads it back as an int
+        """
+        return await self._single("incr", key)
+
+    async def zadd(self, key: str, mapping: dict[str, float]) -> int:
+        return await self._single("zadd", key, mapping)
+
+    async def zrem(self, key: str, *members: str) -> int:
+        return await self._single("zrem", key, *members)
+
+    async def zscore(self, key: str, member: str) -> float | None:
+        return await self._single("zscore", key, member)
+
+    async def zcard(self, key: str) -> int:
+        return await self._single("zcard", key)
+
+    async def zrange(self, key: str, start: int, end: int, withscores: bool = False) -> list:
+        return await self._single("zrange", key, start, end, withscores)
+
+    async def zremrangebyscore(self, key: str, min: float | str, max: float | str) -> int:
+        return await self._single("zremrangebyscore", key, min, max)
+
+    async def zrevrange(self, key: str, start: int, end: int, withscores: bool = False) -> list:
+        return await self._single("zrevrange", key, start, end, withscores)
+
+    async def zincrby(self, key: str, amount: float, member: str) -> float:
+        return await self._single("zincrby", key, amount, member)
+
+    async def zmscore(self, key: str, members: list[str]) -> list[float | None]:
+        return await self._single("zmscore", key, members)
+
+    async def zrangebylex(
+        self,
+        key: str,
+        min: str,
+        max: str,
+        start: int | None = None,
+        num: int | None = None
+    ) -> list[str]:
+        """
+        Members between min and max ("[a" inclusive, "(a" exclusive, "-"/"+" unbounded),
+        the members must all have the same score
+        """
+        return await self._single("zrangebylex", key, min, max, start, num)
+
+    async def sadd(self, key: str, *members: str) -> int:
+        return await self._single("sadd", key, *members)
+
+    async def srem(self, key: str, *members: str) -> int:
+        return await self._single("srem", key, *members)
+
+    async def smembers(self, key: str) -> AbstractSet[str]:
+        return await self._single("smembers", key)
+
+    async def scard(self, key: str) -> int:
+        return await self._single("scard", key)
+
+    async def smismember(self, key: str, members: list[str]) -> list[bool]:
+        return await self._single("smismember", key, members)
+
+    async def sinterstore(self, dest: str, *keys: str) -> int:
+        return await self._single("sinterstore", dest, *keys)
+
+    async def sunionstore(self, dest: str, *keys: str) -> int:
+        return await self._single("sunionstore", dest, *keys)
+
+    async def sdiffstore(self, dest: str, *keys: str) -> int:
+        return await self._single("sdiffstore", dest, *keys)
+
+    async def sort(self, key: str, desc: bool = False, store: str | None = None) -> list[str] | int:
+        """
+        Members of the set or list at key sorted as numbers. Stored as a list at `store`
+        if given (the number of elements is returned then, an empty result deletes it)
+        """
+        return await self._single("sort", key, desc, store)
+
+    async def lrange(self, key: str, start: int, end: int) -> list[str]:
+        return await self._single("lrange", key, start, end)
+
+    @abstractmethod
+    async def _execute(self, ops: list[tuple[str, tuple]]) -> list[Any]:
+        """
+        Executes queued operations in one round trip and returns their results
+        """
+
+    @abstractmethod
+    async def token_bucket(
+        self,
+        keys: list[str],
+        capacity: float,
+        rate: float,
+        cost: float = 1
+    ) -> float:
+        """
+        Atomically takes `cost` tokens from every bucket in keys, or from none of them.
+
+        Returns:
+            float: seconds to wait, 0 if the tokens were taken
+        """
+
+    @abstractmethod
+    async def clear(self):
+        """
+        Drops every key of the namespace
+        """
+
+    async def close(self):
+        pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis implementation, every _execute is one round trip
+    (a MULTI/EXEC transaction when several operations are queued).
+    """
+
+    def __init__(self, client: Redis, namespace: str = ""):
+        super().__init__(namespace)
+        self.client = client
+        self._fallback_bucket = LocalTokenBucket()
+
+    async def _execute(self, ops: list[tuple[str, tuple]]) -> list[Any]:
+        async with self.client.pipeline(transaction=len(ops) > 1) as pipe:
+            decoders = [getattr(self, f"_queue_{op}")(pipe, *args) for op, args in ops]
+            started_at = time.perf_counter()
+            raw = iter(await pipe.execute())
+            self._observe(
+                [op for (op, _), decode in zip(ops, decoders) if not isinstance(decode, _Constant)],
+                time.perf_counter() - started_at
+            )
+        return [
+            decode.value if isinstance(decode, _Constant) else decode(next(raw))
+            for decode in decoders
+        ]
+
+    @staticmethod
+    def _observe(commands: list[str], seconds: float):
+        if not commands:
+            return
+        for command in commands:
+            REDIS_COMMANDS.labels(command).inc()
+        REDIS_LATENCY.labels(commands[0] if len(commands) == 1 else "pipeline").observe(seconds)
+
+    def _queue_get(self, pipe, key, model):
+        pipe.get(self.key(key))
+        return lambda raw: loads(raw, model)
+
+    def _queue_set(self, pipe, key, value, ex, nx):
+        pipe.set(self.key(key), dumps(value), ex=ex, nx=nx)
+        return bool
+
+    def _queue_delete(self, pipe, *keys):
+        if not keys:
+            return _Constant(0)
+        pipe.delete(*map(self.key, keys))
+        return int
+
+    def _queue_mget(self, pipe, keys, model):
+        if not keys:
+            return _Constant([])
+        pipe.mget(list(map(self.key, keys)))
+        return lambda raw: [loads(value, model) for value in raw]
+
+    def _queue_exists(self, pipe, key):
+        pipe.exists(self.key(key))
+        return bool
+
+    def _queue_expire(self, pipe, key, seconds):
+        pipe.expire(self.key(key), seconds)
+        return bool
+
+    def _queue_incr(self, pipe, key):
+        pipe.incr(self.key(key))
+        return int
+
+    def _queue_zadd(self, pipe, key, mapping):
+        pipe.zadd(self.key(key), mapping)
+        return int
+
+    def _queue_zrem(self, pipe, key, *members):
+        if not members:
+            return _Constant(0)
+        pipe.zrem(self.key(key), *members)
+        return int
+
+    def _queue_zscore(self, pipe, key, member):
+        pipe.zscore(self.key(key), member)
+        return lambda raw: raw
+
+    def _queue_zcard(self, pipe, key):
+        pipe.zcard(self.key(key))
+        return int
+
+    def _queue_zrange(self, pipe, key, start, end, withscores):
+        pipe.zrange(self.key(key), start, end, withscores=withscores)
+        return list
+
+    def _queue_zremrangebyscore(self, pipe, key, min, max):
+        pipe.zremrangebyscore(self.key(key), min, max)
+        return int
+
+    def _queue_zrevrange(self, pipe, key, start, end, withscores):
+        pipe.zrevrange(self.key(key), start, end, withscores=withscores)
+        return list
+
+    def _queue_zincrby(self, pipe, key, amount, member):
+        pipe.zincrby(self.key(key), amount, member)
+        return float
+
+    def _queue_zmscore(self, pipe, key, members):
+        if not members:
+            return _Constant([])
+        pipe.zmscore(self.key(key), members)
+        return list
+
+    def _queue_zrangebylex(self, pipe, key, min, max, start, num):
+        pipe.zrangebylex(self.key(key), min, max, start=start, num=num)
+        return list
+
+    def _queue_sadd(self, pipe, key, *members):
+        if not members:
+            return _Constant(0)
+        pipe.sadd(self.key(key), *members)
+        return int
+
+    def _queue_srem(self, pipe, key, *members):
+        if not members:
+            return _Constant(0)
+        pipe.srem(self.key(key), *members)
+        return int
+
+    def _queue_smembers(self, pipe, key):
+        pipe.smembers(self.key(key))
+        return set
+
+    def _queue_scard(self, pipe, key):
+        pipe.scard(self.key(key))
+        return int
+
+    def _queue_smismember(self, pipe, key, members):
+        if not members:
+            return _Constant([])
+        pipe.smismember(self.key(key), members)
+        return lambda raw: [bool(flag) for flag in raw]
+
+    def _queue_sinterstore(self, pipe, dest, *keys):
+        pipe.sinterstore(self.key(dest), list(map(self.key, keys)))
+        return int
+
+    def _queue_sunionstore(self, pipe, dest, *keys):
+        pipe.sunionstore(self.key(dest), list(map(self.key, keys)))
+        return int
+
+    def _queue_sdiffstore(self, pipe, dest, *keys):
+        pipe.sdiffstore(self.key(dest), list(map(self.key, keys)))
+        return int
+
+    def _queue_sort(self, pipe, key, desc, store):
+        pipe.sort(self.key(key), desc=desc, store=self.key(store) if store else None)
+        return int if store else list
+
+    def _queue_lrange(self, pipe, key, start, end):
+        pipe.lrange(self.key(key), start, end)
+        return list
+
+    async def token_bucket(self, keys, capacity, rate, cost=1):
+        keys = [self.key(key) for key in keys]
+        try:
+            script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+            started_at = time.perf_counter()
+            allowed, wait = await script(keys=keys, args=[capacity, rate, cost])
+            self._observe(["token_bucket"], time.perf_counter() - started_at)
+            return 0.0 if allowed else float(wait)
+        except RedisError:
+            return self._fallback_bucket.consume(keys, capacity, rate, cost)
+
+    async def clear(self):
+        self._fallback_bucket = LocalTokenBucket()
+        if not self.namespace:
+            await self.client.flushdb()
+            return
+        batch = []
+        async for key in self.client.scan_iter(match=f"{self.namespace}:*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                await self.client.unlink(*batch)
+                batch.clear()
+        if batch:
+            await self.client.unlink(*batch)
+
+    async def close(self):
+        await close_redis()
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process implementation for single-node deployments and test runs.
+    Values are stored serialized, so callers never share mutable objects.
+    """
+
+    def __init__(self, namespace: str = ""):
+        super().__init__(namespace)
+        # key -> (value, expiration timestamp or None); value is str, a set, a list or a sorted set dict
+        self._data: dict[str, tuple[Any, float | None]] = {}
+        self._bucket = LocalTokenBucket()
+
+    async def _execute(self, ops: list[tuple[str, tuple]]) -> list[Any]:
+        return [getattr(self, f"_op_{op}")(*args) for op, args in ops]
+
+    def _entry(self, key: str) -> Any:
+        key = self.key(key)
+        if (entry := self._data.get(key)) is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _zset(self, key: str, create: bool = False) -> dict[str, float] | None:
+        zset = self._entry(key)
+        if zset is None and create:
+            zset = {}
+            self._data[self.key(key)] = (zset, None)
+        return zset
+
+    def _set(self, key: str, create: bool = False) -> set[str] | None:
+        members = self._entry(key)
+        if members is None and create:
+            members = set()
+            self._data[self.key(key)] = (members, None)
+        return members
+
+    def _op_get(self, key, model):
+        return loads(self._entry(key), model)
+
+    def _op_set(self, key, value, ex, nx):
+        if nx and self._entry(key) is not None:
+            return False
+        expires_at = time.monotonic() + ex if ex else None
+        self._data[self.key(key)] = (dumps(value), expires_at)
+        return True
+
+    def _op_delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._entry(key) is not None:
+                del self._data[self.key(key)]
+                deleted += 1
+        return deleted
+
+    def _op_mget(self, keys, model):
+        return [self._op_get(key, model) for key in keys]
+
+    def _op_exists(self, key):
+        return self._entry(key) is not None
+
+    def _op_expire(self, key, seconds):
+        if (value := self._entry(key)) is None:
+            return False
+        self._data[self.key(key)] = (value, time.monotonic() + seconds)
+        return True
+
+    def _op_incr(self, key):
+        value = (self._op_get(key, None) or 0) + 1
+        expires_at = self._data[self.key(key)][1] if self._entry(key) is not None else None
+        self._data[self.key(key)] = (dumps(value), expires_at)
+        return value
+
+    def _op_zadd(self, key, mapping):
+        zset = self._zset(key, create=True)
+        added = len(mapping.keys() - zset.keys())
+        zset.update({member: float(score) for member, score in mapping.items()})
+        return added
+
+    def _op_zrem(self, key, *members):
+        zset = self._zset(key) or {}
+        removed = sum(zset.pop(member, None) is not None for member in members)
+        if not zset:
+            self._op_delete(key)
+        return removed
+
+    def _op_zscore(self, key, member):
+        return (self._zset(key) or {}).get(member)
+
+    def _op_zcard(self, key):
+        return len(self._zset(key) or {})
+
+    def _op_zrange(self, key, start, end, withscores):
+        items = sorted((self._zset(key) or {}).items(), key=lambda item: (item[1], item[0]))
+        items = items[start:] if end == -1 else items[start:end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def _op_zremrangebyscore(self, key, min, max):
+        zset = self._zset(key) or {}
+        low, high = float(min), float(max)
+        members = [member for member, score in zset.items() if low <= score <= high]
+        return self._op_zrem(key, *members) if members else 0
+
+    def _op_zrevrange(self, key, start, end, withscores):
+        items = sorted((self._zset(key) or {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+        items = items[start:] if end == -1 else items[start:end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def _op_zincrby(self, key, amount, member):
+        zset = self._zset(key, create=True)
+        zset[member] = zset.get(member, 0.0) + float(amount)
+        return zset[member]
+
+    def _op_zmscore(self, key, members):
+        zset = self._zset(key) or {}
+        return [zset.get(member) for member in members]
+
+    def _op_zrangebylex(self, key, min, max, start, num):
+        def above_min(member):
+            return min == "-" or (member >= min[1:] if min[0] == "[" else member > min[1:])
+
+        def below_max(member):
+            return max == "+" or (member <= max[1:] if max[0] == "[" else member < max[1:])
+
+        # Redis compares bytes, UTF-8 keeps the code point order of str comparison
+        members = [member for member in sorted(self._zset(key) or {}) if above_min(member) and below_max(member)]
+        if start is not None:
+            members = members[start:start + num] if num >= 0 else members[start:]
+        return members
+
+    def _op_sadd(self, key, *members):
+        if not members:
+            return 0
+        members_set = self._set(key, create=True)
+        added = len(set(members) - members_set)
+        members_set.update(members)
+        return added
+
+    def _op_srem(self, key, *members):
+        members_set = self._set(key) or set()
+        removed = len(members_set & set(members))
+        members_set.difference_update(members)
+        if not members_set:
+            self._op_delete(key)
+        return removed
+
+    def _op_smembers(self, key):
+        return set(self._set(key) or ())
+
+    def _op_scard(self, key):
+        return len(self._set(key) or ())
+
+    def _op_smismember(self, key, members):
+        members_set = self._set(key) or set()
+        return [member in members_set for member in members]
+
+    def _store_set(self, dest, members: set[str]) -> int:
+        self._op_delete(dest)
+        if members:
+            self._data[self.key(dest)] = (members, None)
+        return len(members)
+
+    def _op_sinterstore(self, dest, *keys):
+        return self._store_set(dest, set.intersection(*(self._op_smembers(key) for key in keys)))
+
+    def _op_sunionstore(self, dest, *keys):
+        return self._store_set(dest, set().union(*(self._op_smembers(key) for key in keys)))
+
+    def _op_sdiffstore(self, dest, first, *keys):
+        return self._store_set(dest, self._op_smembers(first).difference(*(self._op_smembers(key) for key in keys)))
+
+    def _op_sort(self, key, desc, store):
+        members = sorted(self._entry(key) or (), key=float, reverse=desc)
+        if store is None:
+            return members
+        self._op_delete(store)
+        if members:
+            self._data[self.key(store)] = (members, None)
+        return len(members)
+
+    def _op_lrange(self, key, start, end):
+        items = self._entry(key) or []
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def token_bucket(self, keys, capacity, rate, cost=1):
+        return self._bucket.consume([self.key(key) for key in keys], capacity, rate, cost)
+
+    async def clear(self):
+        self._data.clear()
+        self._bucket = LocalTokenBucket()
+
+
+_cache: CacheBackend | None = None
+
+async def init_cache() -> CacheBackend:
+    """
+    Creates the configured backend, called from the app's lifespan
+    """
+    global _cache
+    if _cache is None:
+        if settings.cache_backend == "memory":
+            _cache = MemoryCacheBackend(settings.cache_namespace)
+        else:
+            _cache = RedisCacheBackend(await get_redis(), settings.cache_namespace)
+    return _cache
+
+async def close_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+async def get_cache() -> CacheBackend:
+    return await init_cache()
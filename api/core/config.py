@@ -6,13 +6,83 @@ class Settings(BaseSettings):
     postgres_db: str
     postgres_host: str
     postgres_port: int
+    # Schema for all tables instead of public, the test suite uses one per xdist worker
+    postgres_schema: str | None = None
+    postgres_replica_host: str | None = None
+    postgres_replica_port: int | None = None
     secret_key: str
     algorithm: str = "HS256"
     redis_port: int = 6379
     redis_host: str = "localhost"
+    # "redis" or "memory" (single node and test runs)
+    cache_backend: str = "redis"
+    cache_namespace: str = "notes"
+    # Connection pools
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 100  # asyncpg prepared statements per connection, 0 behind pgbouncer
+    redis_max_connections: int = 20
+    redis_socket_timeout: float | None = 5
+    redis_socket_connect_timeout: float | None = 2
+    # Per-user tag -> notes index in the cache, rebuilt from the database after this long
+    tag_index_ttl: int = 86400
+    # Matches of a tag query are kept this long for the following pages
+    tag_query_result_ttl: int = 60
+    # Notes whose content is rewritten per statement when a tag is renamed or merged
+    tag_rewrite_chunk_size: int = 1000
+    # Hash partitions of notes, cross_links and note_tags by user_id for new schemas, 0 for plain tables.
+    # Migration 0005 converts existing tables when it is set.
+    note_partitions: int = 0
+    # Link graph analytics of a user are cached this long unless the graph changes first
+    analytics_ttl: int = 3600
+    # "sync": notes are parsed before the write responds, "async": by worker tasks from a Redis Stream
+    note_processing_mode: str = "sync"
+    note_workers: int = 2  # worker tasks per process in async mode
+    note_job_max_attempts: int = 5
+    note_job_block_ms: int = 2000  # must stay below redis_socket_timeout
+    note_job_claim_idle_ms: int = 60000  # jobs of a crashed worker are taken over after this long
+    note_job_sweep_seconds: int = 300  # pending notes whose job was lost are enqueued again
+    # GET /notes/{uuid} responses are cached this long unless the user writes first
+    note_cache_ttl: int = 300
+    note_cache_lock_seconds: int = 2  # one process rebuilds a missing entry, the others wait this long at most
+    # Responses of writes sent with an Idempotency-Key are replayed for this long
+    idempotency_ttl: int = 86400
+    idempotency_lock_seconds: int = 60  # in-flight marker of a request that died without releasing it
+    idempotency_wait_seconds: float = 10  # a duplicate waits this long for the first request's response
+    # Rows fetched per round trip from the server-side cursor of NDJSON listings
+    stream_batch_size: int = 500
+    # Reads go to the primary for this long after the user's write (read-your-writes)
+    replica_stickiness_seconds: int = 5
     jwt_refresh_token_expires_days: int = 30 
     jwt_access_token_expires_minutes: int = 30
     debug: bool = False
+    # "development" (one worker with --reload) or "production", see api/server.py
+    app_env: str = "development"
+    web_host: str = "0.0.0.0"
+    web_port: int = 8000
+    web_workers: int | None = None  # number of CPU cores available to the process by default
+    web_keep_alive: int = 5
+    web_backlog: int = 2048
+    web_limit_concurrency: int | None = None  # per worker, further connections get 503
+    web_graceful_timeout: int = 30  # seconds to drain in-flight requests on shutdown
+    # Debug mode: a statement repeated this many times in one request is reported as N+1
+    n_plus_one_threshold: int = 3
+    # Token buckets per route: "<capacity>/<seconds to refill it completely>"
+    rate_limit_enabled: bool = True
+    rate_limits: dict[str, str] = {
+        "auth_login": "10/60",
+        "auth_register": "5/60",
+        "notes_create": "60/60",
+        "notes_update": "120/60",
+        "notes_delete": "30/60",
+    }
+    @property
+    def is_production(self) -> bool:
+        return self.app_env == "production"
+
     @property
     def database_url(self) -> str:
         return (
@@ -20,6 +90,15 @@ class Settings(BaseSettings):
             f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
         )
 
+    @property
+    def replica_database_url(self) -> str | None:
+        if not self.postgres_replica_host:
+            return None
+        return (
+            f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}"
+            f"@{self.postgres_replica_host}:{self.postgres_replica_port or self.postgres_port}/{self.postgres_db}"
+        )
+
     @property
     def redis_url(self) -> str:
         return f"redis://{self.redis_host}:{self.redis_port}/0"
@@ -1,21 +1,219 @@
+import asyncio
+import functools
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from fastapi.routing import APIRoute
+from redis.exceptions import RedisError
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     AsyncSession
 )
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Awaitable, Callable
 from api.core.config import settings
+from api.core.cache import get_cache
+from api.core.metrics import instrument_engine
 from sqlalchemy.orm import DeclarativeBase
 
 class Base(DeclarativeBase):
     pass
 
-async_engine = create_async_engine(settings.database_url)
+def _create_engine(url: str):
+    connect_args = {"prepared_statement_cache_size": settings.db_statement_cache_size}
+    if settings.postgres_schema:
+        connect_args["server_settings"] = {"search_path": settings.postgres_schema}
+    return create_async_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+async_engine = _create_engine(settings.database_url)
 async_session = async_sessionmaker(async_engine, expire_on_commit=False)
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session() as session:
+# Optional read replica, GET endpoints read from it through get_read_session
+replica_engine = _create_engine(settings.replica_database_url) if settings.replica_database_url else None
+replica_session = async_sessionmaker(replica_engine, expire_on_commit=False) if replica_engine else None
+
+# Path of the route being handled, used to attribute connection hold time
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+# Sessions handed out during the current request, released right after the endpoint returns
+_request_sessions: ContextVar[list["LazySession"] | None] = ContextVar("request_sessions", default=None)
+# Set by get_current_user, commits of the request make this user's reads sticky to the primary
+current_user_id: ContextVar[int | None] = ContextVar("current_user_id", default=None)
+
+
+class LazySession:
+    """
+    Proxy for AsyncSession handed out by get_session.
+
+    The AsyncSession is created on first use and a pooled connection is checked out
+    only when the first statement runs, so requests served from Redis never touch the pool.
+    release() closes the session and returns the connection to the pool;
+    using the proxy afterwards transparently starts a new session.
+    """
+
+    def __init__(self, factory: Callable[[], AsyncSession] = async_session):
+        self._factory = factory
+        self._session: AsyncSession | None = None
+        self._after_commit: list[Callable[[], Awaitable]] = []
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self.session, name)
+
+    def after_commit(self, callback: Callable[[], Awaitable]):
+        """
+        Registers a coroutine function to run once the next commit succeeds
+        """
+        self._after_commit.append(callback)
+
+    async def commit(self):
+        await self.session.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        if (user_id := current_user_id.get()) is not None:
+            await mark_primary_sticky(user_id)
+        for callback in callbacks:
+            await callback()
+
+    async def rollback(self):
+        self._after_commit.clear()
+        await self.session.rollback()
+
+    async def release(self):
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+
+async def _lazy_session(factory: Callable[[], AsyncSession]) -> AsyncGenerator[LazySession, None]:
+    session = LazySession(factory)
+    if (sessions := _request_sessions.get()) is not None:
+        sessions.append(session)
+    try:
+        yield session
+    finally:
+        await session.release()
+
+async def get_session() -> AsyncGenerator[LazySession, None]:
+    async for session in _lazy_session(async_session):
+        yield session
+
+
+def sticky_key(user_id: int) -> str:
+    return f"primary:{user_id}"
+
+async def mark_primary_sticky(user_id: int):
+    """
+    Routes the user's reads to the primary for a while, so they see their own writes
+    even if the replica lags behind.
+    """
+    if replica_session is None:
+        return
+    cache = await get_cache()
+    try:
+        await cache.set(sticky_key(user_id), 1, ex=settings.replica_stickiness_seconds)
+    except RedisError:
+        # The write is committed already, a possibly stale read is better than a failed request
+        pass
+
+async def read_session_for(user_id: int) -> AsyncGenerator[LazySession, None]:
+    """
+    Session for read-only endpoints: the replica if it is configured
+    and the user has not written recently, the primary otherwise.
+    """
+    factory = async_session
+    if replica_session is not None:
+        cache = await get_cache()
+        try:
+            if not await cache.exists(sticky_key(user_id)):
+                factory = replica_session
+        except RedisError:
+            pass
+    async for session in _lazy_session(factory):
         yield session
 
 
+def _release_sessions_after(endpoint: Callable) -> Callable:
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            for session in _request_sessions.get() or ():
+                await session.release()
+    return wrapper
+
+
+class SessionReleasingRoute(APIRoute):
+    """
+    Route class that releases the request's sessions as soon as the endpoint returns.
+    Without it the connection is held until dependencies with yield exit,
+    i.e. through the whole response serialization.
+
+    Usage:
+        router = APIRouter(prefix="/notes", route_class=SessionReleasingRoute)
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = _release_sessions_after(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            route_token = current_route.set(self.path)
+            sessions_token = _request_sessions.set([])
+            try:
+                return await handler(request)
+            finally:
+                _request_sessions.reset(sessions_token)
+                current_route.reset(route_token)
+
+        return route_handler
+
+
+@dataclass
+class ConnectionHoldStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+# route path -> how long its requests held pooled connections (per worker)
+connection_hold_stats: defaultdict[str, ConnectionHoldStats] = defaultdict(ConnectionHoldStats)
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out"] = (current_route.get(), time.perf_counter())
+
+def _on_checkin(dbapi_connection, connection_record):
+    if checked_out := connection_record.info.pop("checked_out", None):
+        route, started_at = checked_out
+        connection_hold_stats[route].observe(time.perf_counter() - started_at)
+
+for _engine in filter(None, (async_engine, replica_engine)):
+    event.listen(_engine.sync_engine, "checkout", _on_checkout)
+    event.listen(_engine.sync_engine, "checkin", _on_checkin)
 
+instrument_engine(async_engine, "primary")
+if replica_engine is not None:
+    instrument_engine(replica_engine, "replica")
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Callable
+import jwt
+from fastapi import HTTPException, Request, Response, status
+from redis.exceptions import RedisError
+from api.core.cache import CacheBackend, get_cache
+from api.core.config import settings
+from api.core.db import SessionReleasingRoute
+from api.core.metrics import CACHE_REQUESTS
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# Methods the header applies to, reads are safe to retry anyway
+_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Responses a retry should not get again: the request was not done and may succeed next time
+_NOT_STORED = {
+    status.HTTP_401_UNAUTHORIZED,
+    status.HTTP_408_REQUEST_TIMEOUT,
+    status.HTTP_409_CONFLICT,
+    status.HTTP_429_TOO_MANY_REQUESTS,
+}
+# Response headers replayed along with the body
+_REPLAYED_HEADERS = {"content-type", "location", "x-next-cursor"}
+_POLL_SECONDS = 0.05
+
+
+def _user_id(request: Request) -> int | None:
+    """
+    User of the access token, without a database round trip. The endpoint authenticates
+    the request as usual, this only scopes the keys per user.
+    """
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization.split(" ")[1], settings.secret_key, algorithms=settings.algorithm)
+        return int(payload["user_id"])
+    except (jwt.PyJWTError, KeyError, ValueError):
+        return None
+
+
+class IdempotentRoute(SessionReleasingRoute):
+    """
+    Route class that makes writes sent with an Idempotency-Key header run once.
+
+    The first request claims the key with an in-flight marker and its response is stored
+    in the cache for settings.idempotency_ttl. A retry with the same key gets the stored
+    response (with an Idempotent-Replayed header) without running the endpoint, a retry
+    arriving while the first request runs waits for its response. Keys are per user and
+    bound to the request: reusing one for a different method, path, query string or body is a 422.
+
+    5xx responses, exceptions and the statuses in _NOT_STORED release the key, so the
+    client's next retry runs the endpoint again. If the cache is down requests run as
+    if they had no key.
+
+    Usage:
+        router = APIRouter(prefix="/notes", route_class=IdempotentRoute)
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None or request.method not in _METHODS:
+                return await handler(request)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters"
+                )
+            if (user_id := _user_id(request)) is None:
+                return await handler(request)
+
+            cache = await get_cache()
+            cache_key = f"idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+            fingerprint = hashlib.sha256(
+                f"{request.method} {request.url.path}?{request.url.query}\n".encode() + await request.body()
+            ).hexdigest()
+
+            while True:
+                try:
+                    claimed = await cache.set(
+                        cache_key,
+                        {"fingerprint": fingerprint},
+                        ex=settings.idempotency_lock_seconds,
+                        nx=True
+                    )
+                except RedisError:
+                    return await handler(request)
+                if claimed:
+                    break
+                if (stored := await replay(cache, cache_key, fingerprint)) is not None:
+                    return stored
+                # The first request failed and released the key, this one runs the endpoint
+            CACHE_REQUESTS.labels("idempotency", "miss").inc()
+
+            try:
+                response = await handler(request)
+            except HTTPException as e:
+                await store(cache, cache_key, fingerprint, e.status_code, json.dumps({"detail": e.detail}), {
+                    "content-type": "application/json", **(e.headers or {})
+                })
+                raise
+            except BaseException:
+                await release(cache, cache_key)
+                raise
+
+            body = getattr(response, "body", None)
+            if body is None:
+                # Streamed, nothing to replay
+                await release(cache, cache_key)
+            else:
+                await store(cache, cache_key, fingerprint, response.status_code, body.decode(), response.headers)
+            return response
+
+        return route_handler
+
+
+async def store(
+    cache: CacheBackend,
+    cache_key: str,
+    fingerprint: str,
+    status_code: int,
+    body: str,
+    headers: Any
+):
+    if status_code >= 500 or status_code in _NOT_STORED:
+        await release(cache, cache_key)
+        return
+    try:
+        await cache.set(cache_key, {
+            "fingerprint": fingerprint,
+            "status": status_code,
+            "body": body,
+            "headers": {name: value for name, value in headers.items() if name.lower() in _REPLAYED_HEADERS},
+        }, ex=settings.idempotency_ttl)
+    except RedisError:
+        pass
+
+
+async def release(cache: CacheBackend, cache_key: str):
+    try:
+        await cache.delete(cache_key)
+    except RedisError:
+        # expires after settings.idempotency_lock_seconds
+        pass
+
+
+async def replay(cache: CacheBackend, cache_key: str, fingerprint: str) -> Response | None:
+    """
+    The stored response of the key, waits up to settings.idempotency_wait_seconds
+    while the first request is in flight. None if the key was released meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.idempotency_wait_seconds
+    while True:
+        try:
+            stored = await cache.get(cache_key)
+        except RedisError:
+            return None
+        if stored is None:
+            return None
+        if stored["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+        if "status" in stored:
+            CACHE_REQUESTS.labels("idempotency", "hit").inc()
+            return Response(
+                content=stored["body"],
+                status_code=stored["status"],
+                headers=stored["headers"] | {"Idempotent-Replayed": "true"}
+            )
+        if loop.time() >= deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is in progress",
+                headers={"Retry-After": "1"}
+            )
+        await asyncio.sleep(_POLL_SECONDS)
@@ -0,0 +1,275 @@
+import collections
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from api.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# With several workers every process writes its samples to PROMETHEUS_MULTIPROC_DIR
+# and /metrics merges them, whichever worker serves the scrape.
+# The directory has to be emptied before the workers start (see entrypoint.sh).
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests",
+    ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum"
+)
+
+DB_STATEMENTS = Counter(
+    "db_statements_total",
+    "SQL statements executed",
+    ["route"]
+)
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "SQL statement latency",
+    ["route"]
+)
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    "db_statements_per_request",
+    "SQL statements executed by one request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Time one request spent executing SQL statements",
+    ["route"]
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections checked out from the pool",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections opened above pool_size",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+
+REDIS_COMMANDS = Counter(
+    "redis_commands_total",
+    "Redis commands sent",
+    ["command"]
+)
+REDIS_LATENCY = Histogram(
+    "redis_round_trip_duration_seconds",
+    "Redis round trip latency, a pipeline counts as one round trip",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups, hit ratio = hit / (hit + miss)",
+    ["cache", "result"]
+)
+
+NOTE_JOBS = Counter(
+    "note_jobs_total",
+    "Background note processing jobs by outcome",
+    ["result"]
+)
+NOTE_JOB_LATENCY = Histogram(
+    "note_job_duration_seconds",
+    "Time to parse a note and reconcile its tags, children and links in a worker"
+)
+
+
+TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+@dataclass
+class RequestDbStats:
+    statements: int = 0
+    seconds: float = 0.0
+    # statement text -> executions, parameters are bound separately so equal text means equal shape
+    shapes: collections.Counter[str] = field(default_factory=collections.Counter)
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        """
+        Statements executed at least threshold times, the usual sign of an N+1 loop
+        """
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+# SQL statements of the request being handled, filled by engine events
+_request_db_stats: ContextVar[RequestDbStats | None] = ContextVar("request_db_stats", default=None)
+
+
+def _route_label(scope) -> str:
+    # The route template instead of the raw path keeps the label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and SQL statements of every request.
+    Pure ASGI instead of BaseHTTPMiddleware, so the endpoint runs in the middleware's context
+    and the engine events see the request's RequestDbStats.
+
+    In debug mode the statement counts are also returned as response headers
+    (X-DB-Statements, X-DB-Time-Ms, X-DB-Repeated-Statements) and repeated statements are logged.
+    Streamed responses get no headers, the counts would miss the statements run while streaming,
+    their totals are logged when the stream ends.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        stats = RequestDbStats()
+        start_message = None
+        streamed = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, start_message, streamed
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.debug:
+                    # Held back until the first body message tells whether the response is streamed:
+                    # a stream runs its statements after the headers, its totals are logged instead
+                    start_message = message
+                    return
+            elif start_message is not None:
+                streamed = message.get("more_body", False)
+                if not streamed:
+                    start_message["headers"] = [*start_message.get("headers", []), *_debug_headers(stats)]
+                await send(start_message)
+                start_message = None
+            await send(message)
+
+        token = _request_db_stats.set(stats)
+        REQUESTS_IN_PROGRESS.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            REQUESTS_IN_PROGRESS.dec()
+            _request_db_stats.reset(token)
+
+            route = _route_label(scope)
+            REQUESTS.labels(scope["method"], route, status_code).inc()
+            REQUEST_LATENCY.labels(scope["method"], route).observe(elapsed)
+            DB_STATEMENTS_PER_REQUEST.labels(route).observe(stats.statements)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+            if settings.debug and streamed:
+                logger.info(
+                    "Streamed %s %s: %d SQL statements, %.3f ms",
+                    scope["method"], route, stats.statements, stats.seconds * 1000
+                )
+            if settings.debug and (repeated := stats.repeated(settings.n_plus_one_threshold)):
+                for shape, count in repeated.items():
+                    logger.warning("Possible N+1 in %s %s: %d x %s", scope["method"], route, count, shape)
+
+
+def _debug_headers(stats: RequestDbStats) -> list[tuple[bytes, bytes]]:
+    repeated = stats.repeated(settings.n_plus_one_threshold)
+    return [
+        (b"x-db-statements", str(stats.statements).encode()),
+        (b"x-db-time-ms", f"{stats.seconds * 1000:.3f}".encode()),
+        (b"x-db-repeated-statements", str(sum(repeated.values())).encode()),
+    ]
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    """
+    Registers engine events counting statements and tracking the pool usage.
+
+    Args:
+        engine (AsyncEngine): engine to instrument
+        name (str): value of the "engine" label, e.g. "primary" or "replica"
+    """
+    # Imported here to avoid a cycle, db.py instruments its engines at import time
+    from api.core.db import current_route
+
+    sync_engine = engine.sync_engine
+    pool = sync_engine.pool
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        # Transaction control is not counted, BEGIN and COMMIT never reach the cursor either
+        if statement.startswith(TRANSACTION_CONTROL):
+            return
+        route = current_route.get()
+        DB_STATEMENTS.labels(route).inc()
+        DB_STATEMENT_LATENCY.labels(route).observe(elapsed)
+        if (stats := _request_db_stats.get()) is not None:
+            stats.statements += 1
+            stats.seconds += elapsed
+            stats.shapes[statement] += 1
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        DB_POOL_OVERFLOW.labels(name).set(max(0, pool.overflow()))
+
+    def on_checkin(dbapi_connection, connection_record):
+        # The event fires before the pool takes the connection back
+        overflow = pool.overflow()
+        if pool.checkedin() >= pool.size():
+            overflow -= 1  # the queue is full, the returned connection is closed
+        DB_POOL_CHECKED_OUT.labels(name).set(max(0, pool.checkedout() - 1))
+        DB_POOL_OVERFLOW.labels(name).set(max(0, overflow))
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "checkout", on_checkout)
+    event.listen(sync_engine, "checkin", on_checkin)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Returns:
+        tuple[bytes, str]: metrics in Prometheus text format and its content type
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    """
+    Drops the live gauges of this worker, called on shutdown
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,7 +1,8 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import DDL, Column, DateTime, ForeignKey, ForeignKeyConstraint, Index, Integer, String, Text, UniqueConstraint, event, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from api.core.config import settings
 from api.core.db import Base
 from sqlalchemy import Table
 from uuid import UUID as PYUUID
@@ -19,55 +20,116 @@ class User(Base):
     notes: Mapped[list["Note"]] = relationship("Note", back_populates="user", cascade="all, delete-orphan")
     tags: Mapped[list["Tag"]] = relationship("Tag", back_populates="user", cascade="all, delete-orphan")
 
+def _partitioning() -> dict:
+    """
+    Options of the tables holding notes and their links and tags: hash partitioned by user_id
+    when settings.note_partitions is set. Every query filters on the user, so it reads one
+    partition. Primary keys, unique constraints and foreign keys between these tables
+    include user_id either way, as Postgres requires for partitioned tables.
+    """
+    return {"postgresql_partition_by": "HASH (user_id)"} if settings.note_partitions else {}
+
+
 class CrossLink(Base):
     __tablename__ = "cross_links"
+    __table_args__ = (
+        ForeignKeyConstraint(["note_id", "user_id"], ["notes.id", "notes.user_id"], ondelete="CASCADE"),
+        ForeignKeyConstraint(["linked_note_id", "user_id"], ["notes.id", "notes.user_id"], ondelete="CASCADE"),
+        Index("ix_cross_links_note_id", "note_id"),
+        Index("ix_cross_links_linked_note_id_id", "linked_note_id", "id"),  # backlink pages and deletes
+        _partitioning(),
+    )
     
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # User of both notes, links never cross users
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String(100), nullable=False) 
+    # Where the link is in the content of the linking note and the text around it, see NoteParser.parse_links
+    offset_start: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    offset_end: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    snippet: Mapped[str | None] = mapped_column(String(300), nullable=True)
     
-    note_id: Mapped[int] = mapped_column(ForeignKey("notes.id", ondelete="CASCADE"), nullable=False)
-    linked_note_id: Mapped[int] = mapped_column(ForeignKey("notes.id", ondelete="CASCADE"), nullable=False)
+    note_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    linked_note_id: Mapped[int] = mapped_column(Integer, nullable=False)
     
-    note: Mapped["Note"] = relationship("Note", foreign_keys=[note_id], back_populates="linked_notes")
-    linked_note: Mapped["Note"] = relationship("Note", foreign_keys=[linked_note_id], back_populates="backlinks")
+    # The joins compare user_id too, so they read a single partition; only the note ids are
+    # written through the relationships, user_id is set explicitly (overlapping foreign keys)
+    note: Mapped["Note"] = relationship(
+        "Note",
+        primaryjoin="and_(foreign(CrossLink.note_id) == Note.id, CrossLink.user_id == Note.user_id)",
+        back_populates="linked_notes"
+    )
+    linked_note: Mapped["Note"] = relationship(
+        "Note",
+        primaryjoin="and_(foreign(CrossLink.linked_note_id) == Note.id, CrossLink.user_id == Note.user_id)",
+        back_populates="backlinks"
+    )
 
 class Note(Base):
     __tablename__ = "notes"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    __table_args__ = (
+        UniqueConstraint("user_id", "uuid", name="uq_notes_user_uuid"),
+        ForeignKeyConstraint(["parent_id", "user_id"], ["notes.id", "notes.user_id"], ondelete="CASCADE"),
+        Index("ix_notes_user_parent_title", "user_id", "parent_id", "title"),  # title uniqueness per folder
+        Index("ix_notes_user_parent_updated", "user_id", "parent_id", "updated_at"),  # folder listing
+        Index("ix_notes_user_title", "user_id", "title"),  # child title deduplication
+        Index("ix_notes_parent_id", "parent_id"),  # children lookups and cascades
+        Index(
+            "ix_notes_processing_pending", "id",
+            postgresql_where=text("processing_state <> 'done'")
+        ),  # sweep of notes waiting for a worker
+        _partitioning(),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     uuid: Mapped[PYUUID] = mapped_column(  
         PG_UUID(as_uuid=True),
         default=uuid4,
-        unique=True,
         nullable=False,
     )
     title: Mapped[str] = mapped_column(String(100), nullable=False) 
     content: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # "pending" while a worker has to parse the content (async processing), "done" or "failed" after
+    processing_state: Mapped[str] = mapped_column(String(16), nullable=False, default="done", server_default="done")
+    # sha256 of the content the tags, children and links were last reconciled with
+    processed_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
     
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Part of the primary key: the partition key of partitioned tables has to be
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     user: Mapped["User"] = relationship("User", back_populates="notes")
     
-    parent_id: Mapped[int] = mapped_column(ForeignKey("notes.id", ondelete="CASCADE"), nullable=True)
-    parent: Mapped["Note"] = relationship("Note", remote_side=[id], back_populates="children")
-    children: Mapped[list["Note"]] = relationship("Note", back_populates="parent", cascade="all, delete-orphan")
+    parent_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    parent: Mapped["Note"] = relationship(
+        "Note",
+        primaryjoin="and_(foreign(Note.parent_id) == remote(Note.id), Note.user_id == remote(Note.user_id))",
+        back_populates="children"
+    )
+    children: Mapped[list["Note"]] = relationship(
+        "Note",
+        primaryjoin="and_(remote(foreign(Note.parent_id)) == Note.id, remote(Note.user_id) == Note.user_id)",
+        back_populates="parent",
+        cascade="all, delete-orphan"
+    )
     
     tags: Mapped[list["Tag"]] = relationship(
         "Tag",
         secondary="note_tags",
+        primaryjoin="and_(Note.id == note_tags.c.note_id, Note.user_id == note_tags.c.user_id)",
+        secondaryjoin="Tag.id == note_tags.c.tag_id",
         back_populates="notes"
     )
     
     linked_notes: Mapped[list["CrossLink"]] = relationship(
         "CrossLink",
-        foreign_keys="[CrossLink.note_id]",
+        primaryjoin="and_(foreign(CrossLink.note_id) == Note.id, CrossLink.user_id == Note.user_id)",
         back_populates="note",
         cascade="all, delete-orphan"
     )
     
     backlinks: Mapped[list["CrossLink"]] = relationship(
         "CrossLink",
-        foreign_keys="[CrossLink.linked_note_id]",
+        primaryjoin="and_(foreign(CrossLink.linked_note_id) == Note.id, CrossLink.user_id == Note.user_id)",
         back_populates="linked_note",
         cascade="all, delete-orphan"
     )
@@ -93,12 +155,26 @@ class Tag(Base):
     notes: Mapped[list["Note"]] = relationship(
         "Note",
         secondary="note_tags",
+        primaryjoin="Tag.id == note_tags.c.tag_id",
+        secondaryjoin="and_(Note.id == note_tags.c.note_id, Note.user_id == note_tags.c.user_id)",
         back_populates="tags"
     )
 
 note_tags = Table(
     "note_tags",
     Base.metadata,
-    Column("note_id", ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True),
+    Column("note_id", Integer, primary_key=True),
     Column("tag_id", ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
-)
\ No newline at end of file
+    Column("user_id", Integer, primary_key=True),
+    ForeignKeyConstraint(["note_id", "user_id"], ["notes.id", "notes.user_id"], ondelete="CASCADE"),
+    Index("ix_note_tags_tag_id", "tag_id", "note_id"),  # notes of a tag
+    **_partitioning(),
+)
+
+if settings.note_partitions:
+    for table in (Note.__table__, CrossLink.__table__, note_tags):
+        for remainder in range(settings.note_partitions):
+            event.listen(table, "after_create", DDL(
+                f"CREATE TABLE {table.name}_p{remainder} PARTITION OF {table.name} "
+                f"FOR VALUES WITH (MODULUS {settings.note_partitions}, REMAINDER {remainder})"
+            ))
\ No newline at end of file
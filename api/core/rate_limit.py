@@ -0,0 +1,73 @@
+import math
+from fastapi import Depends, HTTPException, Request, status
+from api.auth.schemas import UserOut
+from api.auth.services.auth_service import get_current_user
+from api.core.config import settings
+from api.core.cache import CacheBackend, get_cache
+
+
+def parse_rate_limit(value: str) -> tuple[float, float]:
+    """
+    Parses "<capacity>/<seconds>" into (capacity, refill rate in tokens per second)
+    """
+    capacity, seconds = value.split("/")
+    return float(capacity), float(capacity) / float(seconds)
+
+
+class RateLimiter:
+    """
+    Dependency limiting a route with a token bucket per client IP.
+    The limit is looked up in settings.rate_limits by name, routes without a limit are not limited.
+
+    Usage:
+        @router.post("/login", dependencies=[Depends(RateLimiter("auth_login"))])
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def __call__(
+        self,
+        request: Request,
+        cache: CacheBackend = Depends(get_cache)
+    ):
+        await self.hit(cache, [self.ip_key(request)])
+
+    def ip_key(self, request: Request) -> str:
+        host = request.client.host if request.client else "unknown"
+        return f"ratelimit:{self.name}:ip:{host}"
+
+    async def hit(self, cache: CacheBackend, keys: list[str]):
+        """
+        Takes a token from every bucket in keys or raises 429 with Retry-After header
+        """
+        limit = settings.rate_limits.get(self.name)
+        if not settings.rate_limit_enabled or limit is None:
+            return
+
+        capacity, rate = parse_rate_limit(limit)
+        wait = await cache.token_bucket(keys, capacity, rate)
+
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+
+
+class UserRateLimiter(RateLimiter):
+    """
+    Same as RateLimiter, but the request has to pay both to the user's and to the IP's bucket.
+    """
+
+    async def __call__(
+        self,
+        request: Request,
+        user: UserOut = Depends(get_current_user),
+        cache: CacheBackend = Depends(get_cache)
+    ):
+        await self.hit(
+            cache,
+            [f"ratelimit:{self.name}:user:{user.id}", self.ip_key(request)]
+        )
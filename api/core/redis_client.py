@@ -1,20 +1,40 @@
-from typing import AsyncGenerator
 from redis.asyncio import Redis, ConnectionPool
 from api.core.config import settings
 
 _redis_pool: ConnectionPool | None = None
+_redis: Redis | None = None
 
 async def get_redis_pool() -> ConnectionPool:
     global _redis_pool
     if _redis_pool is None:
         _redis_pool = ConnectionPool.from_url(
             settings.redis_url,
-            max_connections=20,  
+            max_connections=settings.redis_max_connections,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_connect_timeout=settings.redis_socket_connect_timeout,
             decode_responses=True
         )
     return _redis_pool
 
 
 async def get_redis() -> Redis:
-    return await Redis(connection_pool= await get_redis_pool())
+    """
+    Returns the shared client, created on first use (normally in the app's lifespan)
+    """
+    global _redis
+    if _redis is None:
+        _redis = Redis(connection_pool=await get_redis_pool())
+    return _redis
 
+
+async def close_redis():
+    """
+    Closes the shared client and disconnects the pool, called on shutdown
+    """
+    global _redis, _redis_pool
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+    if _redis_pool is not None:
+        await _redis_pool.aclose()
+        _redis_pool = None
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Abandoned(Exception):
+    """
+    The caller running the function was cancelled, a waiting caller takes over
+    """
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key in this process: the first caller
+    runs the function, callers arriving while it runs get its result (or exception).
+    Nothing is kept once the call finishes.
+
+    Usage:
+        notes = SingleFlight()
+        note = await notes.do((user_id, note_uuid), load_note)
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while (call := self._calls.get(key)) is not None:
+            try:
+                # shielded: a waiter that is cancelled must not cancel the shared call
+                return await asyncio.shield(call)
+            except _Abandoned:
+                continue
+
+        call = asyncio.get_running_loop().create_future()
+        self._calls[key] = call
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.set_exception(_Abandoned())
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+            # Marks an exception as retrieved, asyncio logs it otherwise if no caller waited
+            call.exception()
@@ -0,0 +1,62 @@
+from typing import AsyncIterator, Callable
+from fastapi import Request
+from pydantic import BaseModel
+from sqlalchemy import Row, Select
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from api.core.config import settings
+from api.core.db import LazySession, current_route
+
+NDJSON = "application/x-ndjson"
+# For the responses= of endpoints that can stream, documents the media type in OpenAPI
+NDJSON_RESPONSES = {200: {"content": {NDJSON: {}}}}
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+class NDJSONResponse(StreamingResponse):
+    media_type = NDJSON
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Starlette stops iterating when the client disconnects but leaves the generator open,
+            # closing it runs its cleanup (releasing the connection) right away
+            await self.body_iterator.aclose()
+
+
+def stream_rows(
+    db: LazySession,
+    statement: Select,
+    serialize: Callable[[Row], BaseModel]
+) -> NDJSONResponse:
+    """
+    Streams the rows of statement as NDJSON, one serialize(row) document per line.
+
+    The rows are read from a server-side cursor settings.stream_batch_size at a time and
+    each batch is written out before the next is fetched, so memory stays constant however
+    many rows there are. The request's session is released when the endpoint returns,
+    the stream checks out a connection of its own and returns it when it ends, fails or
+    the client disconnects.
+
+    Usage:
+        if wants_ndjson(request):
+            return stream_rows(db, select(Note), lambda row: NoteShallowRead.model_validate(row.Note))
+    """
+    route = current_route.get()
+
+    async def lines() -> AsyncIterator[str]:
+        # The response is sent after the route handler reset it, connection hold stats need it.
+        # Not reset: the generator may be closed from another task's context.
+        current_route.set(route)
+        try:
+            result = await db.stream(statement.execution_options(yield_per=settings.stream_batch_size))
+            async for rows in result.partitions():
+                yield "".join(serialize(row).model_dump_json() + "\n" for row in rows)
+        finally:
+            await db.release()
+
+    return NDJSONResponse(lines())
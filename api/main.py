@@ -1,37 +1,81 @@
-from fastapi import FastAPI, status
+from fastapi import Depends, FastAPI, Response, status
 from contextlib import asynccontextmanager
-from api.core.db import Base, async_engine
+from api.core.config import settings
+from api.core.db import Base, async_engine, connection_hold_stats, replica_engine
+from api.notes.jobs import NoteWorkerPool, get_note_job_queue
 from api.notes.router import router as notes_router
 from api.tags.router import router as tags_router
 from api.auth.router import router as auth_router
+from api.core.cache import CacheBackend, close_cache, get_cache, init_cache
+from api.core.metrics import MetricsMiddleware, mark_worker_dead, render_metrics
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # The schema is managed by migrations: alembic -c api/alembic.ini upgrade head
+    await init_cache()
+    workers = None
+    if settings.note_processing_mode == "async":
+        workers = NoteWorkerPool(await get_note_job_queue())
+        workers.start()
     yield
+    # uvicorn runs this after in-flight requests are drained
+    if workers is not None:
+        await workers.stop()
+    await close_cache()
+    await async_engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+    mark_worker_dead()
 
 app = FastAPI(
     title="Docker API",
     version="1.0.0",
     lifespan=lifespan,
-    debug=True
+    debug=settings.debug
 )
 
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/health", status_code=status.HTTP_200_OK)
 async def health_check():
     return {"status": "ok"}
 
-@app.post('/flush-db', status_code=status.HTTP_200_OK)
-async def flush_db():
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
     """
-    WARNING: This endpoint will drop and recreate all database tables.
-    Use with caution, primarily for testing or development purposes.
+    Prometheus metrics, aggregated over all workers when PROMETHEUS_MULTIPROC_DIR is set
     """
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
-    return {"status": "Database flushed and reset."}
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Unauthenticated, flush_db wipes the database and the cache: development and test runs only
+if not settings.is_production:
+    @app.get("/debug/db-connections", status_code=status.HTTP_200_OK)
+    async def db_connections():
+        """
+        How long requests of each route held pooled connections (this worker only)
+        """
+        return {
+            route: {
+                "count": stats.count,
+                "avg_ms": round(stats.total_seconds / stats.count * 1000, 3),
+                "max_ms": round(stats.max_seconds * 1000, 3),
+                "total_ms": round(stats.total_seconds * 1000, 3),
+            } for route, stats in connection_hold_stats.items()
+        }
+
+    @app.post('/flush-db', status_code=status.HTTP_200_OK)
+    async def flush_db(cache: CacheBackend = Depends(get_cache)):
+        """
+        WARNING: This endpoint will drop and recreate all database tables
+        and clear the cache (sessions and cached users refer to the dropped ids).
+        Use with caution, primarily for testing or development purposes.
+        """
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        await cache.clear()
+        return {"status": "Database flushed and reset."}
 
 app.include_router(notes_router)
 app.include_router(tags_router)
@@ -0,0 +1,43 @@
+"""secondary indexes for the hot queries of routers and services
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 12:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns), kept in sync with __table_args__ in api/core/models.py
+INDEXES = [
+    ("ix_notes_user_parent_title", "notes", ["user_id", "parent_id", "title"]),
+    ("ix_notes_user_parent_updated", "notes", ["user_id", "parent_id", "updated_at"]),
+    ("ix_notes_user_title", "notes", ["user_id", "title"]),
+    ("ix_notes_parent_id", "notes", ["parent_id"]),
+    ("ix_cross_links_note_id", "cross_links", ["note_id"]),
+    ("ix_cross_links_linked_note_id", "cross_links", ["linked_note_id"]),
+    ("ix_note_tags_tag_id", "note_tags", ["tag_id", "note_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY cannot run inside a transaction, but keeps big tables writable meanwhile
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,55 @@
+"""link offsets and snippets on cross_links, keyset index for backlink pages
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 18:40:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable columns without defaults, adding them does not rewrite the table.
+    # Existing links get their snippets when the linking note's content is next updated.
+    op.add_column("cross_links", sa.Column("offset_start", sa.Integer(), nullable=True))
+    op.add_column("cross_links", sa.Column("offset_end", sa.Integer(), nullable=True))
+    op.add_column("cross_links", sa.Column("snippet", sa.String(300), nullable=True))
+
+    # The new index covers everything the old one served, it is built before the old one goes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_cross_links_linked_note_id_id", "cross_links", ["linked_note_id", "id"],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index(
+            "ix_cross_links_linked_note_id", table_name="cross_links",
+            postgresql_concurrently=True, if_exists=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_cross_links_linked_note_id", "cross_links", ["linked_note_id"],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index(
+            "ix_cross_links_linked_note_id_id", table_name="cross_links",
+            postgresql_concurrently=True, if_exists=True
+        )
+
+    op.drop_column("cross_links", "snippet")
+    op.drop_column("cross_links", "offset_end")
+    op.drop_column("cross_links", "offset_start")
@@ -0,0 +1,47 @@
+"""processing state of notes for background parsing
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 21:15:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant default is stored in the catalog, existing rows are not rewritten
+    op.add_column(
+        "notes",
+        sa.Column("processing_state", sa.String(16), nullable=False, server_default="done")
+    )
+    op.add_column("notes", sa.Column("processed_hash", sa.String(64), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notes_processing_pending", "notes", ["id"],
+            postgresql_where=sa.text("processing_state <> 'done'"),
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_notes_processing_pending", table_name="notes",
+            postgresql_concurrently=True, if_exists=True
+        )
+
+    op.drop_column("notes", "processed_hash")
+    op.drop_column("notes", "processing_state")
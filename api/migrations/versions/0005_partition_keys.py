@@ -0,0 +1,153 @@
+"""user_id in the keys of notes, cross_links and note_tags, optional hash partitioning by user_id
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-20 10:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from api.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ["notes", "cross_links", "note_tags"]
+
+# Foreign keys to notes(id), replaced by ones to notes(id, user_id)
+OLD_FOREIGN_KEYS = [
+    ("notes_parent_id_fkey", "notes", "parent_id"),
+    ("cross_links_note_id_fkey", "cross_links", "note_id"),
+    ("cross_links_linked_note_id_fkey", "cross_links", "linked_note_id"),
+    ("note_tags_note_id_fkey", "note_tags", "note_id"),
+]
+FOREIGN_KEYS = [
+    ("notes_parent_id_user_id_fkey", "notes", "parent_id"),
+    ("cross_links_note_id_user_id_fkey", "cross_links", "note_id"),
+    ("cross_links_linked_note_id_user_id_fkey", "cross_links", "linked_note_id"),
+    ("note_tags_note_id_user_id_fkey", "note_tags", "note_id"),
+]
+PRIMARY_KEYS = {
+    "notes": (["id"], ["id", "user_id"]),
+    "cross_links": (["id"], ["id", "user_id"]),
+    "note_tags": (["note_id", "tag_id"], ["note_id", "tag_id", "user_id"]),
+}
+# Everything else a rebuilt table needs, as of this revision
+INDEXES = [
+    ("ix_notes_user_parent_title", "notes", ["user_id", "parent_id", "title"], None),
+    ("ix_notes_user_parent_updated", "notes", ["user_id", "parent_id", "updated_at"], None),
+    ("ix_notes_user_title", "notes", ["user_id", "title"], None),
+    ("ix_notes_parent_id", "notes", ["parent_id"], None),
+    ("ix_notes_processing_pending", "notes", ["id"], "processing_state <> 'done'"),
+    ("ix_cross_links_note_id", "cross_links", ["note_id"], None),
+    ("ix_cross_links_linked_note_id_id", "cross_links", ["linked_note_id", "id"], None),
+    ("ix_note_tags_tag_id", "note_tags", ["tag_id", "note_id"], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ("cross_links", "note_tags"):
+        op.add_column(table, sa.Column("user_id", sa.Integer(), nullable=True))
+        op.execute(f"UPDATE {table} SET user_id = notes.user_id FROM notes WHERE notes.id = {table}.note_id")
+        op.alter_column(table, "user_id", nullable=False)
+
+    # The new keys are built without blocking writes, the swap below only takes short locks
+    with op.get_context().autocommit_block():
+        for table, (_, columns) in PRIMARY_KEYS.items():
+            op.create_index(
+                f"{table}_pkey_new", table, columns, unique=True,
+                postgresql_concurrently=True, if_not_exists=True
+            )
+        op.create_index(
+            "uq_notes_user_uuid", "notes", ["user_id", "uuid"], unique=True,
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+    for name, table, _ in OLD_FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+    for table in PRIMARY_KEYS:
+        op.drop_constraint(f"{table}_pkey", table, type_="primary")
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_pkey_new")
+    op.drop_constraint("notes_uuid_key", "notes", type_="unique")
+    op.execute("ALTER TABLE notes ADD CONSTRAINT uq_notes_user_uuid UNIQUE USING INDEX uq_notes_user_uuid")
+
+    # NOT VALID skips the check of existing rows under the exclusive lock, VALIDATE checks them without it
+    for name, table, column in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}, user_id) "
+            f"REFERENCES notes (id, user_id) ON DELETE CASCADE NOT VALID"
+        )
+    for name, table, _ in FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+
+    if settings.note_partitions:
+        # Copies every row under an exclusive lock: plan a maintenance window for big tables
+        _rebuild(settings.note_partitions)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _is_partitioned():
+        _rebuild(0)
+
+    for name, table, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+    op.drop_constraint("uq_notes_user_uuid", "notes", type_="unique")
+    op.create_unique_constraint("notes_uuid_key", "notes", ["uuid"])
+    for table, (columns, _) in PRIMARY_KEYS.items():
+        op.drop_constraint(f"{table}_pkey", table, type_="primary")
+        op.create_primary_key(f"{table}_pkey", table, columns)
+    for name, table, column in OLD_FOREIGN_KEYS:
+        op.create_foreign_key(name, table, "notes", [column], ["id"], ondelete="CASCADE")
+
+    op.drop_column("note_tags", "user_id")
+    op.drop_column("cross_links", "user_id")
+
+
+def _is_partitioned() -> bool:
+    return op.get_bind().scalar(sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'notes'::regclass"))
+
+
+def _rebuild(partitions: int):
+    """
+    Recreates the three tables with the same columns and keys, hash partitioned by user_id
+    if partitions > 0 and plain otherwise, and copies the rows over
+    """
+    for table in TABLES:
+        partition_by = " PARTITION BY HASH (user_id)" if partitions else ""
+        op.execute(f"CREATE TABLE {table}_rebuilt (LIKE {table} INCLUDING DEFAULTS){partition_by}")
+        for remainder in range(partitions):
+            op.execute(
+                f"CREATE TABLE {table}_p{remainder} PARTITION OF {table}_rebuilt "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+            )
+        op.execute(f"INSERT INTO {table}_rebuilt SELECT * FROM {table}")
+
+    # The serial sequences would be dropped with the old tables
+    op.execute("ALTER SEQUENCE notes_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE cross_links_id_seq OWNED BY NONE")
+    for table in reversed(TABLES):
+        op.execute(f"DROP TABLE {table}")
+    for table in TABLES:
+        op.execute(f"ALTER TABLE {table}_rebuilt RENAME TO {table}")
+    op.execute("ALTER SEQUENCE notes_id_seq OWNED BY notes.id")
+    op.execute("ALTER SEQUENCE cross_links_id_seq OWNED BY cross_links.id")
+
+    for table, (_, columns) in PRIMARY_KEYS.items():
+        op.create_primary_key(f"{table}_pkey", table, columns)
+    op.create_unique_constraint("uq_notes_user_uuid", "notes", ["user_id", "uuid"])
+    op.create_foreign_key("notes_user_id_fkey", "notes", "users", ["user_id"], ["id"], ondelete="CASCADE")
+    op.create_foreign_key("note_tags_tag_id_fkey", "note_tags", "tags", ["tag_id"], ["id"], ondelete="CASCADE")
+    for name, table, column in FOREIGN_KEYS:
+        op.create_foreign_key(name, table, "notes", [column, "user_id"], ["id", "user_id"], ondelete="CASCADE")
+    for name, table, columns, where in INDEXES:
+        op.create_index(name, table, columns, postgresql_where=sa.text(where) if where else None)
@@ -0,0 +1,225 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any
+from uuid import UUID
+import numpy as np
+from redis.exceptions import RedisError
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.cache import CacheBackend, get_cache
+from api.core.config import settings
+from api.core.models import CrossLink, Note
+
+# Rows per partition of the streaming queries
+_STREAM_BATCH = 10_000
+# Longest list kept per metric, the summary has the full counts
+MAX_ITEMS = 1000
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-6
+PAGERANK_MAX_ITERATIONS = 100
+
+# [Title](uuid) links in content whose uuid is not a note of the user. Same pattern as
+# NoteParser.parse_links, run by Postgres so only the dangling links leave the database.
+# Targets are reduced to their hex digits like uuid.UUID does, see NoteService._handle_links,
+# targets that are no uuid ([site](https://...)) are not links to notes.
+DANGLING_LINKS = text(r"""
+    SELECT n.id, btrim(m[1]) AS title, btrim(m[2]) AS target
+    FROM notes n
+    CROSS JOIN LATERAL regexp_matches(n.content, '\[([^\]]+)\]\(([^)]+)\)', 'g') AS m
+    CROSS JOIN LATERAL regexp_replace(btrim(m[2]), 'urn:|uuid:|[{}-]', '', 'g') AS hex
+    WHERE n.user_id = :user_id
+      AND hex ~* '^[0-9a-f]{32}$'
+      AND NOT EXISTS (
+          SELECT 1 FROM notes t
+          WHERE t.user_id = :user_id
+            -- the CASE keeps the cast from running before the pattern check
+            AND t.uuid = CASE WHEN hex ~* '^[0-9a-f]{32}$' THEN hex::uuid END
+      )
+    ORDER BY n.id
+""")
+
+
+@dataclass
+class LinkGraph:
+    """
+    The notes of a user as nodes 0..n-1 in id order, links as parallel arrays of node indexes
+    """
+    ids: np.ndarray  # note id of every node, sorted
+    uuids: list[UUID]
+    titles: list[str]
+    parents: np.ndarray  # node index of the parent, -1 for root notes
+    sources: np.ndarray  # linking node of every link
+    targets: np.ndarray  # linked node of every link
+    dangling: list[tuple[int, str, str]]  # (note id, link title, target as written)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def note(self, node: int) -> dict[str, Any]:
+        return {"uuid": str(self.uuids[node]), "title": self.titles[node]}
+
+
+async def load_graph(db: AsyncSession, user_id: int) -> LinkGraph:
+    """
+    Streams the user's notes, links and dangling links in batches, no ORM objects are built
+    """
+    ids, uuids, titles, parent_ids = [], [], [], []
+    notes = await db.stream(
+        select(Note.id, Note.uuid, Note.title, Note.parent_id)
+        .where(Note.user_id == user_id)
+        .order_by(Note.id)
+        .execution_options(yield_per=_STREAM_BATCH)
+    )
+    async for rows in notes.partitions():
+        for id, uuid, title, parent_id in rows:
+            ids.append(id)
+            uuids.append(uuid)
+            titles.append(title)
+            parent_ids.append(parent_id if parent_id is not None else -1)
+
+    link_ids = []
+    links = await db.stream(
+        select(CrossLink.note_id, CrossLink.linked_note_id)
+        .where(CrossLink.user_id == user_id)
+        .execution_options(yield_per=_STREAM_BATCH)
+    )
+    async for rows in links.partitions():
+        link_ids.extend(rows)
+
+    dangling = []
+    result = await db.stream(
+        DANGLING_LINKS.bindparams(user_id=user_id).execution_options(yield_per=_STREAM_BATCH)
+    )
+    async for rows in result.partitions():
+        dangling.extend(tuple(row) for row in rows)
+
+    ids = np.array(ids, dtype=np.int64)
+    link_ids = np.array(link_ids, dtype=np.int64).reshape(-1, 2)
+    parents = np.array(parent_ids, dtype=np.int64)
+    # ids are sorted, searchsorted turns note ids into node indexes
+    has_parent = parents >= 0
+    parents[has_parent] = np.searchsorted(ids, parents[has_parent])
+    return LinkGraph(
+        ids=ids,
+        uuids=uuids,
+        titles=titles,
+        parents=parents,
+        sources=np.searchsorted(ids, link_ids[:, 0]),
+        targets=np.searchsorted(ids, link_ids[:, 1]),
+        dangling=dangling,
+    )
+
+
+def pagerank(graph: LinkGraph) -> np.ndarray:
+    """
+    PageRank over the links by power iteration. Every iteration is one sparse
+    matrix-vector product done with bincount; the rank of notes without outgoing
+    links is spread over all notes.
+    """
+    n = graph.size
+    if n == 0:
+        return np.zeros(0)
+    out_degree = np.bincount(graph.sources, minlength=n).astype(np.float64)
+    has_links = out_degree > 0
+    weight = np.divide(1.0, out_degree, out=np.zeros(n), where=has_links)
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITERATIONS):
+        spread = rank[~has_links].sum() / n
+        received = np.bincount(graph.targets, weights=(rank * weight)[graph.sources], minlength=n)
+        new_rank = (1 - PAGERANK_DAMPING) / n + PAGERANK_DAMPING * (received + spread)
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < PAGERANK_TOLERANCE:
+            break
+    return rank
+
+
+def compute_analytics(graph: LinkGraph) -> dict[str, Any]:
+    """
+    All metrics of the graph as a JSON-ready dict, lists cut to MAX_ITEMS
+    """
+    n = graph.size
+    in_degree = np.bincount(graph.targets, minlength=n)
+    out_degree = np.bincount(graph.sources, minlength=n)
+    children = np.bincount(graph.parents[graph.parents >= 0], minlength=n)
+
+    orphans = np.flatnonzero((graph.parents < 0) & (in_degree == 0))
+    # Hubs: most links in and out, children break ties
+    degree = in_degree + out_degree
+    hubs = np.lexsort((-children, -degree))
+    hubs = hubs[degree[hubs] > 0][:MAX_ITEMS]
+    scores = pagerank(graph)
+    ranked = np.argsort(-scores, kind="stable")[:MAX_ITEMS]
+
+    node_of = {id: node for node, id in enumerate(graph.ids.tolist())}
+    return {
+        "summary": {
+            "notes": n,
+            "links": len(graph.sources),
+            "orphans": len(orphans),
+            "broken_links": len(graph.dangling),
+        },
+        "orphans": [graph.note(node) for node in orphans[:MAX_ITEMS].tolist()],
+        "hubs": [
+            graph.note(node) | {
+                "backlinks": int(in_degree[node]),
+                "links": int(out_degree[node]),
+                "children": int(children[node]),
+            }
+            for node in hubs.tolist()
+        ],
+        "broken_links": [
+            graph.note(node_of[note_id]) | {"link_title": title, "target": target}
+            for note_id, title, target in graph.dangling[:MAX_ITEMS]
+        ],
+        "pagerank": [
+            graph.note(node) | {"score": round(float(scores[node]), 8)}
+            for node in ranked.tolist()
+        ],
+    }
+
+
+class VaultAnalytics:
+    """
+    Link graph metrics of one user, computed from the whole vault and cached.
+
+    The cached result is dropped after commits that change the graph: notes created or
+    deleted, a changed set of links in a note's content, renamed or moved notes
+    (see NoteService and the notes router). It expires after settings.analytics_ttl anyway.
+    """
+
+    def __init__(self, cache: CacheBackend, user_id: int):
+        self.cache = cache
+        self.user_id = user_id
+
+    @classmethod
+    async def for_user(cls, user_id: int) -> "VaultAnalytics":
+        return cls(await get_cache(), user_id)
+
+    @property
+    def key(self) -> str:
+        return f"analytics:{self.user_id}"
+
+    async def get(self, db: AsyncSession) -> dict[str, Any]:
+        try:
+            if (cached := await self.cache.get(self.key)) is not None:
+                return cached
+        except RedisError:
+            pass
+
+        graph = await load_graph(db, self.user_id)
+        # CPU-bound, kept off the event loop
+        result = await asyncio.to_thread(compute_analytics, graph)
+        try:
+            await self.cache.set(self.key, result, ex=settings.analytics_ttl)
+        except RedisError:
+            pass
+        return result
+
+    async def invalidate(self):
+        try:
+            await self.cache.delete(self.key)
+        except RedisError:
+            pass
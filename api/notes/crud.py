@@ -1,5 +1,7 @@
 from typing import Any
+from uuid import UUID
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import ARRAY, any_, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from api.core.db import get_session
@@ -7,6 +9,13 @@ from api.core.models import Note
 from sqlalchemy.orm import selectinload
 from api.core.models import CrossLink
 
+def _relations():
+    return (
+        selectinload(Note.children),
+        selectinload(Note.tags),
+        selectinload(Note.linked_notes).joinedload(CrossLink.linked_note),
+    )
+
 async def get_note_with_relations(
     note_uuid: str,
     user_id: int,
@@ -18,11 +27,7 @@ async def get_note_with_relations(
     result = await db.execute( 
         select(Note)
         .where(Note.uuid == note_uuid, Note.user_id == user_id)
-        .options(
-            selectinload(Note.children),
-            selectinload(Note.tags),
-            selectinload(Note.linked_notes).joinedload(CrossLink.linked_note),
-        )
+        .options(*_relations())
     )
     note = result.scalar_one_or_none()  
     
@@ -31,6 +36,22 @@ async def get_note_with_relations(
     
     return note
 
+async def get_notes_with_relations(
+    note_uuids: list[UUID],
+    user_id: int,
+    db: AsyncSession
+) -> list[Note]:
+    """
+    Loads several notes like get_note_with_relations, in one query for the notes and one
+    per relationship for all of them. Notes that don't exist are left out.
+    """
+    result = await db.execute(
+        select(Note)
+        .where(Note.uuid == any_(bindparam("note_uuids", note_uuids, type_=ARRAY(Note.uuid.type))), Note.user_id == user_id)
+        .options(*_relations())
+    )
+    return list(result.scalars().all())
+
 valid_fields = [column.name for column in Note.__table__.columns]
 
 async def get_note_by(
@@ -0,0 +1,395 @@
+"""
+Background parsing of notes, used when settings.note_processing_mode is "async".
+
+The write commits the note with processing_state "pending" and enqueues a job;
+worker tasks started in the app's lifespan parse the note and reconcile its tags,
+children and links with NoteService, then mark it "done".
+
+Jobs are keyed by note id and the hash of the content they were enqueued for:
+- at most one job per note is queued, an edit while it waits is processed by that job,
+  since a job always processes the note's current content (superseding the older one);
+- a job whose content was processed already (processed_hash) is skipped, so jobs
+  delivered twice after a crash are harmless.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.config import settings
+from api.core.db import LazySession, async_session
+from api.core.metrics import NOTE_JOB_LATENCY, NOTE_JOBS
+from api.core.models import Note
+from api.core.redis_client import get_redis
+from api.notes.read_cache import NoteReadCache
+from api.notes.services.note_service import NoteService
+from api.notes.utils import NoteParser
+
+logger = logging.getLogger(__name__)
+
+# Jobs taken per read
+_BATCH = 10
+# A marker of a queued job that got lost stops blocking new jobs of the note after this long
+_MARKER_TTL = 3600
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+@dataclass
+class NoteJob:
+    note_id: int
+    user_id: int  # the partition key of notes
+    content_hash: str
+    attempts: int = 0
+    id: str | None = None  # stream entry id, set by take()
+
+
+class NoteJobQueue(ABC):
+    """
+    Queue of notes waiting to be parsed, with at most one queued job per note
+    """
+
+    @abstractmethod
+    async def enqueue(self, job: NoteJob) -> bool:
+        """
+        Returns:
+            bool: False if a job of the note is queued already, it will process the current content
+        """
+
+    @abstractmethod
+    async def take(self, consumer: str) -> list[NoteJob]:
+        """
+        Next jobs for the consumer, waits up to settings.note_job_block_ms for them
+        """
+
+    @abstractmethod
+    async def started(self, job: NoteJob):
+        """
+        Called before the job runs, edits from now on enqueue a new job
+        """
+
+    @abstractmethod
+    async def ack(self, job: NoteJob):
+        """
+        Removes a finished job, unacknowledged jobs are delivered again
+        """
+
+
+class RedisNoteJobQueue(NoteJobQueue):
+    """
+    A Redis Stream read through a consumer group. Entries stay pending until acknowledged,
+    the entries of a consumer that died are claimed by the others after
+    settings.note_job_claim_idle_ms. A "queued" key per note coalesces jobs.
+    """
+    group = "note-workers"
+
+    def __init__(self, client: Redis, namespace: str = ""):
+        self.client = client
+        self.stream = f"{namespace}:note-jobs" if namespace else "note-jobs"
+        self._group_ready = False
+
+    def marker(self, note_id: int) -> str:
+        return f"{self.stream}:queued:{note_id}"
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def enqueue(self, job: NoteJob) -> bool:
+        if not await self.client.set(self.marker(job.note_id), 1, nx=True, ex=_MARKER_TTL):
+            return False
+        try:
+            await self.client.xadd(self.stream, {
+                "note_id": job.note_id, "user_id": job.user_id,
+                "hash": job.content_hash, "attempts": job.attempts
+            })
+        except RedisError:
+            await self.client.delete(self.marker(job.note_id))
+            raise
+        return True
+
+    async def take(self, consumer: str) -> list[NoteJob]:
+        await self._ensure_group()
+        try:
+            # Jobs a crashed consumer left unacknowledged come first
+            _, entries, *_ = await self.client.xautoclaim(
+                self.stream, self.group, consumer, settings.note_job_claim_idle_ms, "0-0", count=_BATCH
+            )
+            if not entries:
+                response = await self.client.xreadgroup(
+                    self.group, consumer, {self.stream: ">"}, count=_BATCH, block=settings.note_job_block_ms
+                )
+                entries = response[0][1] if response else []
+        except ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            # the stream was deleted (e.g. the cache was cleared), created again on the next take
+            self._group_ready = False
+            return []
+        return [
+            NoteJob(
+                int(fields["note_id"]), int(fields["user_id"]), fields["hash"], int(fields["attempts"]),
+                id=entry_id
+            )
+            for entry_id, fields in entries if fields
+        ]
+
+    async def started(self, job: NoteJob):
+        await self.client.delete(self.marker(job.note_id))
+
+    async def ack(self, job: NoteJob):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, job.id)
+            pipe.xdel(self.stream, job.id)
+            await pipe.execute()
+
+
+class MemoryNoteJobQueue(NoteJobQueue):
+    """
+    In-process queue for single-node deployments and test runs. Jobs are lost on restart,
+    the sweep of pending notes enqueues them again.
+    """
+
+    def __init__(self):
+        self._jobs: asyncio.Queue[NoteJob] = asyncio.Queue()
+        self._queued: set[int] = set()
+
+    async def enqueue(self, job: NoteJob) -> bool:
+        if job.note_id in self._queued:
+            return False
+        self._queued.add(job.note_id)
+        self._jobs.put_nowait(job)
+        return True
+
+    async def take(self, consumer: str) -> list[NoteJob]:
+        try:
+            jobs = [await asyncio.wait_for(self._jobs.get(), settings.note_job_block_ms / 1000)]
+        except TimeoutError:
+            return []
+        while len(jobs) < _BATCH and not self._jobs.empty():
+            jobs.append(self._jobs.get_nowait())
+        return jobs
+
+    async def started(self, job: NoteJob):
+        self._queued.discard(job.note_id)
+
+    async def ack(self, job: NoteJob):
+        pass
+
+
+_queue: NoteJobQueue | None = None
+
+async def get_note_job_queue() -> NoteJobQueue:
+    """
+    The queue of the configured cache backend, Redis or in-process
+    """
+    global _queue
+    if _queue is None:
+        if settings.cache_backend == "memory":
+            _queue = MemoryNoteJobQueue()
+        else:
+            _queue = RedisNoteJobQueue(await get_redis(), settings.cache_namespace)
+    return _queue
+
+
+def defer_processing(note: Note, db: AsyncSession):
+    """
+    Marks the note pending and enqueues its job once the note is committed
+    """
+    note.processing_state = "pending"
+    db.after_commit(functools.partial(enqueue, NoteJob(note.id, note.user_id, content_hash(note.content))))
+
+async def enqueue(job: NoteJob):
+    try:
+        await (await get_note_job_queue()).enqueue(job)
+    except RedisError:
+        # The note is committed as pending, the sweep enqueues it later
+        logger.warning("Could not enqueue the job of note %s", job.note_id, exc_info=True)
+
+
+async def process_note(
+    job: NoteJob,
+    session_factory: Callable[[], AsyncSession] = async_session
+) -> str:
+    """
+    Parses the note's current content and reconciles its tags, children and links
+
+    Returns:
+        str: "processed", "superseded" (content changed since the job was enqueued, the current
+        one was processed), "duplicate" (already processed) or "missing" (note deleted)
+    """
+    db = LazySession(session_factory)
+    try:
+        # The lock makes an edit committed meanwhile wait, it enqueues a new job afterwards
+        note = (await db.execute(
+            select(Note).where(Note.id == job.note_id, Note.user_id == job.user_id).with_for_update()
+        )).scalar_one_or_none()
+        if note is None:
+            return "missing"
+        current_hash = content_hash(note.content)
+        if note.processed_hash == current_hash and note.processing_state == "done":
+            return "duplicate"
+
+        parser = NoteParser(note.content)
+        service = NoteService(db)
+        service.note = note
+        service.parsed_tags = parser.parse_tags()
+        service.parsed_children = parser.parse_children()
+        service.parsed_links = parser.parse_links()
+        await service.handle_note(note)
+
+        await db.execute(
+            update(Note)
+            .where(Note.id == note.id, Note.user_id == note.user_id)
+            .values(processing_state="done", processed_hash=current_hash, updated_at=Note.updated_at)
+        )
+        db.after_commit((await NoteReadCache.for_user(note.user_id)).invalidate)
+        await db.commit()
+        return "processed" if current_hash == job.content_hash else "superseded"
+    except BaseException:
+        await db.rollback()
+        raise
+    finally:
+        await db.release()
+
+
+async def mark_failed(job: NoteJob, session_factory: Callable[[], AsyncSession] = async_session):
+    async with session_factory() as db:
+        await db.execute(
+            update(Note)
+            .where(Note.id == job.note_id, Note.user_id == job.user_id)
+            .values(processing_state="failed", updated_at=Note.updated_at)
+        )
+        await db.commit()
+    await (await NoteReadCache.for_user(job.user_id)).invalidate()
+
+
+class NoteWorker:
+    """
+    Takes jobs from the queue and processes them one at a time
+    """
+
+    def __init__(
+        self,
+        queue: NoteJobQueue,
+        name: str,
+        session_factory: Callable[[], AsyncSession] = async_session
+    ):
+        self.queue = queue
+        self.name = name
+        self.session_factory = session_factory
+
+    async def run(self):
+        while True:
+            try:
+                jobs = await self.queue.take(self.name)
+            except RedisError:
+                logger.warning("Worker %s could not read jobs", self.name, exc_info=True)
+                await asyncio.sleep(1)
+                continue
+            for job in jobs:
+                await self.handle(job)
+
+    async def handle(self, job: NoteJob) -> str:
+        try:
+            await self.queue.started(job)
+            started_at = time.perf_counter()
+            result = await process_note(job, self.session_factory)
+            NOTE_JOB_LATENCY.observe(time.perf_counter() - started_at)
+        except Exception:
+            logger.exception("Job of note %s failed, attempt %d", job.note_id, job.attempts + 1)
+            result = await self._retry(job)
+        NOTE_JOBS.labels(result).inc()
+        try:
+            await self.queue.ack(job)
+        except RedisError:
+            # delivered again later and skipped as a duplicate
+            logger.warning("Could not acknowledge the job of note %s", job.note_id, exc_info=True)
+        return result
+
+    async def _retry(self, job: NoteJob) -> str:
+        try:
+            if job.attempts + 1 >= settings.note_job_max_attempts:
+                await mark_failed(job, self.session_factory)
+                return "failed"
+            # If the note was edited meanwhile its newer job is queued already and covers this one
+            await self.queue.enqueue(NoteJob(job.note_id, job.user_id, job.content_hash, job.attempts + 1))
+            return "retried"
+        except Exception:
+            logger.exception("Could not retry the job of note %s", job.note_id)
+            return "failed"
+
+
+async def enqueue_pending(
+    queue: NoteJobQueue,
+    session_factory: Callable[[], AsyncSession] = async_session
+) -> int:
+    """
+    Enqueues every pending note, for jobs lost to a Redis outage or a restart of the
+    in-process queue. Notes with a queued job are skipped by the queue.
+
+    Returns:
+        int: number of jobs enqueued
+    """
+    enqueued = 0
+    async with session_factory() as db:
+        pending = await db.stream(
+            select(Note.id, Note.user_id, func.encode(func.sha256(func.convert_to(Note.content, "UTF8")), "hex"))
+            .where(Note.processing_state == "pending")
+            .execution_options(yield_per=1000)
+        )
+        async for note_id, user_id, hash in pending:
+            enqueued += await queue.enqueue(NoteJob(note_id, user_id, hash))
+    return enqueued
+
+
+class NoteWorkerPool:
+    """
+    settings.note_workers worker tasks plus the periodic sweep of pending notes,
+    started and stopped by the app's lifespan
+    """
+
+    def __init__(self, queue: NoteJobQueue):
+        self.queue = queue
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self):
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.tasks = [
+            asyncio.create_task(NoteWorker(self.queue, f"{prefix}-{i}").run())
+            for i in range(settings.note_workers)
+        ]
+        self.tasks.append(asyncio.create_task(self._sweep()))
+
+    async def _sweep(self):
+        while True:
+            try:
+                if enqueued := await enqueue_pending(self.queue):
+                    logger.info("Enqueued %d pending notes", enqueued)
+            except Exception:
+                logger.exception("Sweep of pending notes failed")
+            await asyncio.sleep(settings.note_job_sweep_seconds)
+
+    async def stop(self):
+        # A job cancelled midway is rolled back and delivered again
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
@@ -0,0 +1,166 @@
+import asyncio
+from typing import Awaitable, Callable
+from uuid import UUID, uuid4
+from redis.exceptions import RedisError
+from api.core.cache import CacheBackend, get_cache
+from api.core.config import settings
+from api.core.metrics import CACHE_REQUESTS
+from api.core.singleflight import SingleFlight
+from api.notes.schemas import NoteRead
+
+_POLL_SECONDS = 0.02
+_MISSING = object()
+
+# Reads of the same note in this process share one load
+_loads = SingleFlight()
+
+
+class NoteReadCache:
+    """
+    Cached GET /notes/{uuid} responses of one user.
+
+    A note's response depends on other notes (children, link targets) and on tags, so
+    instead of tracking every entry a write touches, every entry of the user is stamped
+    with the user's version token and invalidate() replaces the token after commits of
+    note and tag writes (see the notes and tags routers, NoteDeleteService and the
+    background jobs). Entries expire after settings.note_cache_ttl anyway.
+
+    Concurrent misses of a note at the same version are loaded once per process (single
+    flight), and once across processes: the process holding the short rebuild lock loads,
+    the others poll the cache for its entry until the lock would have expired.
+    """
+
+    def __init__(self, cache: CacheBackend, user_id: int):
+        self.cache = cache
+        self.user_id = user_id
+
+    @classmethod
+    async def for_user(cls, user_id: int) -> "NoteReadCache":
+        return cls(await get_cache(), user_id)
+
+    @property
+    def version_key(self) -> str:
+        return f"notes-version:{self.user_id}"
+
+    def key(self, note_uuid: UUID) -> str:
+        return f"note:{self.user_id}:{note_uuid}"
+
+    def lock_key(self, note_uuid: UUID, version: str | None) -> str:
+        return f"note-lock:{self.user_id}:{note_uuid}:{version}"
+
+    async def get(
+        self,
+        note_uuid: UUID,
+        load: Callable[[], Awaitable[NoteRead | None]]
+    ) -> NoteRead | None:
+        """
+        The note's response from the cache, built by load() on a miss.
+        None if the note does not exist (cached as well).
+        """
+        try:
+            version, entry = await self.cache.mget([self.version_key, self.key(note_uuid)])
+        except RedisError:
+            return await load()
+        if entry is not None and entry["version"] == version:
+            CACHE_REQUESTS.labels("note", "hit").inc()
+            return self._note(entry)
+        CACHE_REQUESTS.labels("note", "miss").inc()
+
+        # Per version: a read after a write's invalidate() must not get a load started before the commit
+        return await _loads.do(
+            (self.user_id, note_uuid, version), lambda: self._load(note_uuid, version, load)
+        )
+
+    async def _load(
+        self,
+        note_uuid: UUID,
+        version: str | None,
+        load: Callable[[], Awaitable[NoteRead | None]]
+    ) -> NoteRead | None:
+        try:
+            locked = await self.cache.set(
+                self.lock_key(note_uuid, version), 1, ex=settings.note_cache_lock_seconds, nx=True
+            )
+        except RedisError:
+            return await load()
+        if not locked and (note := await self._wait(note_uuid, version)) is not _MISSING:
+            return note
+
+        # The version was read before loading: if a write commits meanwhile, the entry is stale on arrival
+        note = await load()
+        try:
+            await self.cache.set(self.key(note_uuid), self._entry(version, note), ex=settings.note_cache_ttl)
+            if locked:
+                # Another process may hold it if the load outlived the lock, it then loads once more
+                await self.cache.delete(self.lock_key(note_uuid, version))
+        except RedisError:
+            pass
+        return note
+
+    async def get_many(
+        self,
+        note_uuids: list[UUID],
+        load: Callable[[list[UUID]], Awaitable[dict[UUID, NoteRead | None]]]
+    ) -> dict[UUID, NoteRead | None]:
+        """
+        The responses of several notes, None for notes that do not exist. Cached ones come
+        from one MGET, the others from one load(missing uuids) call and are stored in one
+        pipeline. Misses skip the single flight and the rebuild lock: the whole batch is a
+        single load already.
+        """
+        try:
+            version, *entries = await self.cache.mget([self.version_key, *map(self.key, note_uuids)])
+        except RedisError:
+            return await load(note_uuids)
+
+        notes = {}
+        missing = []
+        for note_uuid, entry in zip(note_uuids, entries):
+            if entry is not None and entry["version"] == version:
+                notes[note_uuid] = self._note(entry)
+            else:
+                missing.append(note_uuid)
+        CACHE_REQUESTS.labels("note", "hit").inc(len(notes))
+        CACHE_REQUESTS.labels("note", "miss").inc(len(missing))
+
+        if missing:
+            loaded = await load(missing)
+            try:
+                async with self.cache.pipeline() as pipe:
+                    for note_uuid, note in loaded.items():
+                        pipe.set(self.key(note_uuid), self._entry(version, note), ex=settings.note_cache_ttl)
+            except RedisError:
+                pass
+            notes.update(loaded)
+        return {note_uuid: notes[note_uuid] for note_uuid in note_uuids}
+
+    async def _wait(self, note_uuid: UUID, version: str | None):
+        """
+        Polls for the entry the lock holder stores, _MISSING if it does not arrive in time
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.note_cache_lock_seconds
+        while loop.time() < deadline:
+            await asyncio.sleep(_POLL_SECONDS)
+            try:
+                entry = await self.cache.get(self.key(note_uuid))
+            except RedisError:
+                break
+            if entry is not None and entry["version"] == version:
+                return self._note(entry)
+        return _MISSING
+
+    @staticmethod
+    def _entry(version: str | None, note: NoteRead | None) -> dict:
+        return {"version": version, "note": note.model_dump(mode="json") if note else None}
+
+    @staticmethod
+    def _note(entry: dict) -> NoteRead | None:
+        return NoteRead.model_validate(entry["note"]) if entry["note"] is not None else None
+
+    async def invalidate(self):
+        try:
+            # Outlives the entries stored before, so they can't become valid again when it expires
+            await self.cache.set(self.version_key, uuid4().hex, ex=settings.note_cache_ttl * 2)
+        except RedisError:
+            pass
@@ -1,23 +1,39 @@
 from datetime import datetime, timezone
 from typing import Annotated, Optional
 from uuid import uuid4, UUID
-from fastapi import APIRouter, Depends, status, HTTPException, Query
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from sqlalchemy import ARRAY, Integer, and_, any_, bindparam, select
 from api.auth.schemas import UserOut
-from api.auth.services.auth_service import get_current_user
+from api.auth.services.auth_service import get_current_user, get_read_session
+from api.core.config import settings
 from api.core.db import get_session
-from api.core.models import CrossLink, Note, note_tags
-from api.notes.schemas import NoteCrossLinkRead, NoteRead, NoteCreate, NoteShallowRead, NoteTagAssociationRead, NoteTagRead, NoteUpdate
+from api.core.idempotency import IdempotentRoute
+from api.core.rate_limit import UserRateLimiter
+from api.core.streaming import NDJSON_RESPONSES, stream_rows, wants_ndjson
+from api.core.models import CrossLink, Note, Tag, note_tags
+from api.notes.analytics import MAX_ITEMS, VaultAnalytics
+from api.notes.read_cache import NoteReadCache
+from api.notes.schemas import AnalyticsBrokenLink, AnalyticsHub, AnalyticsNote, AnalyticsRank, AnalyticsSummary, NoteBacklinkRead, NoteBatchGet, NoteBatchRead, NoteCrossLinkRead, NoteRead, NoteCreate, NoteShallowRead, NoteTagAssociationRead, NoteTagRead, NoteUpdate
+from api.notes.jobs import content_hash, defer_processing
 from api.notes.services.note_delete_service import NoteDeleteService
 from api.notes.services.note_service import NoteService
 from api.notes.utils import NoteParser, check_note_title_unique_or_400, create_note_read_response
-from api.notes.crud import get_note_with_relations, get_note_by
+from api.notes.crud import get_note_with_relations, get_notes_with_relations, get_note_by
+from api.tags.index import TagIndex
+from api.tags.utils import decode_cursor, encode_cursor
+from api.tags.query import MAX_QUERY_LENGTH, TagQueryError, parse_tag_query, tag_names
 
 
-router = APIRouter(prefix="/notes", tags=["notes"])
+router = APIRouter(prefix="/notes", tags=["notes"], route_class=IdempotentRoute)
 
-@router.post("/", response_model=NoteRead, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=NoteRead,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(UserRateLimiter("notes_create"))]
+)
 async def create_note(
     note_in: NoteCreate,
     db: AsyncSession = Depends(get_session),
@@ -33,19 +49,27 @@ async def create_note(
         
         note_data = note_in.model_dump()
         note = Note(**note_data, user_id=user.id, uuid=uuid4())
+        if settings.note_processing_mode == "async":
+            note.processing_state = "pending"
+        else:
+            note.processed_hash = content_hash(note.content)
         db.add(note)
         await db.flush() 
 
-        parser = NoteParser(note.content)
-        
-        service = NoteService(db)
-        service.note = note
-        service.parsed_tags = parser.parse_tags()        
-        service.parsed_children = parser.parse_children() 
-        service.parsed_links = parser.parse_links()    
+        if settings.note_processing_mode == "async":
+            defer_processing(note, db)
+        else:
+            parser = NoteParser(note.content)
+            
+            service = NoteService(db)
+            service.note = note
+            service.parsed_tags = parser.parse_tags()        
+            service.parsed_children = parser.parse_children() 
+            service.parsed_links = parser.parse_links()    
 
-        await service.handle_note(note)
+            await service.handle_note(note)
 
+        db.after_commit((await NoteReadCache.for_user(user.id)).invalidate)
         await db.commit()
         await db.refresh(note)
         
@@ -61,49 +85,183 @@ async def create_note(
         )
 
 
-@router.get("/", response_model=list[NoteShallowRead])
+@router.get("/", response_model=list[NoteShallowRead], responses=NDJSON_RESPONSES)
 async def get_notes(
-    db: AsyncSession = Depends(get_session),
+    request: Request,
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user),
     parent_id: Optional[int] = None,
     skip: Annotated[int, Query(ge=0, description="Number of items to skip")] = 0,
     limit: Annotated[int, Query(ge=1, le=100, description="Number of items to return")] = 20,
+    tags: Annotated[Optional[str], Query(
+        max_length=MAX_QUERY_LENGTH,
+        description='Boolean tag filter, e.g. "python AND (async OR NOT draft)"'
+    )] = None,
 ):
     """
     Get paginated list of notes with basic info (no content, tags, children, links).
+    Without tags it lists one folder (root by default), most recently updated first.
+    With tags it searches all notes unless parent_id is given, newest (last created) first:
+    the matches are computed and paged in the tag index, the database only loads the page.
+
+    With Accept: application/x-ndjson all matching notes are streamed, one per line,
+    starting after skip; limit does not apply.
     """
-    query = (
-        select(Note)
-        .where(
-            Note.user_id == user.id,
-            Note.parent_id == parent_id
+    stream = wants_ndjson(request)
+    if tags is None:
+        query = (
+            select(Note)
+            .where(Note.user_id == user.id, Note.parent_id == parent_id)
+            .order_by(Note.updated_at.desc())
+            .offset(skip)
         )
-        .order_by(Note.updated_at.desc())
-        .offset(skip)
-        .limit(limit)
-    )
+    else:
+        try:
+            expression = parse_tag_query(tags)
+        except TagQueryError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        tag_ids_result = await db.execute(
+            select(Tag.name, Tag.id).where(Tag.user_id == user.id, Tag.name.in_(tag_names(expression)))
+        )
+        tag_ids = dict(tag_ids_result.all())
+        index = await TagIndex.for_user(user.id)
+        if parent_id is None:
+            note_ids = await index.query(expression, tag_ids, db, skip, None if stream else limit)
+        else:
+            # Checked against the matches note by note, the cost depends on the folder's size only
+            folder_ids = (await db.execute(
+                select(Note.id).where(Note.user_id == user.id, Note.parent_id == parent_id)
+            )).scalars().all()
+            matching = sorted(await index.matching(expression, tag_ids, folder_ids, db), reverse=True)
+            note_ids = matching[skip:] if stream else matching[skip:skip + limit]
+        if not note_ids and not stream:
+            return []
+        query = (
+            select(Note)
+            .where(Note.user_id == user.id, Note.id == any_(bindparam("note_ids", note_ids, type_=ARRAY(Integer))))
+            .order_by(Note.id.desc())
+        )
+
+    if stream:
+        return stream_rows(db, query, lambda row: NoteShallowRead.model_validate(row.Note))
     
-    result = await db.execute(query)
+    result = await db.execute(query.limit(limit))
     return result.scalars().all()
 
+@router.post("/batch-get", response_model=NoteBatchRead)
+async def get_notes_batch(
+    batch: NoteBatchGet,
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+):
+    """
+    Full notes like GET /notes/{uuid} for many uuids in one request. Cached notes are
+    read with one MGET, the rest with one query for the notes and one per relationship.
+    """
+    async def load(note_uuids: list[UUID]) -> dict[UUID, NoteRead | None]:
+        notes = {
+            note.uuid: create_note_read_response(note)
+            for note in await get_notes_with_relations(note_uuids, user.id, db)
+        }
+        return {note_uuid: notes.get(note_uuid) for note_uuid in note_uuids}
+
+    note_cache = await NoteReadCache.for_user(user.id)
+    return NoteBatchRead(notes=await note_cache.get_many(list(dict.fromkeys(batch.uuids)), load))
+
+
+@router.get("/analytics/summary", response_model=AnalyticsSummary)
+async def get_analytics_summary(
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+):
+    """
+    Counts of notes, links, orphan notes and broken links in the user's vault
+    """
+    analytics = await VaultAnalytics.for_user(user.id)
+    return (await analytics.get(db))["summary"]
+
+
+@router.get("/analytics/orphans", response_model=list[AnalyticsNote])
+async def get_orphan_notes(
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+    limit: Annotated[int, Query(ge=1, le=MAX_ITEMS, description="Number of items to return")] = 50,
+):
+    """
+    Notes without a parent that no note links to, oldest first
+    """
+    analytics = await VaultAnalytics.for_user(user.id)
+    return (await analytics.get(db))["orphans"][:limit]
+
+
+@router.get("/analytics/hubs", response_model=list[AnalyticsHub])
+async def get_hub_notes(
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+    limit: Annotated[int, Query(ge=1, le=MAX_ITEMS, description="Number of items to return")] = 50,
+):
+    """
+    Notes with the most links in and out
+    """
+    analytics = await VaultAnalytics.for_user(user.id)
+    return (await analytics.get(db))["hubs"][:limit]
+
+
+@router.get("/analytics/broken-links", response_model=list[AnalyticsBrokenLink])
+async def get_broken_links(
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+    limit: Annotated[int, Query(ge=1, le=MAX_ITEMS, description="Number of items to return")] = 50,
+):
+    """
+    [Title](uuid) links in content whose uuid is not one of the user's notes, external links are left out
+    """
+    analytics = await VaultAnalytics.for_user(user.id)
+    return (await analytics.get(db))["broken_links"][:limit]
+
+
+@router.get("/analytics/pagerank", response_model=list[AnalyticsRank])
+async def get_note_ranks(
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+    limit: Annotated[int, Query(ge=1, le=MAX_ITEMS, description="Number of items to return")] = 50,
+):
+    """
+    The most important notes by PageRank over the links
+    """
+    analytics = await VaultAnalytics.for_user(user.id)
+    return (await analytics.get(db))["pagerank"][:limit]
+
+
 @router.get("/{note_uuid}", response_model=NoteRead)
 async def get_note(
     note_uuid: UUID,
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user),
 ):
-    note_obj = await get_note_with_relations(note_uuid, user.id, db)
-    
-    if note_obj is None:
+    """
+    Served from the note cache, concurrent reads of a note that is not cached share one load
+    """
+    async def load() -> NoteRead | None:
+        note_obj = await get_note_with_relations(note_uuid, user.id, db)
+        return create_note_read_response(note_obj) if note_obj is not None else None
+
+    note = await (await NoteReadCache.for_user(user.id)).get(note_uuid, load)
+    if note is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Note not found"
         )
     
-    return create_note_read_response(note_obj)
+    return note
 
 
-@router.put("/{note_uuid}", response_model=NoteRead)
+@router.put(
+    "/{note_uuid}",
+    response_model=NoteRead,
+    dependencies=[Depends(UserRateLimiter("notes_update"))]
+)
 async def update_note(
     note_uuid: UUID,
     note_in: NoteUpdate,
@@ -136,22 +294,31 @@ async def update_note(
         old_content = note.content
         
         update_data = note_in.model_dump(exclude_unset=True)
+        if any(getattr(note, key) != update_data[key] for key in ("title", "parent_id") if key in update_data):
+            # Renamed or moved, the cached analytics show titles and the hierarchy
+            db.after_commit((await VaultAnalytics.for_user(user.id)).invalidate)
         for key, value in update_data.items():
             setattr(note, key, value)
         
-        if "content" in update_data and note.content != old_content:
+        if "content" in update_data and note.content != old_content and settings.note_processing_mode == "async":
+            defer_processing(note, db)
+        elif "content" in update_data and note.content != old_content:
             parser = NoteParser(note.content)
             
             service = NoteService(db)
             service.note = note
+            service.previous_content = old_content
             service.parsed_tags = parser.parse_tags()        
             service.parsed_children = parser.parse_children() 
             service.parsed_links = parser.parse_links()    
             
             await service.handle_note(note)
+            note.processing_state = "done"
+            note.processed_hash = content_hash(note.content)
         
         note.updated_at = datetime.now(timezone.utc)
         
+        db.after_commit((await NoteReadCache.for_user(user.id)).invalidate)
         await db.commit()
         
         note_obj =  await get_note_with_relations(
@@ -171,7 +338,7 @@ async def update_note(
             detail=f"Failed to update note: {str(e)}"
         )
 
-@router.delete("/{note_uuid}")
+@router.delete("/{note_uuid}", dependencies=[Depends(UserRateLimiter("notes_delete"))])
 async def delete_note(
     note_uuid: UUID,
     db: AsyncSession = Depends(get_session),
@@ -198,35 +365,64 @@ async def delete_note(
     
     return {"message": "Note deleted successfully."}
 
-@router.get('/{note_uuid}/backlinks', response_model=list[NoteCrossLinkRead])
+@router.get('/{note_uuid}/backlinks', response_model=list[NoteBacklinkRead])
 async def get_note_backlinks(
     note_uuid: UUID,
-    db: AsyncSession = Depends(get_session),
+    response: Response,
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user),
-    
+    limit: Annotated[int, Query(ge=1, le=500, description="Number of items to return")] = 50,
+    cursor: Annotated[Optional[str], Query(description="X-Next-Cursor of the previous page")] = None,
 ):
     """
-    Returns a list of notes that refer to the note with the given uuid
+    Returns the links to the note with the given uuid, with the linking note and a snippet
+    of its content around the link, in link creation order.
+
+    One query: a keyset range scan of ix_cross_links_linked_note_id_id joined to the
+    linking notes. If there are more links, the X-Next-Cursor response header holds
+    the cursor of the next page.
     """
-    note = await get_note_by("uuid", note_uuid, user.id, db)
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found"
-        )
-    
-    backlinks = await db.execute(
-        select(CrossLink).\
-            where(
-                CrossLink.linked_note_id == note.id,
-            )
+    target = select(Note.id).where(Note.uuid == note_uuid, Note.user_id == user.id).scalar_subquery()
+    source = aliased(Note)
+    query = (
+        select(CrossLink, source.uuid, source.title)
+        .join(source, and_(source.id == CrossLink.note_id, source.user_id == CrossLink.user_id))
+        .where(CrossLink.linked_note_id == target, CrossLink.user_id == user.id)
+        .order_by(CrossLink.id)
+        .limit(limit + 1)
     )
-    return backlinks
+    if cursor:
+        after = decode_cursor(cursor, {"id": int})["id"]
+        query = query.where(CrossLink.id > after)
+
+    rows = (await db.execute(query)).all()
+    if not rows and not cursor:
+        # no links, or no such note
+        await get_note_by("uuid", note_uuid, user.id, db)
+
+    page = rows[:limit]
+    if len(rows) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"id": page[-1][0].id})
+
+    return [
+        NoteBacklinkRead(
+            id=link.id,
+            note_id=link.note_id,
+            linked_note_id=link.linked_note_id,
+            title=link.title,
+            source_note_uuid=source_uuid,
+            source_note_title=source_title,
+            offset_start=link.offset_start,
+            offset_end=link.offset_end,
+            snippet=link.snippet,
+        )
+        for link, source_uuid, source_title in page
+    ]
 
 @router.get('/{note_uuid}/linked_notes', response_model=list[NoteCrossLinkRead])
 async def get_note_referers(
     note_uuid: UUID,
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user),
     
 ):
@@ -244,6 +440,7 @@ async def get_note_referers(
         select(CrossLink).\
             where(
                 CrossLink.note_id == note.id,
+                CrossLink.user_id == user.id,
             )
     )
     return referers.scalars().all()
@@ -251,7 +448,7 @@ async def get_note_referers(
 @router.get('/{note_uuid}/tags', response_model=list[NoteTagAssociationRead])
 async def get_note_tags(
     note_uuid: UUID,
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user),
 ): 
     """
@@ -269,6 +466,7 @@ async def get_note_tags(
         select(note_tags).\
             where(
                 note_tags.c.note_id == note.id,
+                note_tags.c.user_id == user.id,
             )
     )
     return tags.scalars().all()
\ No newline at end of file
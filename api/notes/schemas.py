@@ -42,12 +42,25 @@ class NoteRead(NoteBase):
     created_at: datetime
     updated_at: datetime
     user_id: int
+    processing_state: str = "done"  # "pending" until tags, children and links are parsed in the background
     children_read: Optional[list["NoteChildRead"]] = Field(default_factory=list)
     tags_read: Optional[List["NoteTagRead"]] = Field(default_factory=list)
     links_read: Optional[List["NoteLinkRead"]] = Field(default_factory=list)
     model_config = ConfigDict(from_attributes=True)
 
 
+MAX_BATCH_GET = 250
+
+class NoteBatchGet(BaseModel):
+    uuids: list[UUID] = Field(min_length=1, max_length=MAX_BATCH_GET)
+
+class NoteBatchRead(BaseModel):
+    """
+    The requested notes by uuid, null for notes that don't exist
+    """
+    notes: dict[UUID, Optional[NoteRead]]
+
+
 class NoteShallowRead(NoteBase):
     """
     Model responsible for reading a note without children notes, links and etc.
@@ -58,6 +71,7 @@ class NoteShallowRead(NoteBase):
     created_at: datetime
     updated_at: datetime
     user_id: int
+    processing_state: str = "done"
     model_config = ConfigDict(from_attributes=True)
     
 class NoteCrossLinkRead(BaseModel):
@@ -68,8 +82,47 @@ class NoteCrossLinkRead(BaseModel):
     linked_note_id: int
     title: str
     model_config = ConfigDict(from_attributes=True)
+
+class NoteBacklinkRead(NoteCrossLinkRead):
+    """
+    A link to the note with the note it is in and where: character offsets in that note's
+    content and a snippet around the link (null for links saved before snippets existed).
+    Both are taken when the linking note is saved, bulk rewrites of its content
+    (tag renames, links to deleted notes) can shift them until it is saved again.
+    """
+    id: int
+    source_note_uuid: UUID
+    source_note_title: str
+    offset_start: Optional[int] = None
+    offset_end: Optional[int] = None
+    snippet: Optional[str] = None
     
 class NoteTagAssociationRead(BaseModel):
     note_id: int
     tag_id: int
-    
\ No newline at end of file
+
+
+class AnalyticsSummary(BaseModel):
+    notes: int
+    links: int
+    orphans: int
+    broken_links: int
+
+class AnalyticsNote(BaseModel):
+    uuid: UUID
+    title: str
+
+class AnalyticsHub(AnalyticsNote):
+    backlinks: int
+    links: int
+    children: int
+
+class AnalyticsBrokenLink(AnalyticsNote):
+    """
+    uuid and title are of the note the link is in
+    """
+    link_title: str
+    target: str
+
+class AnalyticsRank(AnalyticsNote):
+    score: float
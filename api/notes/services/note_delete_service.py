@@ -1,9 +1,13 @@
+import functools
 import re
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete, select
+from sqlalchemy import and_, delete, select
 from api.core.models import Note, CrossLink, note_tags
 from sqlalchemy.orm import selectinload
+from api.notes.analytics import VaultAnalytics
+from api.notes.read_cache import NoteReadCache
+from api.tags.index import TagIndex
 
 class NoteDeleteService:
     """
@@ -14,13 +18,14 @@ class NoteDeleteService:
         # A set to track note IDs during a recursive deletion to prevent infinite loops in case of a bug.
         self._deletion_path = set()
 
-    async def _find_notes_with_links_to(self, note_id: int) -> list[Note]:
+    async def _find_notes_with_links_to(self, note_id: int, user_id: int) -> list[Note]:
         """
         Retrieves all notes that contain a CrossLink pointing to the given note ID.
         This is a helper method to find notes that need their content updated.
 
         Args:
             note_id (int): The ID of the note to which other notes are linked.
+            user_id (int): The owner of the note, links never cross users.
 
         Returns:
             list[Note]: A list of Note ORM objects that link to the specified note.
@@ -28,8 +33,8 @@ class NoteDeleteService:
         # We use a JOIN to find notes that have a CrossLink record pointing to the target note.
         stmt = (
             select(Note)
-            .join(CrossLink, Note.id == CrossLink.note_id)
-            .where(CrossLink.linked_note_id == note_id)
+            .join(CrossLink, and_(Note.id == CrossLink.note_id, Note.user_id == CrossLink.user_id))
+            .where(CrossLink.linked_note_id == note_id, CrossLink.user_id == user_id)
         )
         result = await self.db.execute(stmt)
         return result.scalars().all()
@@ -79,7 +84,9 @@ class NoteDeleteService:
         
         # 1. Recursively delete all child notes first.
         children_result = await self.db.execute(
-            select(Note).where(Note.parent_id == note.id).options(selectinload(Note.children))
+            select(Note)
+            .where(Note.parent_id == note.id, Note.user_id == note.user_id)
+            .options(selectinload(Note.children))
         )
         children = children_result.scalars().all()
         
@@ -87,7 +94,7 @@ class NoteDeleteService:
             await self._delete_note_recursively(child)
         
         # 2. Before deleting, find and update all notes that contain links to this note.
-        notes_with_links = await self._find_notes_with_links_to(note.id)
+        notes_with_links = await self._find_notes_with_links_to(note.id, note.user_id)
         
         await self._replace_deleted_links_in_content(
             notes_with_links,
@@ -99,13 +106,19 @@ class NoteDeleteService:
         # It's cleaner and safer to handle these explicitly than relying on cascade options.
         
         # Delete associations in the many-to-many "note_tags" table.
-        await self.db.execute(delete(note_tags).where(note_tags.c.note_id == note.id))
+        await self.db.execute(
+            delete(note_tags).where(note_tags.c.note_id == note.id, note_tags.c.user_id == note.user_id)
+        )
         
         # Delete "forward" links (from this note to others).
-        await self.db.execute(delete(CrossLink).where(CrossLink.note_id == note.id))
+        await self.db.execute(
+            delete(CrossLink).where(CrossLink.note_id == note.id, CrossLink.user_id == note.user_id)
+        )
         
         # Delete "backward" links (from other notes to this note).
-        await self.db.execute(delete(CrossLink).where(CrossLink.linked_note_id == note.id))
+        await self.db.execute(
+            delete(CrossLink).where(CrossLink.linked_note_id == note.id, CrossLink.user_id == note.user_id)
+        )
 
         # 4. Finally, delete the note itself.
         await self.db.delete(note)
@@ -122,7 +135,17 @@ class NoteDeleteService:
             
         try:
             await self._delete_note_recursively(note_to_delete)
+            self.db.after_commit(functools.partial(
+                self._remove_from_tag_index, note_to_delete.user_id, set(self._deletion_path)
+            ))
+            self.db.after_commit((await VaultAnalytics.for_user(note_to_delete.user_id)).invalidate)
+            self.db.after_commit((await NoteReadCache.for_user(note_to_delete.user_id)).invalidate)
             await self.db.commit() 
         except Exception as e:
             await self.db.rollback() # Roll back the transaction on any error.
-            raise e
\ No newline at end of file
+            raise e
+
+    @staticmethod
+    async def _remove_from_tag_index(user_id: int, note_ids: set[int]):
+        index = await TagIndex.for_user(user_id)
+        await index.notes_removed(note_ids)
@@ -1,9 +1,23 @@
+import functools
 from typing import Set
 import uuid
 from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from api.core.models import CrossLink, Note, Tag, note_tags
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+from api.notes.analytics import VaultAnalytics
+from api.notes.utils import NoteParser
+from api.tags.index import TagIndex, TagSuggestIndex
+
+def _parse_uuid(value: str) -> str | None:
+    """
+    The canonical form of a link target that is a uuid in any notation uuid.UUID accepts, None otherwise
+    """
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        return None
+
 
 class NoteService:
     def __init__(self, db_session: AsyncSession):
@@ -11,19 +25,38 @@ class NoteService:
         self.note = None
         self.parsed_tags = []
         self.parsed_children = []
-        self.parsed_links = []
+        self.parsed_links = {}
+        # Content before the update, None for a new note
+        self.previous_content = None
+        # Set when notes or links change, the cached link graph analytics are dropped after commit
+        self.graph_changed = False
 
     async def handle_note(self, note):
         self.note = note
         await self._handle_tags()
         await self._handle_children()
         await self._handle_links()
+        if self.graph_changed:
+            analytics = await VaultAnalytics.for_user(self.note.user_id)
+            self.db.after_commit(analytics.invalidate)
 
     async def _handle_tags(self):
         # Deletes all existing tags for the note and adds new ones based on parsed tags.
-        await self.db.execute(
-            note_tags.delete().where(note_tags.c.note_id == self.note.id)
+        result = await self.db.execute(
+            note_tags.delete()
+            .where(
+                note_tags.c.note_id == self.note.id,
+                note_tags.c.user_id == self.note.user_id,
+                note_tags.c.tag_id == Tag.id
+            )
+            .returning(note_tags.c.tag_id, Tag.name)
         )
+        old_tags = dict(result.all())
+        new_tags = {}
+        # The tag indexes are updated once the changes are committed
+        self.db.after_commit(functools.partial(
+            self._update_tag_indexes, self.note.user_id, self.note.id, old_tags, new_tags
+        ))
         
         # If there are no parsed tags, nothing more to do.
         if not self.parsed_tags:
@@ -50,14 +83,28 @@ class NoteService:
         # Map tag names to IDs
         tag_map = {name: id for id, name in result.all()}
         note_tag_values = [
-            {"note_id": self.note.id, "tag_id": tag_map[tag_name]} 
-            for tag_name in self.parsed_tags
+            {"note_id": self.note.id, "tag_id": tag_map[tag_name], "user_id": self.note.user_id}
+            for tag_name in unique_tags
             if tag_name in tag_map
         ]
         
         # Bulk insert note-tag associations
         if note_tag_values:
             await self.db.execute(note_tags.insert().values(note_tag_values))
+            new_tags.update({id: name for name, id in tag_map.items()})
+
+    @staticmethod
+    async def _update_tag_indexes(user_id: int, note_id: int, old_tags: dict[int, str], new_tags: dict[int, str]):
+        """
+        old_tags, new_tags: id -> name of the tags of the note before and after the change
+        """
+        index = await TagIndex.for_user(user_id)
+        await index.note_changed(note_id, old_tags.keys() - new_tags.keys(), new_tags.keys())
+        suggest_index = await TagSuggestIndex.for_user(user_id)
+        await suggest_index.tags_used(
+            added=[new_tags[id] for id in new_tags.keys() - old_tags.keys()],
+            removed=[old_tags[id] for id in old_tags.keys() - new_tags.keys()]
+        )
 
     async def _handle_children(self):
         """
@@ -68,7 +115,7 @@ class NoteService:
         """
         
         existing_children_result = await self.db.execute(
-            select(Note).where(Note.parent_id == self.note.id)
+            select(Note).where(Note.parent_id == self.note.id, Note.user_id == self.note.user_id)
         )
         existing_children = existing_children_result.scalars().all()
         
@@ -78,20 +125,28 @@ class NoteService:
         titles_to_delete: Set[str] = existing_titles.difference(parsed_titles)
         
         if titles_to_delete:
-            notes_to_delete_result = await self.db.execute(
-                select(Note.uuid).where(
-                    Note.parent_id == self.note.id,
-                    Note.title.in_(titles_to_delete)
-                )
+            # The removed children with all their descendants, the delete cascades to them
+            subtree = select(Note.id).where(
+                Note.parent_id == self.note.id,
+                Note.user_id == self.note.user_id,
+                Note.title.in_(titles_to_delete)
+            ).cte("subtree", recursive=True)
+            subtree = subtree.union_all(
+                select(Note.id).where(Note.parent_id == subtree.c.id, Note.user_id == self.note.user_id)
             )
-            note_uuids_to_delete = notes_to_delete_result.scalars().all()
+            notes_to_delete_result = await self.db.execute(select(subtree.c.id))
+            note_ids_to_delete = notes_to_delete_result.scalars().all()
             
             await self.db.execute(
-                delete(Note).where(Note.uuid.in_(note_uuids_to_delete))
+                delete(Note).where(Note.id.in_(note_ids_to_delete), Note.user_id == self.note.user_id)
             )
+            self.db.after_commit(functools.partial(
+                self._remove_from_tag_index, self.note.user_id, note_ids_to_delete
+            ))
+            self.graph_changed = True
             
-
         titles_to_create: Set[str] = parsed_titles.difference(existing_titles)
+        new_children: list[Note] = []
     
         for child_title in titles_to_create:
             new_title = child_title
@@ -118,6 +173,23 @@ class NoteService:
                 uuid=str(uuid.uuid4())
             )
             self.db.add(new_child)
+            new_children.append(new_child)
+
+        if new_children:
+            self.graph_changed = True
+            self.db.after_commit(functools.partial(
+                self._add_to_tag_index, self.note.user_id, new_children
+            ))
+
+    @staticmethod
+    async def _add_to_tag_index(user_id: int, notes: list[Note]):
+        index = await TagIndex.for_user(user_id)
+        await index.notes_added(note.id for note in notes)
+
+    @staticmethod
+    async def _remove_from_tag_index(user_id: int, note_ids: list[int]):
+        index = await TagIndex.for_user(user_id)
+        await index.notes_removed(note_ids)
 
     async def _handle_links(self):
         """
@@ -130,29 +202,46 @@ class NoteService:
         :return: None
         """
         await self.db.execute(
-            delete(CrossLink).where(CrossLink.note_id == self.note.id)
+            delete(CrossLink).where(CrossLink.note_id == self.note.id, CrossLink.user_id == self.note.user_id)
         )
+
+        if self.previous_content is None:
+            self.graph_changed = True
+        else:
+            # Dangling links count too, so the parsed links are compared rather than the resolved ones
+            previous_links = NoteParser(self.previous_content).parse_links()
+            self.graph_changed |= (
+                {target: link.title for target, link in previous_links.items()}
+                != {target: link.title for target, link in self.parsed_links.items()}
+            )
         
         if not self.parsed_links:
             return
 
-        
-        link_uuids = list(self.parsed_links.keys())
+        # Only uuids can match a note, anything else ([site](https://...)) would fail the cast.
+        # Targets are compared in canonical form, so an uppercase or unhyphenated uuid links too.
+        link_uuids = {target: _parse_uuid(target) for target in self.parsed_links}
+        if not any(link_uuids.values()):
+            return
         result = await self.db.execute(
             select(Note.id, Note.uuid).where(
-                Note.uuid.in_(link_uuids),
+                Note.uuid.in_({canonical for canonical in link_uuids.values() if canonical}),
                 Note.user_id == self.note.user_id
             )
         )
         note_map = {str(uuid): id for id, uuid in result.all()}
 
         links_to_create = []
-        for link_uuid, link_title in self.parsed_links.items():
-            if link_uuid in note_map:
+        for link_uuid, link in self.parsed_links.items():
+            if link_uuids[link_uuid] in note_map:
                 links_to_create.append(CrossLink(
                     note_id=self.note.id,
-                    linked_note_id=note_map[link_uuid],
-                    title=link_title or f"Link to {link_uuid}"
+                    linked_note_id=note_map[link_uuids[link_uuid]],
+                    user_id=self.note.user_id,
+                    title=link.title or f"Link to {link_uuid}",
+                    offset_start=link.start,
+                    offset_end=link.end,
+                    snippet=link.snippet
                 ))
 
         if links_to_create:
@@ -2,10 +2,42 @@ from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from api.core.models import Note
+from dataclasses import dataclass
 from typing import List, Optional
 import re
 from api.notes.schemas import NoteChildRead, NoteLinkRead, NoteRead, NoteTagRead
 
+# Characters of content kept on each side of a link in its backlink snippet
+LINK_CONTEXT_CHARS = 80
+# Longest snippet stored, fits CrossLink.snippet
+LINK_SNIPPET_MAX = 300
+
+
+@dataclass(frozen=True)
+class ParsedLink:
+    """
+    A [title](uuid) link: its text, character offsets in the content and the text around it
+    """
+    title: str
+    start: int
+    end: int
+    snippet: str
+
+
+def link_snippet(content: str, start: int, end: int) -> str:
+    """
+    The link with up to LINK_CONTEXT_CHARS of content on each side, on one line,
+    with "…" where the content was cut
+    """
+    left, right = max(0, start - LINK_CONTEXT_CHARS), min(len(content), end + LINK_CONTEXT_CHARS)
+    snippet = " ".join(content[left:right].split())
+    cut = right < len(content)
+    if len(snippet) > LINK_SNIPPET_MAX - 2:
+        # only a very long link text gets here
+        snippet = snippet[:LINK_SNIPPET_MAX - 2]
+        cut = True
+    return f"{'…' if left > 0 else ''}{snippet}{'…' if cut else ''}"
+
 
 
 class NoteParser:
@@ -28,13 +60,20 @@ class NoteParser:
         tags = re.findall(pattern, self.content)
         return [tag for tag in tags if tag] 
 
-    def parse_links(self) -> dict[str, str]:
+    def parse_links(self) -> dict[str, ParsedLink]:
         """
-        Parses links like [Title](uuid) and returns {uuid: title}
+        Parses links like [Title](uuid) and returns {uuid: ParsedLink}, the last link to a uuid wins
         """
         pattern = r'\[([^\]]+)\]\(([^)]+)\)'
-        matches = re.findall(pattern, self.content)
-        return {m[1].strip(): m[0].strip() for m in matches}
+        return {
+            m.group(2).strip(): ParsedLink(
+                title=m.group(1).strip(),
+                start=m.start(),
+                end=m.end(),
+                snippet=link_snippet(self.content, m.start(), m.end())
+            )
+            for m in re.finditer(pattern, self.content)
+        }
 
     def parse_children(self) -> List[str]:
         """
@@ -77,6 +116,7 @@ def create_note_read_response(note_obj: Note) -> NoteRead:
         updated_at=note_obj.updated_at,
         user_id=note_obj.user_id,
         parent_id=note_obj.parent_id,
+        processing_state=note_obj.processing_state or "done",  # the column default, unset until the note is flushed
         children_read=children,
         tags_read=tags,
         links_read=links
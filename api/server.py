@@ -0,0 +1,53 @@
+"""
+Runs the API with uvicorn configured from Settings.
+
+Usage:
+    python -m api.server
+
+production: several workers (one per CPU core unless WEB_WORKERS is set), uvloop and httptools,
+    keep-alive, backlog and concurrency limits from settings, no reload.
+    On SIGTERM workers stop accepting connections, drain in-flight requests for up to
+    WEB_GRACEFUL_TIMEOUT seconds and dispose the DB engine and the Redis pool (see lifespan).
+development: a single worker with --reload, as before.
+"""
+import logging
+import os
+import uvicorn
+from api.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_count() -> int:
+    # Respects CPU affinity (e.g. docker --cpuset-cpus), os.cpu_count() does not
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main():
+    if not settings.is_production:
+        uvicorn.run("api.main:app", host=settings.web_host, port=settings.web_port, reload=True)
+        return
+
+    if settings.debug:
+        logger.warning("DEBUG is on in production, tracebacks and debug headers are exposed")
+
+    uvicorn.run(
+        "api.main:app",
+        host=settings.web_host,
+        port=settings.web_port,
+        workers=settings.web_workers or cpu_count(),
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=settings.web_keep_alive,
+        backlog=settings.web_backlog,
+        limit_concurrency=settings.web_limit_concurrency,
+        timeout_graceful_shutdown=settings.web_graceful_timeout,
+        proxy_headers=True,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
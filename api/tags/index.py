@@ -0,0 +1,363 @@
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Iterable
+from uuid import uuid4
+from redis.exceptions import RedisError
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.cache import CacheBackend, CachePipeline, get_cache
+from api.core.config import settings
+from api.core.models import Note, Tag, note_tags
+from api.tags.query import And, Not, Or, TagExpression, TagTerm
+
+# SADD/ZADD arguments per command when an index is rebuilt
+_CHUNK = 10_000
+# Prefix matches ranked by usage per suggestion request, the rest are not considered
+SUGGEST_CANDIDATES = 500
+
+
+def _marker_ttl(ttl: int) -> int:
+    """
+    The ready marker expires before the data it marks, a minute before unless the TTL is short
+    """
+    return max(1, ttl - min(60, ttl // 2))
+
+
+class _UserIndex(ABC):
+    """
+    Cache structures of one user that are rebuilt from the database when the ready marker is gone.
+    Updates are applied only while the index is built, otherwise the next read builds it.
+
+    Every update bumps the version, built or not. A rebuild that sees the version move while
+    it read the database marks its snapshot as not ready again (it may miss that update),
+    the next read rebuilds it.
+    """
+    prefix: str
+
+    def __init__(self, cache: CacheBackend, user_id: int):
+        self.cache = cache
+        self.user_id = user_id
+
+    @classmethod
+    async def for_user(cls, user_id: int):
+        return cls(await get_cache(), user_id)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{self.user_id}:{name}"
+
+    @property
+    def ready_key(self) -> str:
+        return self._key("ready")
+
+    @property
+    def version_key(self) -> str:
+        return self._key("version")
+
+    async def rebuild(self, db: AsyncSession):
+        started_at = await self.cache.get(self.version_key)
+        async with self.cache.pipeline() as pipe:
+            await self._fill(db, pipe)
+            # the marker goes last and expires first, so a partial index is never used
+            pipe.set(self.ready_key, 1, ex=_marker_ttl(settings.tag_index_ttl))
+            pipe.incr(self.version_key)
+            pipe.expire(self.version_key, settings.tag_index_ttl)
+        # An update that bumped the version before the marker was set was skipped.
+        # Updates after it see the marker and are applied on top of the snapshot.
+        if pipe.results[-2] != (started_at or 0) + 1:
+            await self.invalidate()
+
+    @abstractmethod
+    async def _fill(self, db: AsyncSession, pipe: CachePipeline):
+        """
+        Reads the index from the database and queues the cache writes that replace it
+        """
+
+    async def _apply(self, ops: Iterable[tuple]):
+        """
+        Queues (op, *args) cache operations in one pipeline if the index is built
+        """
+        try:
+            async with self.cache.pipeline() as pipe:
+                pipe.incr(self.version_key)
+                pipe.expire(self.version_key, settings.tag_index_ttl)
+                pipe.exists(self.ready_key)
+            if not pipe.results[-1]:
+                return
+            async with self.cache.pipeline() as pipe:
+                for op, *args in ops:
+                    getattr(pipe, op)(*args)
+        except RedisError:
+            # The commit is done already, drop the index so it is rebuilt from the database
+            await self.invalidate()
+
+    async def invalidate(self):
+        try:
+            await self.cache.delete(self.ready_key)
+        except RedisError:
+            pass
+
+
+class TagIndex(_UserIndex):
+    """
+    Per-user inverted index in the cache: tag id -> set of note ids, plus the set of all note ids.
+
+    Built from the database on first use and kept up to date after commits by NoteService,
+    NoteDeleteService and the tag endpoints. Everything expires after settings.tag_index_ttl,
+    the next query rebuilds it, which also drops ids left behind by missed updates.
+    Ids of deleted notes may linger in tag sets, results are always intersected with the
+    set of all notes, which is kept exact.
+    """
+
+    prefix = "tagidx"
+
+    @property
+    def all_key(self) -> str:
+        return self._key("all")
+
+    def tag_key(self, tag_id: int) -> str:
+        return self._key(f"tag:{tag_id}")
+
+    async def _fill(self, db: AsyncSession, pipe: CachePipeline):
+        tag_ids = (await db.execute(
+            select(Tag.id).where(Tag.user_id == self.user_id)
+        )).scalars().all()
+        note_ids = (await db.execute(
+            select(Note.id).where(Note.user_id == self.user_id)
+        )).scalars().all()
+        pairs = (await db.execute(
+            select(note_tags.c.tag_id, note_tags.c.note_id)
+            .where(note_tags.c.user_id == self.user_id)
+        )).all()
+
+        members: dict[int, list[str]] = {}
+        for tag_id, note_id in pairs:
+            members.setdefault(tag_id, []).append(str(note_id))
+
+        keys = [self.all_key, *(self.tag_key(tag_id) for tag_id in tag_ids)]
+        pipe.delete(self.ready_key, *keys)
+        for key, values in [(self.all_key, list(map(str, note_ids))), *(
+            (self.tag_key(tag_id), values) for tag_id, values in members.items()
+        )]:
+            for start in range(0, len(values), _CHUNK):
+                pipe.sadd(key, *values[start:start + _CHUNK])
+            pipe.expire(key, settings.tag_index_ttl)
+
+    async def query(
+        self,
+        expression: TagExpression,
+        tag_ids: dict[str, int],
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int | None = None
+    ) -> list[int]:
+        """
+        A page of the note ids matching the expression, newest (highest id) first
+
+        Args:
+            expression (TagExpression): parsed query
+            tag_ids (dict[str, int]): tag name -> id for the user's tags used in the query
+            db (AsyncSession): used when the index has to be rebuilt
+            skip (int): ids to skip
+            limit (int | None): ids to return, all of the rest if None
+        """
+        _, sorted_key = await self._result(expression, tag_ids, db)
+        members = await self.cache.lrange(sorted_key, skip, skip + limit - 1 if limit else -1)
+        return list(map(int, members))
+
+    async def matching(
+        self,
+        expression: TagExpression,
+        tag_ids: dict[str, int],
+        note_ids: list[int],
+        db: AsyncSession
+    ) -> list[int]:
+        """
+        The note_ids that match the expression, in their order
+        """
+        result_key, _ = await self._result(expression, tag_ids, db)
+        flags = await self.cache.smismember(result_key, list(map(str, note_ids)))
+        return [note_id for note_id, flag in zip(note_ids, flags) if flag]
+
+    async def _result(
+        self,
+        expression: TagExpression,
+        tag_ids: dict[str, int],
+        db: AsyncSession
+    ) -> tuple[str, str]:
+        """
+        Keys of the set of note ids matching the expression and of the list of them sorted
+        newest first. Computed in the cache with set operations and kept for
+        settings.tag_query_result_ttl; the keys include the index version, so any update
+        makes the next query compute them again.
+        """
+        async with self.cache.pipeline() as pipe:
+            pipe.exists(self.ready_key)
+            pipe.get(self.version_key)
+        ready, version = pipe.results
+        if not ready:
+            await self.rebuild(db)
+            version = await self.cache.get(self.version_key)
+
+        digest = hashlib.sha1(repr((expression, sorted(tag_ids.items()))).encode()).hexdigest()
+        result_key = self._key(f"result:{version}:{digest}")
+        sorted_key = f"{result_key}:sorted"
+        if await self.cache.exists(result_key):
+            return result_key, sorted_key
+
+        ttl = settings.tag_query_result_ttl
+        temporary: list[str] = []
+        async with self.cache.pipeline() as pipe:
+            matches = self._compile(expression, tag_ids, pipe, temporary)
+            # Ids of deleted notes may linger in tag sets, the set of all notes is exact.
+            # SINTER walks the smaller set, this costs as much as the matches, not the vault.
+            pipe.sinterstore(result_key, matches, self.all_key)
+            pipe.sort(result_key, desc=True, store=sorted_key)
+            pipe.expire(result_key, ttl)
+            pipe.expire(sorted_key, ttl)
+            pipe.delete(*temporary)
+        return result_key, sorted_key
+
+    def _compile(
+        self,
+        expression: TagExpression,
+        tag_ids: dict[str, int],
+        pipe: CachePipeline,
+        temporary: list[str]
+    ) -> str:
+        """
+        Queues the set operations that evaluate expression and returns the key of the result.
+        The set of all notes is used only for NOT outside of an AND with a positive term.
+        """
+        def store(op: str, *keys: str) -> str:
+            dest = self._key(f"tmp:{uuid4().hex}")
+            temporary.append(dest)
+            getattr(pipe, op)(dest, *keys)
+            return dest
+
+        def key_of(expression: TagExpression) -> str:
+            return self._compile(expression, tag_ids, pipe, temporary)
+
+        match expression:
+            case TagTerm(name):
+                # Unknown tags match nothing, a key that is never written reads as an empty set
+                return self.tag_key(tag_ids[name]) if name in tag_ids else self._key("tag:none")
+            case Or(operands):
+                return store("sunionstore", *map(key_of, operands))
+            case Not(operand):
+                return store("sdiffstore", self.all_key, key_of(operand))
+            case And(operands):
+                included = [key_of(operand) for operand in operands if not isinstance(operand, Not)]
+                excluded = [key_of(operand.operand) for operand in operands if isinstance(operand, Not)]
+                if not included:
+                    included = [self.all_key]
+                matches = included[0] if len(included) == 1 else store("sinterstore", *included)
+                return store("sdiffstore", matches, *excluded) if excluded else matches
+
+    async def note_changed(self, note_id: int, removed_tags: Iterable[int], added_tags: Iterable[int]):
+        member = str(note_id)
+        await self._apply([
+            ("sadd", self.all_key, member),
+            *(("srem", self.tag_key(tag_id), member) for tag_id in removed_tags),
+            *(("sadd", self.tag_key(tag_id), member) for tag_id in added_tags),
+        ])
+
+    async def notes_added(self, note_ids: Iterable[int]):
+        await self._apply([("sadd", self.all_key, *map(str, note_ids))])
+
+    async def notes_removed(self, note_ids: Iterable[int]):
+        await self._apply([("srem", self.all_key, *map(str, note_ids))])
+
+    async def tag_removed(self, tag_id: int):
+        await self._apply([("delete", self.tag_key(tag_id))])
+
+
+class TagSuggestIndex(_UserIndex):
+    """
+    Per-user tag names for prefix autocomplete: a sorted set of names with equal scores
+    for ZRANGEBYLEX, and a sorted set of names scored by their note count for ranking.
+
+    Built from the database on first use and updated after commits by NoteService and the
+    tag endpoints. Deleted notes do not lower the counts, they are exact again after the
+    rebuild that follows settings.tag_index_ttl.
+    """
+    prefix = "tagsug"
+
+    @property
+    def names_key(self) -> str:
+        return self._key("names")
+
+    @property
+    def usage_key(self) -> str:
+        return self._key("usage")
+
+    async def _fill(self, db: AsyncSession, pipe: CachePipeline):
+        note_count = func.count(note_tags.c.note_id)
+        rows = (await db.execute(
+            select(Tag.name, note_count)
+            .outerjoin(note_tags, and_(note_tags.c.tag_id == Tag.id, note_tags.c.user_id == Tag.user_id))
+            .where(Tag.user_id == self.user_id)
+            .group_by(Tag.id)
+        )).all()
+
+        pipe.delete(self.ready_key, self.names_key, self.usage_key)
+        for start in range(0, len(rows), _CHUNK):
+            chunk = rows[start:start + _CHUNK]
+            pipe.zadd(self.names_key, {name: 0 for name, _ in chunk})
+            pipe.zadd(self.usage_key, {name: count for name, count in chunk})
+        pipe.expire(self.names_key, settings.tag_index_ttl)
+        pipe.expire(self.usage_key, settings.tag_index_ttl)
+
+    async def suggest(self, prefix: str, limit: int, db: AsyncSession) -> list[tuple[str, int]]:
+        """
+        Tag names starting with prefix, most used first, with their note counts.
+        An empty prefix gives the most used tags.
+
+        Args:
+            prefix (str): typed part of the tag name
+            limit (int): number of names to return
+            db (AsyncSession): used when the index has to be rebuilt
+        """
+        if not await self.cache.exists(self.ready_key):
+            await self.rebuild(db)
+
+        if prefix:
+            # The highest code point sorts after every name that starts with prefix
+            names = await self.cache.zrangebylex(
+                self.names_key, f"[{prefix}", f"[{prefix}\U0010ffff", 0, SUGGEST_CANDIDATES
+            )
+            scored = zip(names, await self.cache.zmscore(self.usage_key, names))
+        else:
+            scored = await self.cache.zrevrange(self.usage_key, 0, limit - 1, withscores=True)
+
+        ranked = sorted(scored, key=lambda item: (-(item[1] or 0), item[0]))
+        return [(name, int(count or 0)) for name, count in ranked[:limit]]
+
+    async def tags_used(self, added: Iterable[str], removed: Iterable[str]):
+        """
+        A note started using the added tags (created if new) and stopped using the removed ones
+        """
+        await self._apply([
+            *(("zadd", self.names_key, {name: 0}) for name in added),
+            *(("zincrby", self.usage_key, 1, name) for name in added),
+            *(("zincrby", self.usage_key, -1, name) for name in removed),
+        ])
+
+    async def tag_created(self, name: str):
+        await self._apply([
+            ("zadd", self.names_key, {name: 0}),
+            ("zincrby", self.usage_key, 0, name),
+        ])
+
+    async def tag_renamed(self, old_name: str, new_name: str, note_count: int):
+        await self._apply([
+            ("zrem", self.names_key, old_name),
+            ("zrem", self.usage_key, old_name),
+            ("zadd", self.names_key, {new_name: 0}),
+            ("zadd", self.usage_key, {new_name: note_count}),
+        ])
+
+    async def tag_removed(self, name: str):
+        await self._apply([
+            ("zrem", self.names_key, name),
+            ("zrem", self.usage_key, name),
+        ])
@@ -0,0 +1,131 @@
+import re
+from dataclasses import dataclass
+
+MAX_QUERY_LENGTH = 1000
+MAX_QUERY_TAGS = 50
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|(#?[A-Za-z0-9_]+))")
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TagTerm:
+    name: str
+
+@dataclass(frozen=True)
+class Not:
+    operand: "TagExpression"
+
+@dataclass(frozen=True)
+class And:
+    operands: tuple["TagExpression", ...]
+
+@dataclass(frozen=True)
+class Or:
+    operands: tuple["TagExpression", ...]
+
+TagExpression = TagTerm | Not | And | Or
+
+
+def _tokenize(query: str) -> list[str]:
+    tokens, position = [], 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if not match:
+            raise TagQueryError(f"Unexpected character at position {position}: {query[position]!r}")
+        tokens.append(match.group(match.lastindex))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent over:
+        or   := and ("OR" and)*
+        and  := not (["AND"] not)*      adjacent terms are ANDed
+        not  := "NOT" not | "(" or ")" | tag
+    """
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise TagQueryError("Unexpected end of query")
+        self.position += 1
+        return token
+
+    def parse(self) -> TagExpression:
+        expression = self.parse_or()
+        if self.peek() is not None:
+            raise TagQueryError(f"Unexpected {self.peek()!r}")
+        return expression
+
+    def parse_or(self) -> TagExpression:
+        operands = [self.parse_and()]
+        while (token := self.peek()) and token.upper() == "OR":
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def parse_and(self) -> TagExpression:
+        operands = [self.parse_not()]
+        while (token := self.peek()) and token != ")" and token.upper() != "OR":
+            if token.upper() == "AND":
+                self.take()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def parse_not(self) -> TagExpression:
+        token = self.take()
+        if token.upper() == "NOT":
+            return Not(self.parse_not())
+        if token == "(":
+            expression = self.parse_or()
+            if self.take() != ")":
+                raise TagQueryError("Missing ')'")
+            return expression
+        if token == ")" or token.upper() in _OPERATORS:
+            raise TagQueryError(f"Expected a tag, got {token!r}")
+        # "#and" is the tag "and", without # it would be the operator
+        return TagTerm(token.removeprefix("#"))
+
+
+def parse_tag_query(query: str) -> TagExpression:
+    """
+    Parses a boolean tag expression, e.g. "python AND (async OR NOT draft)".
+    Operators are case-insensitive, a tag named like an operator is written with #.
+
+    Raises:
+        TagQueryError: the query is malformed or too big
+    """
+    if len(query) > MAX_QUERY_LENGTH:
+        raise TagQueryError(f"Query is longer than {MAX_QUERY_LENGTH} characters")
+    tokens = _tokenize(query)
+    if not tokens:
+        raise TagQueryError("Empty query")
+    expression = _Parser(tokens).parse()
+    if len(tag_names(expression)) > MAX_QUERY_TAGS:
+        raise TagQueryError(f"Query uses more than {MAX_QUERY_TAGS} tags")
+    return expression
+
+
+def tag_names(expression: TagExpression) -> set[str]:
+    match expression:
+        case TagTerm(name):
+            return {name}
+        case Not(operand):
+            return tag_names(operand)
+        case And(operands) | Or(operands):
+            return set().union(*map(tag_names, operands))
+
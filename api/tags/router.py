@@ -1,19 +1,26 @@
+import functools
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, select
+from sqlalchemy import and_, func, or_, select
 from api.auth.schemas import UserOut
 from api.core.db import get_session
+from api.core.idempotency import IdempotentRoute
 from api.core.models import Note, Tag, note_tags
+from api.core.streaming import NDJSON_RESPONSES, stream_rows, wants_ndjson
+from api.notes.read_cache import NoteReadCache
 from api.notes.schemas import NoteShallowRead
-from api.tags.schemas import TagCreate, TagRead
-from typing import List
-from api.tags.utils import get_tag_by
-from api.auth.services.auth_service import get_current_user
+from api.tags.index import TagIndex, TagSuggestIndex
+from api.tags.schemas import TagCreate, TagMerge, TagRead, TagRewriteRead, TagSuggestion, TagWithCount
+from api.tags.services.tag_rewrite_service import TAG_NAME, TagRewriteService
+from typing import Annotated, List, Literal, Optional
+from api.tags.utils import decode_cursor, encode_cursor, get_tag_by
+from api.auth.services.auth_service import get_current_user, get_read_session
 
 router = APIRouter(
     prefix="/tags",
     tags=["tags"],
+    route_class=IdempotentRoute,
 )
 
 @router.post("/", response_model=TagRead)
@@ -41,40 +48,167 @@ async def create_tag(
     )
     
     db.add(tag)
+    db.after_commit(functools.partial(_add_to_suggest_index, user.id, tag.name))
     await db.commit()
     await db.refresh(tag)
     return tag
 
-@router.get("/", response_model=List[TagRead])
+@router.get("/", response_model=List[TagWithCount], responses=NDJSON_RESPONSES)
 async def get_tags(
-    db: AsyncSession = Depends(get_session),
-    user: UserOut = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+    sort: Annotated[Literal["name", "usage"], Query(description="By name or by note count, most used first")] = "name",
+    limit: Annotated[int, Query(ge=1, le=5000, description="Number of items to return")] = 100,
+    cursor: Annotated[Optional[str], Query(description="X-Next-Cursor of the previous page")] = None,
 ):
-    result = await db.execute(select(Tag).where(Tag.user_id == user.id))
-    return result.scalars().all()
+    """
+    Keyset-paginated list of the user's tags with their note counts.
+
+    The counts come from one grouped join over note_tags (index-only scan of ix_note_tags_tag_id).
+    If there are more tags, the X-Next-Cursor response header holds the cursor of the next page.
+    With Accept: application/x-ndjson all tags after the cursor are streamed, one per line.
+    """
+    note_count = func.count(note_tags.c.note_id).label("note_count")
+    counted = (
+        select(Tag.id, note_count)
+        .select_from(Tag)
+        .outerjoin(note_tags, and_(note_tags.c.tag_id == Tag.id, note_tags.c.user_id == Tag.user_id))
+        .where(Tag.user_id == user.id)
+        .group_by(Tag.id)
+        .subquery()
+    )
+    query = select(Tag, counted.c.note_count).join(counted, counted.c.id == Tag.id)
+
+    if sort == "name":
+        if cursor:
+            after = decode_cursor(cursor, {"name": str})
+            query = query.where(Tag.name > after["name"])
+        query = query.order_by(Tag.name)
+    else:
+        if cursor:
+            after = decode_cursor(cursor, {"count": int, "name": str})
+            query = query.where(or_(
+                counted.c.note_count < after["count"],
+                and_(counted.c.note_count == after["count"], Tag.name > after["name"])
+            ))
+        query = query.order_by(counted.c.note_count.desc(), Tag.name)
+
+    if wants_ndjson(request):
+        return stream_rows(db, query, lambda row: TagWithCount(
+            id=row.Tag.id, uuid=row.Tag.uuid, name=row.Tag.name, note_count=row.note_count
+        ))
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    page = rows[:limit]
+
+    if len(rows) > limit:
+        last, last_count = page[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            {"name": last.name} if sort == "name" else {"count": last_count, "name": last.name}
+        )
+
+    return [
+        TagWithCount(id=tag.id, uuid=tag.uuid, name=tag.name, note_count=count)
+        for tag, count in page
+    ]
+
+
+@router.get("/suggest", response_model=List[TagSuggestion])
+async def suggest_tags(
+    db: AsyncSession = Depends(get_read_session),
+    user: UserOut = Depends(get_current_user),
+    prefix: Annotated[str, Query(max_length=50, description="Typed part of the tag name")] = "",
+    limit: Annotated[int, Query(ge=1, le=50, description="Number of items to return")] = 10,
+):
+    """
+    Tag autocomplete: names starting with prefix, most used first.
+    Served from the user's TagSuggestIndex in the cache, the database is read only to build it.
+    """
+    index = await TagSuggestIndex.for_user(user.id)
+    return [
+        TagSuggestion(name=name, note_count=count)
+        for name, count in await index.suggest(prefix, limit, db)
+    ]
 
 
 @router.get("/{tag_uuid}", response_model=TagRead)
 async def get_tag(
     tag_uuid: UUID,
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user)
 ):
     tag = await get_tag_by("uuid", tag_uuid, user_id=user.id, db=db)
     return tag
 
-@router.put("/{tag_uuid}", response_model=TagRead)
+@router.put("/{tag_uuid}", response_model=TagRewriteRead)
 async def update_tag(
     tag_uuid: UUID,
     tag_in: TagCreate,
     db: AsyncSession = Depends(get_session),
     user: UserOut = Depends(get_current_user)
 ):
+    """
+    Renames the tag and rewrites "#old" to "#new" in the content of its notes.
+    To rename to the name of another tag, merge the tags instead.
+    """
     tag = await get_tag_by("uuid", tag_uuid, user_id=user.id, db=db)
-    tag.name = tag_in.name
+    if tag_in.name == tag.name:
+        return TagRewriteRead(id=tag.id, uuid=tag.uuid, name=tag.name, notes_rewritten=0)
+    if not TAG_NAME.fullmatch(tag_in.name):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tag name may only contain letters, digits and underscores"
+        )
+
+    existing_tag = await db.execute(select(Tag.id).where(
+        and_(
+            Tag.name == tag_in.name,
+            Tag.user_id == user.id
+        )
+    ))
+    if existing_tag.scalar_one_or_none():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tag with this name already exists, merge the tags instead"
+        )
+
+    old_name = tag.name
+    rewritten = await TagRewriteService(db).rename(tag, tag_in.name)
+    suggest_index = await TagSuggestIndex.for_user(user.id)
+    db.after_commit(functools.partial(suggest_index.tag_renamed, old_name, tag_in.name, rewritten))
+    db.after_commit((await NoteReadCache.for_user(user.id)).invalidate)
     await db.commit()
     await db.refresh(tag)
-    return tag
+    return TagRewriteRead(id=tag.id, uuid=tag.uuid, name=tag.name, notes_rewritten=rewritten)
+
+@router.post("/{tag_uuid}/merge", response_model=TagRewriteRead)
+async def merge_tag(
+    tag_uuid: UUID,
+    merge_in: TagMerge,
+    db: AsyncSession = Depends(get_session),
+    user: UserOut = Depends(get_current_user)
+):
+    """
+    Merges the tag into the target tag: its notes get the target tag and "#source"
+    in their content becomes "#target", then the tag is deleted.
+    """
+    source = await get_tag_by("uuid", tag_uuid, user_id=user.id, db=db)
+    target = await get_tag_by("uuid", merge_in.target_uuid, user_id=user.id, db=db)
+    if source.id == target.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot merge a tag into itself"
+        )
+
+    rewritten = await TagRewriteService(db).merge(source, target)
+    # Notes moved between tags, the indexes are rebuilt on the next read
+    db.after_commit((await TagIndex.for_user(user.id)).invalidate)
+    db.after_commit((await TagSuggestIndex.for_user(user.id)).invalidate)
+    db.after_commit((await NoteReadCache.for_user(user.id)).invalidate)
+    await db.commit()
+    return TagRewriteRead(id=target.id, uuid=target.uuid, name=target.name, notes_rewritten=rewritten)
 
 @router.delete("/{tag_uuid}", status_code=status.HTTP_200_OK)
 async def delete_tag(
@@ -84,18 +218,33 @@ async def delete_tag(
 ):
     tag = await get_tag_by("uuid", tag_uuid, user_id=user.id, db=db)
     await db.delete(tag)
+    db.after_commit(functools.partial(_remove_from_tag_indexes, user.id, tag.id, tag.name))
+    db.after_commit((await NoteReadCache.for_user(user.id)).invalidate)
     await db.commit()
     return {"ok": True}
 
 
-@router.get('/{tag_uuid}/notes', response_model=list[NoteShallowRead])
+async def _add_to_suggest_index(user_id: int, name: str):
+    suggest_index = await TagSuggestIndex.for_user(user_id)
+    await suggest_index.tag_created(name)
+
+async def _remove_from_tag_indexes(user_id: int, tag_id: int, name: str):
+    index = await TagIndex.for_user(user_id)
+    await index.tag_removed(tag_id)
+    suggest_index = await TagSuggestIndex.for_user(user_id)
+    await suggest_index.tag_removed(name)
+
+
+@router.get('/{tag_uuid}/notes', response_model=list[NoteShallowRead], responses=NDJSON_RESPONSES)
 async def get_tag_notes(
+    request: Request,
     tag_uuid: UUID,
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(get_read_session),
     user: UserOut = Depends(get_current_user),
 ):
     """
-    Returns a list of notes associated with the given tag uuid.
+    Returns a list of notes associated with the given tag uuid,
+    streamed one per line with Accept: application/x-ndjson.
     """
     tag = await get_tag_by("uuid", tag_uuid, user_id=user.id, db=db)
     if not tag:
@@ -104,7 +253,9 @@ async def get_tag_notes(
             detail="Tag not found"
         )
     
-    notes_stmt = select(Note).join(note_tags).where(note_tags.c.tag_id == tag.id)
+    notes_stmt = select(Note).join(note_tags).where(note_tags.c.tag_id == tag.id, Note.user_id == user.id)
+    if wants_ndjson(request):
+        return stream_rows(db, notes_stmt, lambda row: NoteShallowRead.model_validate(row.Note))
     result = await db.execute(notes_stmt)
     notes = result.scalars().all()
     
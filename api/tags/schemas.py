@@ -12,4 +12,17 @@ class TagCreate(TagBase):
 class TagRead(TagBase):
     id: int
     uuid: UUID
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class TagWithCount(TagRead):
+    note_count: int
+
+class TagMerge(BaseModel):
+    target_uuid: UUID
+
+class TagRewriteRead(TagRead):
+    notes_rewritten: int
+
+class TagSuggestion(BaseModel):
+    name: str
+    note_count: int
@@ -0,0 +1,127 @@
+import logging
+import re
+from typing import Callable
+from sqlalchemy import ARRAY, Integer, any_, bindparam, delete, exists, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.config import settings
+from api.core.models import Note, Tag, note_tags
+
+logger = logging.getLogger(__name__)
+
+# What NoteParser.parse_tags reads after "#", a new name has to match it to survive the next parse
+TAG_NAME = re.compile(r"[a-zA-Z0-9_]+")
+
+
+class TagRewriteService:
+    """
+    Renames and merges tags, rewriting "#name" in the content of every tagged note.
+
+    The notes are never loaded: their ids are read in chunks of settings.tag_rewrite_chunk_size
+    from note_tags (keyset on note_id) and every chunk is rewritten by one UPDATE with
+    regexp_replace. All chunks run in the caller's transaction, so the rename or merge is
+    atomic, the chunks only bound the size of each statement and mark progress.
+    updated_at is left as is, a tag rename is not an edit of the note.
+    """
+
+    def __init__(
+        self,
+        db_session: AsyncSession,
+        progress: Callable[[int, int], None] | None = None
+    ):
+        """
+        Args:
+            db_session (AsyncSession): session of the caller, which commits
+            progress (Callable[[int, int], None] | None): called with (done, total) notes after every chunk
+        """
+        self.db = db_session
+        self.progress = progress or self._log_progress
+        self.chunk_size = settings.tag_rewrite_chunk_size
+
+    @staticmethod
+    def _log_progress(done: int, total: int):
+        logger.info("Tag rewrite: %d/%d notes", done, total)
+
+    async def _rewrite_content(self, tag: Tag, new_name: str) -> int:
+        """
+        Replaces "#<tag.name>" with "#<new_name>" in all notes tagged with tag
+
+        Returns:
+            int: number of rewritten notes
+        """
+        # The name is matched whole: renaming "py" must not touch "#python"
+        pattern = f"#{re.escape(tag.name)}(?![a-zA-Z0-9_])"
+        total = await self.db.scalar(
+            select(func.count()).select_from(note_tags).where(
+                note_tags.c.tag_id == tag.id, note_tags.c.user_id == tag.user_id
+            )
+        )
+        chunk_stmt = (
+            select(note_tags.c.note_id)
+            .where(
+                note_tags.c.tag_id == tag.id,
+                note_tags.c.user_id == tag.user_id,
+                note_tags.c.note_id > bindparam("after")
+            )
+            .order_by(note_tags.c.note_id)
+            .limit(self.chunk_size)
+        )
+        rewrite_stmt = (
+            update(Note)
+            .where(Note.id == any_(bindparam("note_ids", type_=ARRAY(Integer))), Note.user_id == tag.user_id)
+            .values(
+                content=func.regexp_replace(Note.content, pattern, f"#{new_name}", "g"),
+                updated_at=Note.updated_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        done, after = 0, 0
+        while True:
+            note_ids = (await self.db.execute(chunk_stmt, {"after": after})).scalars().all()
+            if not note_ids:
+                break
+            await self.db.execute(rewrite_stmt, {"note_ids": note_ids})
+            done, after = done + len(note_ids), note_ids[-1]
+            self.progress(done, total)
+        return done
+
+    async def rename(self, tag: Tag, new_name: str) -> int:
+        """
+        Renames tag to new_name, which must match TAG_NAME and not be taken by another tag of the user
+
+        Returns:
+            int: number of rewritten notes
+        """
+        rewritten = await self._rewrite_content(tag, new_name)
+        await self.db.execute(
+            update(Tag).where(Tag.id == tag.id).values(name=new_name)
+        )
+        return rewritten
+
+    async def merge(self, source: Tag, target: Tag) -> int:
+        """
+        Moves the notes of source to target and deletes source.
+        A note tagged with both keeps a single association.
+
+        Returns:
+            int: number of rewritten notes
+        """
+        rewritten = await self._rewrite_content(source, target.name)
+
+        already_tagged = note_tags.alias("already_tagged")
+        await self.db.execute(
+            update(note_tags)
+            .where(
+                note_tags.c.tag_id == source.id,
+                note_tags.c.user_id == source.user_id,
+                ~exists().where(
+                    already_tagged.c.note_id == note_tags.c.note_id,
+                    already_tagged.c.user_id == source.user_id,
+                    already_tagged.c.tag_id == target.id
+                )
+            )
+            .values(tag_id=target.id)
+        )
+        # The associations left are the duplicates, the cascade removes them
+        await self.db.execute(delete(Tag).where(Tag.id == source.id))
+        return rewritten
@@ -1,3 +1,5 @@
+import base64
+import json
 from typing import Any
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -33,4 +35,31 @@ async def get_tag_by(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tag with {field_name} {field_value} not found"
         )
-    return tag
\ No newline at end of file
+    return tag
+
+
+def encode_cursor(values: dict[str, Any]) -> str:
+    """
+    Opaque keyset cursor: the sort key of the last returned row
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, types: dict[str, type]) -> dict[str, Any]:
+    """
+    The values of an encode_cursor cursor, 400 unless it has exactly the given keys
+    with values of exactly the given types (so no bool for an int)
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+    if (
+        not isinstance(values, dict)
+        or set(values) != set(types)
+        or any(type(values[key]) is not expected for key, expected in types.items())
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
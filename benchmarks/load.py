@@ -0,0 +1,309 @@
+"""
+HTTP load benchmark with weighted scenario mixes.
+
+Drives the ASGI app in-process through httpx.ASGITransport (no server, no network noise)
+or a running server with --url, and reports p50/p95/p99 latency and RPS per scenario.
+
+Usage:
+    python -m benchmarks.load --mix default --duration 30 --concurrency 16
+    python -m benchmarks.load --url http://localhost:8000 --mix read_heavy
+    python -m benchmarks.load --save benchmarks/baselines/default.json
+    python -m benchmarks.load --compare benchmarks/baselines/default.json --threshold 0.2
+
+In-process runs use the database and Redis from the environment (.env) and disable rate limiting.
+Against a URL the server's rate limits apply, so login storms there measure 429s too.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+import httpx
+from benchmarks.stats import compare, environment, load_json, save_json, summarize
+
+PASSWORD = "Password123"
+TAG_VOCABULARY = [f"topic{i}" for i in range(30)]
+
+# scenario name -> weight
+MIXES: dict[str, dict[str, int]] = {
+    "default": {
+        "login": 1, "note_read": 30, "list_paging": 25, "create_note": 10,
+        "deep_delete": 2, "tag_query": 10,
+    },
+    "read_heavy": {"note_read": 50, "list_paging": 40, "tag_query": 10},
+    "write_heavy": {"create_note": 70, "deep_delete": 10, "note_read": 20},
+    "auth": {"login": 1},
+}
+
+
+@dataclass
+class VirtualUser:
+    """
+    One benchmark user with its own account, token and notes
+    """
+    client: httpx.AsyncClient
+    name: str
+    rng: random.Random
+    headers: dict[str, str] = field(default_factory=dict)
+    notes: list[str] = field(default_factory=list)
+    tags: list[str] = field(default_factory=list)
+    counter: int = 0
+
+    @property
+    def email(self) -> str:
+        return f"{self.name}@bench.example.com"
+
+    def next_title(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix} {self.counter}"
+
+    def note_content(self, links: int = 1, children: int = 0) -> str:
+        tags = " ".join(f"#{tag}" for tag in self.rng.sample(TAG_VOCABULARY, 3))
+        parts = [f"Benchmark note body. {tags}", "lorem ipsum " * self.rng.randint(10, 100)]
+        for linked in self.rng.sample(self.notes, min(links, len(self.notes))):
+            parts.append(f"[see also]({linked})")
+        for _ in range(children):
+            parts.append(f"[[{self.next_title('Child')}]]")
+        return "\n".join(parts)
+
+    async def setup(self, seed_notes: int):
+        await self.client.post("/auth/register", json={
+            "username": self.name, "email": self.email, "password": PASSWORD
+        })
+        resp = await self.client.post("/auth/login", json={"email": self.email, "password": PASSWORD})
+        resp.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        for _ in range(seed_notes):
+            resp = await self.client.post(
+                "/notes/",
+                json={"title": self.next_title("Seed"), "content": self.note_content()},
+                headers=self.headers
+            )
+            resp.raise_for_status()
+            self.notes.append(resp.json()["uuid"])
+
+        resp = await self.client.get("/tags/", headers=self.headers)
+        self.tags = [tag["uuid"] for tag in resp.json()]
+
+
+@dataclass
+class Recorder:
+    """
+    Latency samples and errors per scenario
+    """
+    samples: defaultdict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: defaultdict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    @asynccontextmanager
+    async def timed(self, scenario: str) -> AsyncIterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        except (httpx.HTTPError, ScenarioError):
+            self.errors[scenario] += 1
+        else:
+            self.samples[scenario].append(time.perf_counter() - started_at)
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def expect(resp: httpx.Response, *codes: int) -> httpx.Response:
+    if resp.status_code not in codes:
+        raise ScenarioError(f"{resp.request.method} {resp.request.url.path}: {resp.status_code}")
+    return resp
+
+
+async def login(user: VirtualUser, rec: Recorder):
+    async with rec.timed("login"):
+        expect(await user.client.post(
+            "/auth/login", json={"email": user.email, "password": PASSWORD}
+        ), 200)
+
+
+async def note_read(user: VirtualUser, rec: Recorder):
+    async with rec.timed("note_read"):
+        expect(await user.client.get(f"/notes/{user.rng.choice(user.notes)}", headers=user.headers), 200)
+
+
+async def list_paging(user: VirtualUser, rec: Recorder):
+    pages = max(1, len(user.notes) // 20)
+    async with rec.timed("list_paging"):
+        expect(await user.client.get(
+            "/notes/",
+            params={"skip": user.rng.randrange(pages) * 20, "limit": 20},
+            headers=user.headers
+        ), 200)
+
+
+async def create_note(user: VirtualUser, rec: Recorder):
+    payload = {
+        "title": user.next_title("Note"),
+        "content": user.note_content(links=3, children=2),
+    }
+    async with rec.timed("create_note"):
+        resp = expect(await user.client.post("/notes/", json=payload, headers=user.headers), 201)
+        user.notes.append(resp.json()["uuid"])
+
+
+async def deep_delete(user: VirtualUser, rec: Recorder, depth: int = 4, fan_out: int = 2):
+    # The tree is built outside of the timed block, only the recursive delete is measured
+    resp = await user.client.post(
+        "/notes/",
+        json={"title": user.next_title("Root"), "content": user.note_content()},
+        headers=user.headers
+    )
+    root = expect(resp, 201).json()
+    level = [root["id"]]
+    for _ in range(depth):
+        next_level = []
+        for parent_id in level:
+            for _ in range(fan_out):
+                resp = await user.client.post("/notes/", json={
+                    "title": user.next_title("Node"),
+                    "content": user.note_content(links=0),
+                    "parent_id": parent_id,
+                }, headers=user.headers)
+                next_level.append(expect(resp, 201).json()["id"])
+        level = next_level
+
+    async with rec.timed("deep_delete"):
+        expect(await user.client.delete(f"/notes/{root['uuid']}", headers=user.headers), 200)
+
+
+async def tag_query(user: VirtualUser, rec: Recorder):
+    if not user.tags:
+        return
+    async with rec.timed("tag_query"):
+        expect(await user.client.get(f"/tags/{user.rng.choice(user.tags)}/notes", headers=user.headers), 200)
+
+
+SCENARIOS: dict[str, Callable[[VirtualUser, Recorder], Awaitable[None]]] = {
+    "login": login,
+    "note_read": note_read,
+    "list_paging": list_paging,
+    "create_note": create_note,
+    "deep_delete": deep_delete,
+    "tag_query": tag_query,
+}
+
+
+@asynccontextmanager
+async def make_client(url: str | None) -> AsyncIterator[httpx.AsyncClient]:
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            yield client
+        return
+
+    from api.core.config import settings
+    from api.main import app
+
+    settings.rate_limit_enabled = False
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not send lifespan events, the app's lifespan is entered explicitly
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+
+async def run(args: argparse.Namespace) -> dict:
+    mix = dict(MIXES[args.mix])
+    names, weights = list(mix), list(mix.values())
+    run_id = uuid.uuid4().hex[:8]
+    rec = Recorder()
+
+    async with make_client(args.url) as client:
+        users = [
+            VirtualUser(client, f"bench_{run_id}_{i}", random.Random(args.seed + i))
+            for i in range(args.concurrency)
+        ]
+        await asyncio.gather(*(user.setup(args.seed_notes) for user in users))
+
+        deadline = time.perf_counter() + args.duration
+
+        async def worker(user: VirtualUser):
+            while time.perf_counter() < deadline:
+                scenario = user.rng.choices(names, weights)[0]
+                await SCENARIOS[scenario](user, rec)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(user) for user in users))
+        elapsed = time.perf_counter() - started_at
+
+    scenarios = {}
+    for name in names:
+        summary = summarize(rec.samples[name])
+        summary["errors"] = rec.errors[name]
+        summary["rps"] = round(summary["count"] / elapsed, 2)
+        scenarios[name] = summary
+
+    total = [sample for samples in rec.samples.values() for sample in samples]
+    overall = summarize(total)
+    overall["errors"] = sum(rec.errors.values())
+    overall["rps"] = round(len(total) / elapsed, 2)
+
+    return {
+        "environment": environment(),
+        "config": {
+            "mix": args.mix, "target": args.url or "in-process", "duration": args.duration,
+            "concurrency": args.concurrency, "seed_notes": args.seed_notes, "seed": args.seed,
+        },
+        "overall": overall,
+        "scenarios": scenarios,
+    }
+
+
+def print_report(result: dict):
+    header = f"{'scenario':<14}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = [*result["scenarios"].items(), ("overall", result["overall"])]
+    for name, s in rows:
+        print(
+            f"{name:<14}{s['count']:>8}{s['errors']:>8}{s['rps']:>10}"
+            f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--mix", choices=MIXES, default="default")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual users")
+    parser.add_argument("--seed-notes", type=int, default=50, help="notes created per user before the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", type=Path, help="write the results as a JSON baseline")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    if args.save:
+        save_json(args.save, result)
+        print(f"\nSaved to {args.save}")
+
+    if args.compare:
+        baseline = load_json(args.compare)
+        regressions = compare(baseline["scenarios"], result["scenarios"], "p95_ms", args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.compare} (p95, threshold {args.threshold:.0%}):")
+            for name, before, after, change in regressions:
+                print(f"  {name}: {before} ms -> {after} ms (+{change:.0%})")
+            return 1
+        print(f"\nNo p95 regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Microbenchmarks of parser, serializer and service hot paths.
+
+Every bench_* function takes an input size, prepares realistic data and returns the callable
+to time (a coroutine function is awaited). Results are appended to a JSON history,
+compare flags the benchmarks that got slower than the chosen earlier run.
+
+Usage:
+    python -m benchmarks.micro run
+    python -m benchmarks.micro run -k parse --note "precompiled regexes"
+    python -m benchmarks.micro compare --threshold 0.1
+    python -m benchmarks.micro compare --against 0
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+from benchmarks.stats import compare, environment, load_json, save_json
+
+DEFAULT_HISTORY = Path(__file__).parent / "history" / "micro.json"
+
+
+@dataclass
+class Benchmark:
+    name: str
+    sizes: tuple
+    setup: Callable[[Any], Callable]
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def parametrize(*sizes):
+    """
+    Registers a bench_* function, it is run once per size
+
+    Usage:
+        @parametrize(1_000, 10_000)
+        def bench_parse_tags(size):
+            parser = NoteParser(make_content(size))
+            return parser.parse_tags
+    """
+    def decorator(setup: Callable[[Any], Callable]):
+        BENCHMARKS.append(Benchmark(setup.__name__.removeprefix("bench_"), sizes, setup))
+        return setup
+    return decorator
+
+
+def make_content(size: int, seed: int = 0) -> str:
+    """
+    Note content of about size characters with the density of tags, links
+    and children of a real note: a few of each per kilobyte of text
+    """
+    rng = random.Random(seed)
+    words = "the quick brown fox jumps over the lazy dog while notes link ideas".split()
+    parts, length = [], 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.02:
+            part = f"#tag{rng.randrange(50)}"
+        elif roll < 0.03:
+            part = f"[Related note {rng.randrange(1000)}]({uuid.UUID(int=rng.getrandbits(128))})"
+        elif roll < 0.035:
+            part = f"[[Child note {rng.randrange(1000)}]]"
+        else:
+            part = rng.choice(words)
+        parts.append(part)
+        length += len(part) + 1
+    return " ".join(parts)
+
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+@parametrize(*SIZES)
+def bench_parse_tags(size):
+    from api.notes.utils import NoteParser
+    return NoteParser(make_content(size)).parse_tags
+
+
+@parametrize(*SIZES)
+def bench_parse_links(size):
+    from api.notes.utils import NoteParser
+    return NoteParser(make_content(size)).parse_links
+
+
+@parametrize(*SIZES)
+def bench_parse_children(size):
+    from api.notes.utils import NoteParser
+    return NoteParser(make_content(size)).parse_children
+
+
+@parametrize(0, 10, 100)
+def bench_create_note_read_response(size):
+    """
+    size: number of children, tags and links of the note
+    """
+    from api.core.models import CrossLink, Note, Tag
+    from api.notes.utils import create_note_read_response
+
+    now = datetime.now(timezone.utc)
+
+    def note(id: int) -> Note:
+        return Note(
+            id=id, uuid=uuid.uuid4(), title=f"Note {id}", content=make_content(1_000),
+            created_at=now, updated_at=now, user_id=1, parent_id=None
+        )
+
+    root = note(0)
+    root.children = [note(i) for i in range(1, size + 1)]
+    root.tags = [Tag(id=i, uuid=uuid.uuid4(), name=f"tag{i}", user_id=1) for i in range(size)]
+    root.linked_notes = [
+        CrossLink(title=f"Link {i}", user_id=1, linked_note=note(size + i + 1)) for i in range(size)
+    ]
+    return lambda: create_note_read_response(root)
+
+
+@parametrize("-")
+def bench_user_out_validate_json(size):
+    """
+    What get_current_user does with a cached user on every authenticated request
+    """
+    from api.auth.schemas import UserOut
+    raw = UserOut(id=1, username="benchmark", email="benchmark@example.com").model_dump_json()
+    return lambda: UserOut.model_validate_json(raw)
+
+
+@parametrize("-")
+def bench_jwt_create_token(size):
+    from api.auth.services.jwt_service import create_token
+    return lambda: create_token(1)
+
+
+@parametrize("-")
+def bench_jwt_decode(size):
+    import jwt
+    from api.auth.services.jwt_service import create_token
+    from api.core.config import settings
+    token, _ = create_token(1)
+    return lambda: jwt.decode(token, settings.secret_key, algorithms=settings.algorithm)
+
+
+class _NullSession:
+    """
+    Session stand-in, so only the rewrite itself is measured, not the database round trips
+    """
+
+    def add(self, instance):
+        pass
+
+    async def flush(self):
+        pass
+
+
+@parametrize(1, 10, 100)
+def bench_replace_deleted_links(size):
+    """
+    size: number of notes linking to the deleted note, 10KB content each
+    """
+    from api.core.models import Note
+    from api.notes.services.note_delete_service import NoteDeleteService
+
+    deleted = uuid.uuid4()
+    contents = [f"{make_content(10_000, seed=i)} [Deleted]({deleted})" for i in range(size)]
+    notes = [Note(content=content) for content in contents]
+    service = NoteDeleteService(_NullSession())
+
+    async def run():
+        # restore the content, otherwise every call after the first has nothing to replace
+        for note, content in zip(notes, contents):
+            note.content = content
+        await service._replace_deleted_links_in_content(notes, deleted, "DELETED: Deleted")
+    return run
+
+
+def measure(func: Callable, repeat: int, min_time: float) -> dict[str, float]:
+    """
+    Times func in batches lasting at least min_time and returns per-call statistics in microseconds
+    """
+    is_async = asyncio.iscoroutinefunction(func)
+    loop = asyncio.new_event_loop() if is_async else None
+
+    def run_batch(number: int) -> float:
+        if is_async:
+            async def batch():
+                started_at = time.perf_counter()
+                for _ in range(number):
+                    await func()
+                return time.perf_counter() - started_at
+            return loop.run_until_complete(batch())
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - started_at
+
+    try:
+        number = 1
+        while (elapsed := run_batch(number)) < min_time:
+            number *= 2 if elapsed else 10
+        per_call = [run_batch(number) / number * 1e6 for _ in range(repeat)]
+    finally:
+        if loop:
+            loop.close()
+
+    return {
+        "median_us": round(statistics.median(per_call), 3),
+        "min_us": round(min(per_call), 3),
+        "stdev_us": round(statistics.stdev(per_call), 3) if len(per_call) > 1 else 0.0,
+        "calls": number,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    results = {}
+    for benchmark in BENCHMARKS:
+        if args.k and args.k not in benchmark.name:
+            continue
+        for size in benchmark.sizes:
+            name = f"{benchmark.name}[{size}]"
+            results[name] = measure(benchmark.setup(size), args.repeat, args.min_time)
+            print(f"{name:<45}{results[name]['median_us']:>14.3f} us")
+
+    if not args.no_save:
+        history = load_json(args.history) if args.history.exists() else {"runs": []}
+        history["runs"].append({"environment": environment(), "note": args.note, "results": results})
+        save_json(args.history, history)
+        print(f"\nRun #{len(history['runs']) - 1} saved to {args.history}")
+    return 0
+
+
+def compare_runs(args: argparse.Namespace) -> int:
+    runs = load_json(args.history)["runs"]
+    if len(runs) < 2:
+        print("Need at least two runs in the history")
+        return 0
+    baseline, current = runs[args.against], runs[-1]
+
+    print(f"{'benchmark':<45}{'before us':>14}{'after us':>14}{'change':>10}")
+    for name, result in current["results"].items():
+        if before := baseline["results"].get(name):
+            change = result["median_us"] / before["median_us"] - 1
+            print(f"{name:<45}{before['median_us']:>14.3f}{result['median_us']:>14.3f}{change:>+10.1%}")
+
+    regressions = compare(baseline["results"], current["results"], "median_us", args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower by more than {args.threshold:.0%}:")
+        for name, before, after, change in regressions:
+            print(f"  {name}: {before} us -> {after} us (+{change:.0%})")
+        return 1
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and append them to the history")
+    run_parser.add_argument("-k", help="only benchmarks whose name contains this")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed batch")
+    run_parser.add_argument("--note", default="", help="what changed, stored with the run")
+    run_parser.add_argument("--no-save", action="store_true")
+
+    compare_parser = commands.add_parser("compare", help="compare the last run with an earlier one")
+    compare_parser.add_argument("--against", type=int, default=-2, help="index of the baseline run")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown, 0.1 = 10%%")
+
+    args = parser.parse_args(argv)
+    return run(args) if args.command == "run" else compare_runs(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
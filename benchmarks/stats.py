@@ -0,0 +1,88 @@
+import json
+import math
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile, q in [0, 100]
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """
+    Latency summary in milliseconds of samples given in seconds
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def environment() -> dict[str, str]:
+    """
+    Where the results come from, comparing runs of different machines is meaningless
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.node(),
+    }
+
+
+def save_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2) + "\n")
+
+
+def load_json(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def compare(
+    baseline: dict[str, dict[str, float]],
+    current: dict[str, dict[str, float]],
+    metric: str,
+    threshold: float
+) -> list[tuple[str, float, float, float]]:
+    """
+    Compares metric of every entry present in both runs.
+
+    Args:
+        baseline (dict): entry name -> summary of the baseline run
+        current (dict): entry name -> summary of the current run
+        metric (str): summary key to compare, e.g. "p95_ms", higher is worse
+        threshold (float): allowed relative slowdown, 0.2 means 20%
+
+    Returns:
+        list[tuple[str, float, float, float]]: (name, baseline, current, change) of the regressions
+    """
+    regressions = []
+    for name, summary in current.items():
+        if name not in baseline or not baseline[name].get(metric):
+            continue
+        before, after = baseline[name][metric], summary[metric]
+        change = after / before - 1
+        if change > threshold:
+            regressions.append((name, before, after, change))
+    return regressions
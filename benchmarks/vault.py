@@ -0,0 +1,260 @@
+"""
+Synthetic vault generator for scale testing.
+
+Bulk-loads users with hierarchical notes, Zipf-distributed tags and cross links with COPY,
+bypassing the API, so a million notes load in minutes. The output depends only on the
+arguments: the same --seed gives the same vault (ids depend on what the tables already hold).
+
+Usage:
+    python -m benchmarks.vault --users 100 --notes-per-user 10000 --seed 1
+    python -m benchmarks.vault --users 10 --notes-per-user 1000 --max-depth 6 --fan-out 4 \\
+        --tags-per-user 200 --zipf 1.2 --links-per-note 2.5 --content-size 2000
+
+Every generated user logs in with "<prefix>_<n>@example.com" / Password123.
+The content carries the same #tags, [title](uuid) links and [[children]] as the rows,
+so notes behave like ones created through the API when they are updated or deleted.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import asyncpg
+from api.core.config import settings
+from api.notes.utils import NoteParser
+
+PASSWORD = "Password123"
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud"
+).split()
+
+
+@dataclass
+class GeneratedNote:
+    id: int
+    uuid: uuid.UUID
+    title: str
+    parent_id: int | None
+    depth: int
+    created_at: datetime
+    children: list[str] = field(default_factory=list)
+
+
+@dataclass
+class Batch:
+    """
+    Rows waiting for COPY, in the tables' column order
+    """
+    users: list[tuple] = field(default_factory=list)
+    tags: list[tuple] = field(default_factory=list)
+    notes: list[tuple] = field(default_factory=list)
+    note_tags: list[tuple] = field(default_factory=list)
+    cross_links: list[tuple] = field(default_factory=list)
+
+
+class VaultGenerator:
+    def __init__(self, args: argparse.Namespace, next_ids: dict[str, int], hashed_password: str):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.ids = {table: itertools.count(start) for table, start in next_ids.items()}
+        self.hashed_password = hashed_password
+        # Zipf: the tag of rank r is picked with weight 1 / r^s
+        self.tag_weights = list(itertools.accumulate(
+            1 / rank ** args.zipf for rank in range(1, args.tags_per_user + 1)
+        ))
+
+    def uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def timestamp(self) -> datetime:
+        return EPOCH + timedelta(seconds=self.rng.randrange(365 * 24 * 3600))
+
+    def count(self, mean: float) -> int:
+        """
+        Random non-negative integer with the given mean
+        """
+        whole = int(mean)
+        return whole + (self.rng.random() < mean - whole)
+
+    def filler(self) -> str:
+        size = self.rng.randint(self.args.content_size // 2, self.args.content_size * 3 // 2)
+        words, length = [], 0
+        while length < size:
+            word = self.rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    def generate_user(self, number: int, batch: Batch):
+        args = self.args
+        user_id = next(self.ids["users"])
+        batch.users.append((
+            user_id,
+            f"{args.prefix}_{number}",
+            f"{args.prefix}_{number}@example.com",
+            self.hashed_password,
+            self.timestamp(),
+        ))
+
+        tag_ids = []
+        for rank in range(1, args.tags_per_user + 1):
+            tag_id = next(self.ids["tags"])
+            tag_ids.append(tag_id)
+            batch.tags.append((tag_id, self.uuid(), f"tag{rank}", self.timestamp(), user_id))
+
+        notes = self.generate_hierarchy()
+
+        for note in notes:
+            ranks = set(self.rng.choices(
+                range(args.tags_per_user),
+                cum_weights=self.tag_weights,
+                k=max(1, self.count(args.tags_per_note))
+            )) if args.tags_per_user else set()
+            targets = self.rng.sample(notes, min(self.count(args.links_per_note), len(notes)))
+            targets = [target for target in targets if target is not note]
+
+            parts = [" ".join(f"#tag{rank + 1}" for rank in sorted(ranks)), self.filler()]
+            parts += [f"[{target.title}]({target.uuid})" for target in targets]
+            parts += [f"[[{child}]]" for child in note.children]
+
+            content = "\n".join(parts)
+            # offsets and snippets as NoteService stores them
+            links = NoteParser(content).parse_links() if targets else {}
+
+            updated_at = note.created_at + timedelta(seconds=self.rng.randrange(30 * 24 * 3600))
+            batch.notes.append((
+                note.id, note.uuid, note.title, content,
+                note.created_at, updated_at, user_id, note.parent_id,
+            ))
+            batch.note_tags.extend((note.id, tag_ids[rank], user_id) for rank in ranks)
+            for target in targets:
+                link = links[str(target.uuid)]
+                batch.cross_links.append((
+                    next(self.ids["cross_links"]), user_id, target.title, note.id, target.id,
+                    link.start, link.end, link.snippet,
+                ))
+
+    def generate_hierarchy(self) -> list[GeneratedNote]:
+        """
+        Notes of one user as a forest: every note is either a root or the child of a random
+        note that is above --max-depth and still has room for --fan-out children
+        """
+        args = self.args
+        notes: list[GeneratedNote] = []
+        open_parents: list[GeneratedNote] = []
+
+        for index in range(args.notes_per_user):
+            parent = None
+            if open_parents and self.rng.random() >= args.root_ratio:
+                slot = self.rng.randrange(len(open_parents))
+                parent = open_parents[slot]
+
+            note = GeneratedNote(
+                id=next(self.ids["notes"]),
+                uuid=self.uuid(),
+                title=f"Note {index}",
+                parent_id=parent.id if parent else None,
+                depth=parent.depth + 1 if parent else 0,
+                created_at=self.timestamp(),
+            )
+            notes.append(note)
+
+            if parent:
+                parent.children.append(note.title)
+                if len(parent.children) >= args.fan_out:
+                    # swap-remove keeps this O(1) for big vaults
+                    open_parents[slot] = open_parents[-1]
+                    open_parents.pop()
+            if note.depth < args.max_depth and args.fan_out > 0:
+                open_parents.append(note)
+        return notes
+
+
+COPY_COLUMNS = {
+    "users": ["id", "username", "email", "hashed_password", "created_at"],
+    "tags": ["id", "uuid", "name", "created_at", "user_id"],
+    "notes": ["id", "uuid", "title", "content", "created_at", "updated_at", "user_id", "parent_id"],
+    "note_tags": ["note_id", "tag_id", "user_id"],
+    "cross_links": ["id", "user_id", "title", "note_id", "linked_note_id", "offset_start", "offset_end", "snippet"],
+}
+
+
+async def copy_batch(conn: asyncpg.Connection, batch: Batch):
+    # Parents before children, so foreign keys hold after every COPY
+    async with conn.transaction():
+        for table, columns in COPY_COLUMNS.items():
+            records = getattr(batch, table)
+            if records:
+                await conn.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def next_ids(conn: asyncpg.Connection) -> dict[str, int]:
+    return {
+        table: await conn.fetchval(f"SELECT coalesce(max(id), 0) + 1 FROM {table}")
+        for table in ("users", "tags", "notes", "cross_links")
+    }
+
+
+async def reset_sequences(conn: asyncpg.Connection):
+    # Rows were inserted with explicit ids, the serial sequences have to catch up
+    for table in ("users", "tags", "notes", "cross_links"):
+        await conn.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"coalesce((SELECT max(id) FROM {table}), 1))"
+        )
+
+
+async def generate(args: argparse.Namespace):
+    from api.auth.security import get_password_hash
+
+    dsn = settings.database_url.replace("postgresql+asyncpg://", "postgresql://")
+    conn = await asyncpg.connect(dsn)
+    try:
+        generator = VaultGenerator(args, await next_ids(conn), get_password_hash(PASSWORD))
+        started_at = time.perf_counter()
+        batch, loaded = Batch(), 0
+
+        for number in range(args.users):
+            generator.generate_user(number, batch)
+            if len(batch.notes) >= args.batch_notes or number == args.users - 1:
+                await copy_batch(conn, batch)
+                loaded += len(batch.notes)
+                batch = Batch()
+                elapsed = time.perf_counter() - started_at
+                print(f"{number + 1}/{args.users} users, {loaded} notes, {loaded / elapsed:.0f} notes/s")
+
+        await reset_sequences(conn)
+        await conn.execute("ANALYZE users, tags, notes, note_tags, cross_links")
+    finally:
+        await conn.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--notes-per-user", type=int, default=1000)
+    parser.add_argument("--max-depth", type=int, default=5, help="deepest parent_id chain")
+    parser.add_argument("--fan-out", type=int, default=5, help="most children per note")
+    parser.add_argument("--root-ratio", type=float, default=0.1, help="share of notes without a parent")
+    parser.add_argument("--tags-per-user", type=int, default=100, help="tag vocabulary size")
+    parser.add_argument("--tags-per-note", type=float, default=3, help="mean tags per note")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of tag popularity")
+    parser.add_argument("--links-per-note", type=float, default=2, help="mean cross links per note")
+    parser.add_argument("--content-size", type=int, default=1000, help="mean content length in characters")
+    parser.add_argument("--prefix", default="vault", help="username prefix, must be new for every vault")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-notes", type=int, default=50_000, help="notes per COPY transaction")
+    args = parser.parse_args(argv)
+
+    asyncio.run(generate(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,19 @@
 #!/bin/sh
 
+# Samples of the previous run would be merged into /metrics otherwise
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+if [ "$APP_ENV" = "production" ]; then
+    # Dependencies are baked into the image, workers are configured by Settings (api/server.py)
+    alembic -c /app/api/alembic.ini upgrade head || exit 1
+    exec python -m api.server
+fi
+
 pip install -r /app/api/requirements.txt --no-cache-dir
 
-uvicorn api.main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
+alembic -c /app/api/alembic.ini upgrade head
+
+uvicorn api.main:app --host 0.0.0.0 --port 8000 --reload
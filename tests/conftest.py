@@ -1,28 +1,101 @@
+import os
+
+# Has to happen before the app is imported: settings are read at import time.
+# Every xdist worker gets its own schema, so workers never see each other's rows.
+WORKER = os.environ.get("PYTEST_XDIST_WORKER", "main")
+os.environ["POSTGRES_SCHEMA"] = f"test_{WORKER}"
+os.environ.setdefault("CACHE_BACKEND", "memory")
+# The suite runs against hash partitioned notes tables, NOTE_PARTITIONS=0 tests plain ones
+os.environ.setdefault("NOTE_PARTITIONS", "4")
+os.environ.setdefault("DEBUG", "True")
+
 from typing import AsyncGenerator
+import pytest
 import pytest_asyncio
-from httpx import AsyncClient
-from api.core.db import async_session, async_engine
-from sqlalchemy.ext.asyncio import AsyncSession
+from httpx import ASGITransport, AsyncClient, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, async_sessionmaker
+from api.auth.security import pwd_context
+from api.auth.services.auth_service import get_read_session
+from api.core.cache import init_cache
+from api.core.config import settings
+from api.core.db import Base, _lazy_session, async_engine, get_session
+from api.main import app
+
+# Cheapest bcrypt cost, hashing dominates the suite's run time otherwise
+pwd_context.update(bcrypt__rounds=4)
+
+
+@pytest_asyncio.fixture(scope="session", autouse=True)
+async def database():
+    """
+    Creates the worker's schema once per run and drops it afterwards
+    """
+    async with async_engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {settings.postgres_schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {settings.postgres_schema}"))
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    async with async_engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {settings.postgres_schema} CASCADE"))
+    await async_engine.dispose()
+
 
 @pytest_asyncio.fixture
-async def async_client():
-    async with AsyncClient(base_url="http://localhost:8000", timeout=1000) as client:
-        yield client
+async def connection() -> AsyncGenerator[AsyncConnection, None]:
+    """
+    Connection with an open transaction that is rolled back after the test
+    """
+    async with async_engine.connect() as conn:
+        transaction = await conn.begin()
+        yield conn
+        await transaction.rollback()
 
-async def drop_dev_db(async_client: AsyncClient):
-    response = await async_client.post("/flush-db")
-    print("✅ Development database dropped and recreated. Ready for tests.")
 
-@pytest_asyncio.fixture(scope="function", autouse=True)
-async def flush_dev_db(async_client: AsyncClient):
-    await drop_dev_db(async_client)
-    
 @pytest_asyncio.fixture
-async def db_connection() -> AsyncGenerator[AsyncSession, None]:
-    async with async_engine.begin() as conn:
-        async with async_session(bind=conn) as session:
+async def session_factory(connection: AsyncConnection) -> AsyncGenerator[async_sessionmaker, None]:
+    """
+    Makes the app use the test's connection. Commits of the app release a SAVEPOINT
+    instead of committing, so everything a test writes disappears with the rollback.
+    """
+    factory = async_sessionmaker(
+        bind=connection,
+        expire_on_commit=False,
+        join_transaction_mode="create_savepoint"
+    )
+
+    # One override for both dependencies: FastAPI caches a dependency per request,
+    # so a request gets a single session and its SAVEPOINTs never nest
+    async def override_session():
+        async for session in _lazy_session(factory):
             yield session
 
+    app.dependency_overrides[get_session] = override_session
+    app.dependency_overrides[get_read_session] = override_session
+    yield factory
+    app.dependency_overrides.clear()
+
+
+@pytest_asyncio.fixture
+async def async_client(session_factory: async_sessionmaker) -> AsyncGenerator[AsyncClient, None]:
+    """
+    Client calling the app in-process, no server needed
+    """
+    cache = await init_cache()
+    await cache.clear()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest_asyncio.fixture
+async def db_connection(session_factory: async_sessionmaker) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session on the test's connection, it sees what the app wrote during the test
+    """
+    async with session_factory() as session:
+        yield session
+
 async def _access_token(async_client: AsyncClient) -> str:
     """
     Create a user and return an access token for that user after logging in.
@@ -47,3 +120,26 @@ async def _access_token(async_client: AsyncClient) -> str:
 @pytest_asyncio.fixture
 async def access_token(async_client: AsyncClient) -> str:
     return await _access_token(async_client)
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Asserts that the request behind a response executed at most `budget` SQL statements.
+    Relies on the X-DB-Statements header the app sends in debug mode.
+
+    Usage:
+        resp = await async_client.post("/notes/", json=data, headers=headers)
+        query_budget(resp, 15)
+    """
+    def check(response: Response, budget: int, max_repeated: int | None = None):
+        assert "x-db-statements" in response.headers, "the app has to run with DEBUG=True"
+        statements = int(response.headers["x-db-statements"])
+        assert statements <= budget, (
+            f"{response.request.method} {response.request.url.path} executed "
+            f"{statements} SQL statements, budget is {budget}"
+        )
+        if max_repeated is not None:
+            repeated = int(response.headers["x-db-repeated-statements"])
+            assert repeated <= max_repeated, f"{repeated} repeated statements (N+1), at most {max_repeated} allowed"
+    return check
@@ -0,0 +1,63 @@
+import uuid
+import pytest
+from httpx import AsyncClient
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_link_graph_analytics(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    missing = uuid.uuid4()
+    notes = {}
+
+    async def create(title: str, content: str):
+        resp = await async_client.post("/notes/", json={"title": title, "content": content}, headers=headers)
+        assert resp.status_code == 201
+        notes[title] = resp.json()
+
+    async def analytics(metric: str):
+        resp = await async_client.get(f"/notes/analytics/{metric}", headers=headers)
+        assert resp.status_code == 200
+        return resp.json()
+
+    await create("C", "leaf")
+    await create("B", f"[to C]({notes['C']['uuid']})")
+    # Any notation of a uuid links, not only the canonical one
+    await create("A", f"[to B]({notes['B']['uuid']}) [to C]({notes['C']['uuid'].upper()}) [gone]({missing}) [site](https://example.com)")
+    await create("D", "alone")
+    await create("R", "[[Kid]]")
+
+    assert await analytics("summary") == {"notes": 6, "links": 3, "orphans": 3, "broken_links": 1}
+    assert [note["title"] for note in await analytics("orphans")] == ["A", "D", "R"]
+    assert [
+        (hub["title"], hub["backlinks"], hub["links"]) for hub in await analytics("hubs")
+    ] == [("C", 2, 0), ("B", 1, 1), ("A", 0, 2)]
+    assert [
+        (link["title"], link["link_title"], link["target"]) for link in await analytics("broken-links")
+    ] == [("A", "gone", str(missing))]  # external links are not links to notes
+
+    ranks = await analytics("pagerank")
+    assert [note["title"] for note in ranks[:2]] == ["C", "B"]
+    assert sum(note["score"] for note in ranks) == pytest.approx(1)
+
+    # cached until the graph changes
+    resp = await async_client.put(f"/notes/{notes['D']['uuid']}", json={"content": "still alone"}, headers=headers)
+    assert resp.status_code == 200
+    assert (await analytics("summary"))["links"] == 3
+
+    resp = await async_client.put(
+        f"/notes/{notes['D']['uuid']}", json={"content": f"[to A]({notes['A']['uuid']})"}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert [note["title"] for note in await analytics("orphans")] == ["D", "R"]
+
+    resp = await async_client.delete(f"/notes/{notes['A']['uuid']}", headers=headers)
+    assert resp.status_code == 200
+    assert await analytics("summary") == {"notes": 5, "links": 1, "orphans": 3, "broken_links": 0}
+
+    resp = await async_client.put(f"/notes/{notes['B']['uuid']}", json={"title": "B2"}, headers=headers)
+    assert resp.status_code == 200
+    assert [note["title"] for note in await analytics("orphans")] == ["B2", "D", "R"]
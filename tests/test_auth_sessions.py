@@ -0,0 +1,102 @@
+import jwt
+import pytest
+from datetime import timedelta
+from httpx import AsyncClient
+from api.auth.services.jwt_service import create_token
+from api.core.cache import RedisCacheBackend, get_cache
+
+pytestmark = pytest.mark.asyncio
+
+USER_DATA = {
+    "username": "sessionuser",
+    "email": "session@example.com",
+    "password": "Password123"
+}
+
+async def login(async_client: AsyncClient) -> dict:
+    resp = await async_client.post("/auth/login", json={
+        "email": USER_DATA["email"],
+        "password": USER_DATA["password"]
+    })
+    assert resp.status_code == 200
+    return resp.json()
+
+
+async def test_sessions_listing_and_logout(
+    async_client: AsyncClient
+):
+    await async_client.post("/auth/register", json=USER_DATA)
+
+    first = await login(async_client)
+    second = await login(async_client)
+    headers = {"Authorization": f"Bearer {second['access_token']}"}
+
+    resp = await async_client.get("/auth/sessions", headers=headers)
+    assert resp.status_code == 200
+    assert len(resp.json()) == 2
+
+    # logout one session
+    resp = await async_client.post(
+        "/auth/logout",
+        headers={"Authorization": f"Bearer {first['refresh_token']}"}
+    )
+    assert resp.json() == {"message": "Logged out"}
+
+    resp = await async_client.get("/auth/sessions", headers=headers)
+    assert len(resp.json()) == 1
+
+
+async def test_logout_all(
+    async_client: AsyncClient
+):
+    await async_client.post("/auth/register", json=USER_DATA)
+
+    tokens = [await login(async_client) for _ in range(3)]
+    headers = {"Authorization": f"Bearer {tokens[-1]['access_token']}"}
+
+    resp = await async_client.post("/auth/logout-all", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["revoked"] == 3
+
+    resp = await async_client.get("/auth/sessions", headers=headers)
+    assert resp.json() == []
+
+    # every refresh token is invalid now
+    for token in tokens:
+        resp = await async_client.post(
+            "/auth/logout",
+            headers={"Authorization": f"Bearer {token['refresh_token']}"}
+        )
+        assert resp.json() == {"message": "Token already invalid"}
+
+
+async def test_refresh_tokens_issued_before_the_session_index(
+    async_client: AsyncClient
+):
+    cache = await get_cache()
+    if not isinstance(cache, RedisCacheBackend):
+        pytest.skip("tokens were stored in Redis only")
+
+    await async_client.post("/auth/register", json=USER_DATA)
+    access_token = (await login(async_client))["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = jwt.decode(access_token, options={"verify_signature": False})["user_id"]
+
+    tokens = []
+    for _ in range(2):
+        token, payload = create_token(user_id, timedelta(days=1))
+        await cache.client.set(f"token:{user_id}:{payload['jti']}", "valid", ex=86400)
+        tokens.append(token)
+
+    # The first use moves the token into the session index
+    resp = await async_client.post("/auth/refresh", headers={"Authorization": tokens[0]})
+    assert resp.status_code == 200
+    resp = await async_client.get("/auth/sessions", headers=headers)
+    assert len(resp.json()) == 2
+
+    # The token left outside the index is revoked too, without being counted
+    resp = await async_client.post("/auth/logout-all", headers=headers)
+    assert resp.json()["revoked"] == 2
+    for token in tokens:
+        resp = await async_client.post("/auth/refresh", headers={"Authorization": token})
+        assert resp.status_code == 401
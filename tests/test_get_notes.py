@@ -1,5 +1,7 @@
+import uuid
 import pytest
 from httpx import AsyncClient
+from api.notes.utils import LINK_SNIPPET_MAX, link_snippet
 
 @pytest.mark.asyncio
 async def test_get_notes_success(
@@ -137,4 +139,85 @@ async def test_get_notes_unauthorized(
     """Test getting notes without an access token returns 401."""
     response = await async_client.get("/notes/")
     
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_backlinks_with_snippets(async_client: AsyncClient, access_token: str):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    resp = await async_client.post("/notes/", json={"title": "Target", "content": "target"}, headers=headers)
+    target = resp.json()
+
+    filler = "word " * 40
+    sources = []
+    for i in range(3):
+        content = f"{filler}see [the target]({target['uuid']}) for details\n{filler}"
+        resp = await async_client.post("/notes/", json={"title": f"Source {i}", "content": content}, headers=headers)
+        assert resp.status_code == 201
+        sources.append((resp.json(), content))
+
+    resp = await async_client.get(f"/notes/{target['uuid']}/backlinks", params={"limit": 2}, headers=headers)
+    assert resp.status_code == 200
+    page = resp.json()
+    resp = await async_client.get(
+        f"/notes/{target['uuid']}/backlinks",
+        params={"limit": 2, "cursor": resp.headers["x-next-cursor"]},
+        headers=headers
+    )
+    assert "x-next-cursor" not in resp.headers
+    page += resp.json()
+
+    assert [link["source_note_uuid"] for link in page] == [source["uuid"] for source, _ in sources]
+    for link, (source, content) in zip(page, sources):
+        assert link["source_note_title"] == source["title"]
+        assert content[link["offset_start"]:link["offset_end"]] == f"[the target]({target['uuid']})"
+        assert link["snippet"].startswith("…word")
+        assert f"see [the target]({target['uuid']}) for details word" in link["snippet"]
+        assert link["snippet"].endswith("…")
+
+    resp = await async_client.get(f"/notes/{sources[0][0]['uuid']}/backlinks", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == []
+    resp = await async_client.get(f"/notes/{uuid.uuid4()}/backlinks", headers=headers)
+    assert resp.status_code == 404
+
+
+def test_snippet_of_a_long_link_is_cut():
+    link = f"[{'long ' * 100}]({uuid.uuid4()})"
+    snippet = link_snippet(f"{link} tail", 0, len(link))
+    assert snippet.startswith("[long")
+    assert snippet.endswith("…")
+    assert len(snippet) <= LINK_SNIPPET_MAX
+
+
+@pytest.mark.asyncio
+async def test_batch_get_notes(
+    async_client: AsyncClient,
+    access_token: str,
+    query_budget
+):
+    """Test fetching many notes at once, from the database and from the note cache."""
+    headers = {"Authorization": f"Bearer {access_token}"}
+    target = (await async_client.post("/notes/", json={"title": "Target", "content": "#a"}, headers=headers)).json()
+    content = f"#a #b [[Child 1]] [[Child 2]] [target]({target['uuid']})"
+    parent = (await async_client.post("/notes/", json={"title": "Parent", "content": content}, headers=headers)).json()
+    cached = await async_client.get(f"/notes/{target['uuid']}", headers=headers)
+    missing = str(uuid.uuid4())
+
+    uuids = [parent["uuid"], missing, target["uuid"], parent["uuid"]]
+    resp = await async_client.post("/notes/batch-get", json={"uuids": uuids}, headers=headers)
+    assert resp.status_code == 200
+    # One query for the notes and one per relationship, the target comes from the cache
+    query_budget(resp, 4, max_repeated=0)
+    notes = resp.json()["notes"]
+    assert list(notes) == [parent["uuid"], missing, target["uuid"]]
+    assert notes[missing] is None
+    assert notes[target["uuid"]] == cached.json()
+    assert notes[parent["uuid"]] == (await async_client.get(f"/notes/{parent['uuid']}", headers=headers)).json()
+    assert sorted(child["title"] for child in notes[parent["uuid"]]["children_read"]) == ["Child 1", "Child 2"]
+
+    resp = await async_client.post("/notes/batch-get", json={"uuids": uuids}, headers=headers)
+    assert resp.json()["notes"] == notes
+    query_budget(resp, 0)
+
+    resp = await async_client.post("/notes/batch-get", json={"uuids": [missing] * 251}, headers=headers)
+    assert resp.status_code == 422
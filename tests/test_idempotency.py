@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from httpx import AsyncClient
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_retried_writes_run_once(
+    async_client: AsyncClient,
+    access_token: str,
+    query_budget
+):
+    headers = {"Authorization": f"Bearer {access_token}", "Idempotency-Key": "create-1"}
+    note = {"title": "Once", "content": "#retry"}
+
+    first = await async_client.post("/notes/", json=note, headers=headers)
+    assert first.status_code == 201
+    assert "idempotent-replayed" not in first.headers
+
+    retry = await async_client.post("/notes/", json=note, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+    query_budget(retry, 0)
+
+    resp = await async_client.get("/notes/", headers={"Authorization": f"Bearer {access_token}"})
+    assert [note["title"] for note in resp.json()] == ["Once"]
+
+    # The key is bound to the request it was first used for
+    resp = await async_client.post("/notes/", json={"title": "Other", "content": ""}, headers=headers)
+    assert resp.status_code == 422
+    resp = await async_client.post("/notes/", params={"v": 2}, json=note, headers=headers)
+    assert resp.status_code == 422
+
+    # Errors are replayed as well
+    headers["Idempotency-Key"] = "tag-1"
+    resp = await async_client.post("/tags/", json={"name": "retry"}, headers=headers)
+    assert resp.status_code == 400
+    retry = await async_client.post("/tags/", json={"name": "retry"}, headers=headers)
+    assert retry.status_code == 400
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == resp.json()
+
+
+async def test_concurrent_duplicates_wait_for_the_first_response(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}", "Idempotency-Key": "create-2"}
+    note = {"title": "Concurrent", "content": "#a"}
+
+    responses = await asyncio.gather(*(
+        async_client.post("/notes/", json=note, headers=headers) for _ in range(3)
+    ))
+    assert [resp.status_code for resp in responses] == [201] * 3
+    assert len({resp.json()["uuid"] for resp in responses}) == 1
+    assert sum("idempotent-replayed" in resp.headers for resp in responses) == 2
+
+
+async def test_invalid_key(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}", "Idempotency-Key": "x" * 256}
+    resp = await async_client.post("/notes/", json={"title": "Long", "content": ""}, headers=headers)
+    assert resp.status_code == 400
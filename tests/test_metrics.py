@@ -0,0 +1,25 @@
+import pytest
+from httpx import AsyncClient
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_metrics(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await async_client.post("/notes/", json={"title": "Metrics", "content": "#tag"}, headers=headers)
+    await async_client.get("/notes/", headers=headers)
+
+    resp = await async_client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+
+    body = resp.text
+    # routes are labeled by their template, not by the raw path
+    assert 'http_request_duration_seconds_count{method="GET",route="/notes/"}' in body
+    assert 'db_statements_per_request_count{route="/notes/"}' in body
+    assert 'cache_requests_total{cache="user",result="hit"}' in body
+    assert "db_pool_checked_out_connections" in body
+    assert "http_requests_in_progress" in body
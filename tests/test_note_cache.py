@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timezone
+from uuid import uuid4
+import pytest
+from httpx import AsyncClient
+from api.core.cache import get_cache
+from api.core.singleflight import SingleFlight
+from api.notes import router as notes_router
+from api.notes.read_cache import NoteReadCache
+from api.notes.schemas import NoteRead
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_note_reads_are_cached_until_the_user_writes(
+    async_client: AsyncClient,
+    access_token: str,
+    query_budget
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    resp = await async_client.post("/notes/", json={"title": "Cached", "content": "#old"}, headers=headers)
+    note = resp.json()
+
+    first = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    second = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    assert second.json() == first.json()
+    query_budget(second, 0)
+
+    resp = await async_client.put(f"/notes/{note['uuid']}", json={"content": "#new"}, headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    assert [tag["name"] for tag in resp.json()["tags_read"]] == ["new"]
+
+    # Tag writes change the notes' responses too
+    tag_uuid = resp.json()["tags_read"][0]["uuid"]
+    resp = await async_client.put(f"/tags/{tag_uuid}", json={"name": "renamed"}, headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    assert [tag["name"] for tag in resp.json()["tags_read"]] == ["renamed"]
+
+    resp = await async_client.delete(f"/notes/{note['uuid']}", headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    assert resp.status_code == 404
+
+
+async def test_concurrent_reads_share_one_load(
+    async_client: AsyncClient,
+    access_token: str,
+    monkeypatch: pytest.MonkeyPatch
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    resp = await async_client.post("/notes/", json={"title": "Hot", "content": "#hot"}, headers=headers)
+    note = resp.json()
+
+    loads = 0
+    get_note_with_relations = notes_router.get_note_with_relations
+
+    async def counting_load(*args, **kwargs):
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.05)
+        return await get_note_with_relations(*args, **kwargs)
+
+    monkeypatch.setattr(notes_router, "get_note_with_relations", counting_load)
+    responses = await asyncio.gather(*(
+        async_client.get(f"/notes/{note['uuid']}", headers=headers) for _ in range(5)
+    ))
+    assert [resp.status_code for resp in responses] == [200] * 5
+    assert loads == 1
+
+
+async def test_lock_holder_rebuilds_the_entry(async_client: AsyncClient):
+    note_cache = NoteReadCache(await get_cache(), user_id=1)
+    await note_cache.cache.set(note_cache.lock_key("note", None), 1, ex=5)
+
+    async def other_process():
+        await asyncio.sleep(0.05)
+        await note_cache.cache.set(note_cache.key("note"), {"version": None, "note": None})
+
+    async def load():
+        raise AssertionError("loaded while another process holds the lock")
+
+    asyncio.create_task(other_process())
+    assert await note_cache.get("note", load) is None
+
+
+async def test_read_after_a_write_does_not_join_an_older_load(async_client: AsyncClient):
+    note_cache = NoteReadCache(await get_cache(), user_id=1)
+    started = asyncio.Event()
+
+    async def load_before_commit():
+        started.set()
+        await asyncio.sleep(0.05)
+        return None
+
+    async def load_after_commit():
+        return NoteRead(
+            id=1, uuid=uuid4(), title="Committed", content="", user_id=1,
+            created_at=datetime.now(timezone.utc), updated_at=datetime.now(timezone.utc)
+        )
+
+    before = asyncio.create_task(note_cache.get("note", load_before_commit))
+    await started.wait()
+    await note_cache.invalidate()
+    after = await note_cache.get("note", load_after_commit)
+    assert after.title == "Committed"
+    assert await before is None
+
+
+async def test_single_flight_survives_a_cancelled_caller():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    leader = asyncio.create_task(flight.do("key", fn))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", fn))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == 2
+    assert not flight.in_flight("key")
@@ -0,0 +1,94 @@
+import pytest
+from httpx import AsyncClient
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from api.core.config import settings
+from api.notes import jobs
+from api.notes.jobs import NoteJob, NoteWorker, content_hash, enqueue_pending, get_note_job_queue, process_note
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(autouse=True)
+def async_mode(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "note_processing_mode", "async")
+    monkeypatch.setattr(settings, "note_job_block_ms", 10)
+    monkeypatch.setattr(jobs, "_queue", None)
+
+
+async def drain(session_factory: async_sessionmaker) -> list[str]:
+    queue = await get_note_job_queue()
+    worker = NoteWorker(queue, "test", session_factory)
+    results = []
+    while taken := await queue.take("test"):
+        for job in taken:
+            results.append(await worker.handle(job))
+    return results
+
+
+async def test_notes_are_parsed_in_the_background(
+    async_client: AsyncClient,
+    access_token: str,
+    session_factory: async_sessionmaker
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    resp = await async_client.post("/notes/", json={"title": "Job", "content": "#one [[Kid]]"}, headers=headers)
+    assert resp.status_code == 201
+    note = resp.json()
+    assert note["processing_state"] == "pending"
+    assert note["tags_read"] == [] and note["children_read"] == []
+
+    assert await drain(session_factory) == ["processed"]
+    resp = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    note = resp.json()
+    assert note["processing_state"] == "done"
+    assert [tag["name"] for tag in note["tags_read"]] == ["one"]
+    assert [child["title"] for child in note["children_read"]] == ["Kid"]
+
+    # Edits while the job is queued are picked up by it
+    for content in ("#two", "#three"):
+        resp = await async_client.put(f"/notes/{note['uuid']}", json={"content": content}, headers=headers)
+        assert resp.status_code == 200
+        assert resp.json()["processing_state"] == "pending"
+    assert await drain(session_factory) == ["superseded"]
+    resp = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    note = resp.json()
+    assert note["processing_state"] == "done"
+    assert [tag["name"] for tag in note["tags_read"]] == ["three"]
+    assert note["children_read"] == []
+
+    # A job delivered again is skipped
+    job = NoteJob(note["id"], note["user_id"], content_hash("#three"))
+    assert await process_note(job, session_factory) == "duplicate"
+
+
+async def test_lost_jobs_are_enqueued_by_the_sweep(
+    async_client: AsyncClient,
+    access_token: str,
+    session_factory: async_sessionmaker,
+    monkeypatch: pytest.MonkeyPatch
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    resp = await async_client.post("/notes/", json={"title": "Lost", "content": "#lost"}, headers=headers)
+    assert resp.status_code == 201
+    note = resp.json()
+    await drain(session_factory)
+
+    async def unavailable(job: NoteJob) -> bool:
+        raise RedisError("connection refused")
+
+    queue = await get_note_job_queue()
+    with monkeypatch.context() as patch:
+        patch.setattr(queue, "enqueue", unavailable)
+        resp = await async_client.put(f"/notes/{note['uuid']}", json={"content": "#found"}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["processing_state"] == "pending"
+
+    assert await enqueue_pending(queue, session_factory) == 1
+    assert await enqueue_pending(queue, session_factory) == 0
+    assert await drain(session_factory) == ["processed"]
+
+    resp = await async_client.get(f"/notes/{note['uuid']}", headers=headers)
+    assert [tag["name"] for tag in resp.json()["tags_read"]] == ["found"]
@@ -0,0 +1,43 @@
+import pytest
+from httpx import AsyncClient
+
+pytestmark = pytest.mark.asyncio
+
+# Statements executed by the scenarios below. Lower them when a path gets cheaper,
+# raising them needs a reason: an extra statement per child/link/tag is an N+1 regression.
+CREATE_SIMPLE_BUDGET = 14
+CREATE_BUDGET = 21
+UPDATE_BUDGET = 20
+DELETE_BUDGET = 30
+
+
+async def test_note_write_query_budgets(
+    async_client: AsyncClient,
+    access_token: str,
+    query_budget
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    resp = await async_client.post("/notes/", json={"title": "Target", "content": "#a"}, headers=headers)
+    assert resp.status_code == 201
+    query_budget(resp, CREATE_SIMPLE_BUDGET, max_repeated=0)
+    target = resp.json()
+
+    content = f"#a #b #c [[Child 1]] [[Child 2]] [[Child 3]] [target]({target['uuid']})"
+    resp = await async_client.post("/notes/", json={"title": "Parent", "content": content}, headers=headers)
+    assert resp.status_code == 201
+    query_budget(resp, CREATE_BUDGET)
+    parent = resp.json()
+
+    content = f"#a #d [[Child 1]] [[Child 4]] [target]({target['uuid']})"
+    resp = await async_client.put(
+        f"/notes/{parent['uuid']}",
+        json={"title": "Parent v2", "content": content},
+        headers=headers
+    )
+    assert resp.status_code == 200
+    query_budget(resp, UPDATE_BUDGET)
+
+    resp = await async_client.delete(f"/notes/{parent['uuid']}", headers=headers)
+    assert resp.status_code == 200
+    query_budget(resp, DELETE_BUDGET)
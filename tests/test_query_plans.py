@@ -0,0 +1,116 @@
+import re
+from contextlib import contextmanager
+from typing import Any, Iterator
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.config import settings
+from api.core.db import async_engine
+
+pytestmark = pytest.mark.asyncio
+
+
+@contextmanager
+def captured_statements() -> Iterator[list[tuple[str, Any]]]:
+    """
+    Collects the (statement, parameters) of the reads and writes the app executes
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split()[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+
+async def explain(db_connection: AsyncSession, statement: str, parameters) -> str:
+    connection = await db_connection.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+    return "\n".join(row[0] for row in result)
+
+
+async def test_hot_queries_use_indexes(
+    async_client: AsyncClient,
+    access_token: str,
+    db_connection: AsyncSession
+):
+    """
+    The statements the note and tag endpoints actually run. The tables are tiny in tests,
+    so the planner is told to avoid sequential scans: a Seq Scan left in a plan means no
+    index can serve the statement.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    resp = await async_client.post("/notes/", json={"title": "Target", "content": "#b"}, headers=headers)
+    target = resp.json()
+    # Built before capturing, rebuilding the tag indexes reads all of the user's rows on purpose
+    await async_client.get("/notes/", params={"tags": "b"}, headers=headers)
+    await async_client.get("/tags/suggest", headers=headers)
+
+    with captured_statements() as statements:
+        resp = await async_client.post("/notes/", json={
+            "title": "Source", "content": f"#a #b [[Kid]] [to target]({target['uuid']})"
+        }, headers=headers)
+        source = resp.json()
+        kid = source["children_read"][0]
+        tags = {tag["name"]: tag for tag in source["tags_read"]}
+        await async_client.put(f"/notes/{source['uuid']}", json={"content": f"#a [[Kid]] [t]({target['uuid']})"}, headers=headers)
+        await async_client.get("/notes/", headers=headers)
+        await async_client.get("/notes/", params={"parent_id": source["id"]}, headers=headers)
+        await async_client.get("/notes/", params={"tags": "a AND NOT b"}, headers=headers)
+        await async_client.get(f"/notes/{kid['uuid']}", headers=headers)
+        await async_client.post("/notes/batch-get", json={"uuids": [source["uuid"], target["uuid"]]}, headers=headers)
+        await async_client.get(f"/notes/{target['uuid']}/backlinks", headers=headers)
+        await async_client.get(f"/notes/{source['uuid']}/linked_notes", headers=headers)
+        await async_client.get("/tags/", headers=headers)
+        await async_client.get("/tags/", params={"sort": "usage"}, headers=headers)
+        await async_client.get(f"/tags/{tags['a']['uuid']}/notes", headers=headers)
+        await async_client.delete(f"/notes/{source['uuid']}", headers=headers)
+
+    assert len(statements) > 20
+    await db_connection.execute(text("SET LOCAL enable_seqscan = off"))
+    for statement, parameters in statements:
+        plan = await explain(db_connection, statement, parameters)
+        assert "Seq Scan" not in plan, f"{statement}\n{plan}"
+
+
+@pytest.mark.skipif(not settings.note_partitions, reason="notes tables are not partitioned")
+async def test_note_queries_prune_partitions(
+    async_client: AsyncClient,
+    access_token: str,
+    db_connection: AsyncSession
+):
+    """
+    Every statement the note endpoints and services run reads at most one partition of
+    notes, cross_links and note_tags: all of them filter on user_id.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    with captured_statements() as statements:
+        resp = await async_client.post("/notes/", json={"title": "Target", "content": "#b"}, headers=headers)
+        target = resp.json()
+        resp = await async_client.post("/notes/", json={
+            "title": "Source", "content": f"#a [[Kid]] [[Other]] [to target]({target['uuid']})"
+        }, headers=headers)
+        source = resp.json()
+        await async_client.put(f"/notes/{source['uuid']}", json={"content": "#c [[Kid]]"}, headers=headers)
+        await async_client.put(f"/notes/{target['uuid']}", json={
+            "content": f"[back]({source['uuid']})"
+        }, headers=headers)
+        await async_client.get(f"/notes/{source['uuid']}", headers=headers)
+        await async_client.get(f"/notes/{source['uuid']}/backlinks", headers=headers)
+        await async_client.delete(f"/notes/{source['uuid']}", headers=headers)
+
+    partitioned = 0
+    for statement, parameters in statements:
+        plan = await explain(db_connection, statement, parameters)
+        scanned: dict[str, set[str]] = {}
+        for table, partition in re.findall(r"\b(notes|cross_links|note_tags)_p(\d+)\b", plan):
+            scanned.setdefault(table, set()).add(partition)
+        assert all(len(partitions) == 1 for partitions in scanned.values()), f"{statement}\n{plan}"
+        partitioned += bool(scanned)
+    assert partitioned > 10
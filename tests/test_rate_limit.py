@@ -0,0 +1,29 @@
+import pytest
+from httpx import AsyncClient
+from api.core.config import settings
+from api.core.rate_limit import parse_rate_limit
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_login_rate_limited(
+    async_client: AsyncClient
+):
+    user_data = {
+        "username": "ratelimituser",
+        "email": "ratelimit@example.com",
+        "password": "Password123"
+    }
+    await async_client.post("/auth/register", json=user_data)
+    
+    capacity, _ = parse_rate_limit(settings.rate_limits["auth_login"])
+    credentials = {"email": user_data["email"], "password": user_data["password"]}
+    
+    for _ in range(int(capacity)):
+        resp = await async_client.post("/auth/login", json=credentials)
+        assert resp.status_code == 200
+    
+    # bucket is empty now
+    resp = await async_client.post("/auth/login", json=credentials)
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
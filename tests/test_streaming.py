@@ -0,0 +1,97 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.config import settings
+from api.core.models import Note, Tag, note_tags
+from api.core.streaming import NDJSON, NDJSONResponse
+
+pytestmark = pytest.mark.asyncio
+
+
+def parse(resp) -> list[dict]:
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == NDJSON
+    return [json.loads(line) for line in resp.text.splitlines()]
+
+
+async def test_listings_stream_past_the_page_limit(
+    async_client: AsyncClient,
+    access_token: str,
+    db_connection: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(settings, "stream_batch_size", 40)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    first = (await async_client.post("/notes/", json={"title": "First", "content": "#bulk"}, headers=headers)).json()
+    tag = first["tags_read"][0]
+
+    now = datetime.now(timezone.utc)
+    note_ids = (await db_connection.execute(
+        insert(Note).returning(Note.id),
+        [
+            {
+                "uuid": uuid4(), "title": f"Bulk {i}", "content": "#bulk", "user_id": first["user_id"],
+                "created_at": now - timedelta(minutes=i + 1), "updated_at": now - timedelta(minutes=i + 1)
+            }
+            for i in range(150)
+        ]
+    )).scalars().all()
+    tag_id = (await db_connection.execute(select(Tag.id).where(Tag.uuid == tag["uuid"]))).scalar_one()
+    await db_connection.execute(
+        insert(note_tags),
+        [{"note_id": note_id, "tag_id": tag_id, "user_id": first["user_id"]} for note_id in note_ids]
+    )
+    await db_connection.commit()
+
+    headers["Accept"] = NDJSON
+    resp = await async_client.get("/notes/", headers=headers)
+    notes = parse(resp)
+    assert [note["title"] for note in notes] == ["First"] + [f"Bulk {i}" for i in range(150)]
+    # The statement count is sent before the rows are read, it would be wrong
+    assert "x-db-statements" not in resp.headers
+
+    notes = parse(await async_client.get("/notes/", params={"skip": 100}, headers=headers))
+    assert len(notes) == 51
+
+    notes = parse(await async_client.get(f"/tags/{tag['uuid']}/notes", headers=headers))
+    assert len(notes) == 151
+
+    tags = parse(await async_client.get("/tags/", headers=headers))
+    assert [(tag["name"], tag["note_count"]) for tag in tags] == [("bulk", 151)]
+
+    # Without the header the listing is paginated as before
+    del headers["Accept"]
+    resp = await async_client.get("/notes/", headers=headers)
+    assert len(resp.json()) == 20
+    assert "x-db-statements" in resp.headers
+
+
+async def test_stream_is_closed_when_the_client_disconnects():
+    sent = []
+    closed = asyncio.Event()
+
+    async def lines():
+        try:
+            while True:
+                yield "{}\n"
+        finally:
+            closed.set()
+
+    async def receive():
+        await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # The disconnect cancels the response here, while the generator is suspended
+        sent.append(message)
+        await asyncio.sleep(0.001)
+
+    await NDJSONResponse(lines())({"type": "http", "asgi": {"version": "3.0"}}, receive, send)
+    assert closed.is_set()
+    assert len(sent) > 1
+    assert sent[-1].get("more_body", True)
@@ -0,0 +1,108 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.tags.index import TagIndex
+from api.tags.query import And, Not, Or, TagQueryError, TagTerm, parse_tag_query
+
+
+
+def test_parse_tag_query():
+    assert parse_tag_query("a AND (b OR NOT c)") == And((
+        TagTerm("a"), Or((TagTerm("b"), Not(TagTerm("c"))))
+    ))
+    # adjacent terms are ANDed, AND binds tighter than OR, operators are case-insensitive
+    assert parse_tag_query("a b or c") == Or((And((TagTerm("a"), TagTerm("b"))), TagTerm("c")))
+    assert parse_tag_query("#or and not #not") == And((TagTerm("or"), Not(TagTerm("not"))))
+
+    for query in ["", "a AND", "(a OR b", "a)", "NOT", "a & b"]:
+        with pytest.raises(TagQueryError):
+            parse_tag_query(query)
+
+
+async def search(async_client: AsyncClient, headers: dict, tags: str, **params) -> list[str]:
+    resp = await async_client.get("/notes/", params={"tags": tags, "limit": 100, **params}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return sorted(note["title"] for note in resp.json())
+
+
+@pytest.mark.asyncio
+async def test_notes_tag_query(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    notes = {}
+    for title, content in [
+        ("A", "#python #async [[Child]]"),
+        ("B", "#python #draft"),
+        ("C", "#python"),
+        ("D", "#rust #async"),
+    ]:
+        resp = await async_client.post("/notes/", json={"title": title, "content": content}, headers=headers)
+        assert resp.status_code == 201
+        notes[title] = resp.json()
+
+    assert await search(async_client, headers, "python") == ["A", "B", "C"]
+    assert await search(async_client, headers, "python AND (async OR NOT draft)") == ["A", "C"]
+    assert await search(async_client, headers, "async OR draft") == ["A", "B", "D"]
+    assert await search(async_client, headers, "NOT python") == ["Child", "D"]
+    assert await search(async_client, headers, "unknown") == []
+    assert await search(async_client, headers, "NOT unknown AND rust") == ["D"]
+
+    # pages come from the matches in the index, newest first
+    pages = [
+        (await async_client.get("/notes/", params={"tags": "python OR rust", "skip": skip, "limit": 2}, headers=headers)).json()
+        for skip in (0, 2, 4)
+    ]
+    assert [[note["title"] for note in page] for page in pages] == [["D", "C"], ["B", "A"], []]
+
+    # children are searched in their folder only when parent_id is given
+    child = notes["A"]["children_read"][0]
+    resp = await async_client.put(
+        f"/notes/{child['uuid']}", json={"content": "#python"}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert await search(async_client, headers, "python") == ["A", "B", "C", "Child"]
+    assert await search(async_client, headers, "python", parent_id=notes["A"]["id"]) == ["Child"]
+
+    # updates, deletes and removed tags are reflected in the built index
+    resp = await async_client.put(
+        f"/notes/{notes['C']['uuid']}", json={"content": "#draft"}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert await search(async_client, headers, "python AND NOT draft") == ["A", "Child"]
+
+    resp = await async_client.delete(f"/notes/{notes['A']['uuid']}", headers=headers)
+    assert resp.status_code == 200
+    assert await search(async_client, headers, "python OR async") == ["B", "D"]
+
+    tags = {tag["name"]: tag for tag in (await async_client.get("/tags/", headers=headers)).json()}
+    resp = await async_client.delete(f"/tags/{tags['draft']['uuid']}", headers=headers)
+    assert resp.status_code == 200
+    assert await search(async_client, headers, "draft") == []
+
+    resp = await async_client.get("/notes/", params={"tags": "python AND"}, headers=headers)
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_update_during_rebuild_is_not_lost(
+    async_client: AsyncClient,
+    db_connection: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch
+):
+    index = await TagIndex.for_user(1)
+    fill = TagIndex._fill
+
+    async def fill_then_commit_elsewhere(self, db, pipe):
+        await fill(self, db, pipe)
+        # Another request commits after the snapshot was read, the index is not ready yet
+        await self.note_changed(42, removed_tags=[], added_tags=[7])
+
+    monkeypatch.setattr(TagIndex, "_fill", fill_then_commit_elsewhere)
+    await index.rebuild(db_connection)
+    assert not await index.cache.exists(index.ready_key)
+
+    monkeypatch.setattr(TagIndex, "_fill", fill)
+    await index.rebuild(db_connection)
+    assert await index.cache.exists(index.ready_key)
@@ -0,0 +1,153 @@
+import pytest
+from httpx import AsyncClient
+from api.tags.utils import encode_cursor
+
+pytestmark = pytest.mark.asyncio
+
+
+async def create_notes(async_client: AsyncClient, headers: dict, contents: list[str]):
+    for i, content in enumerate(contents):
+        resp = await async_client.post(
+            "/notes/", json={"title": f"Note {i}", "content": content}, headers=headers
+        )
+        assert resp.status_code == 201
+
+
+async def test_tags_pagination_with_counts(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await create_notes(async_client, headers, ["#b #c", "#b #d", "#b #c", "#a"])
+    await async_client.post("/tags/", json={"name": "unused"}, headers=headers)
+
+    # by name, two per page
+    names, counts, cursor = [], {}, None
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        resp = await async_client.get("/tags/", params=params, headers=headers)
+        assert resp.status_code == 200
+        assert len(resp.json()) <= 2
+        for tag in resp.json():
+            names.append(tag["name"])
+            counts[tag["name"]] = tag["note_count"]
+        cursor = resp.headers.get("x-next-cursor")
+        if not cursor:
+            break
+
+    assert names == ["a", "b", "c", "d", "unused"]
+    assert counts == {"a": 1, "b": 3, "c": 2, "d": 1, "unused": 0}
+
+    # by usage, ties by name
+    resp = await async_client.get("/tags/", params={"sort": "usage", "limit": 3}, headers=headers)
+    assert [tag["name"] for tag in resp.json()] == ["b", "c", "a"]
+
+    resp = await async_client.get(
+        "/tags/",
+        params={"sort": "usage", "limit": 3, "cursor": resp.headers["x-next-cursor"]},
+        headers=headers
+    )
+    assert [tag["name"] for tag in resp.json()] == ["d", "unused"]
+    assert "x-next-cursor" not in resp.headers
+
+    resp = await async_client.get("/tags/", params={"cursor": "garbage"}, headers=headers)
+    assert resp.status_code == 400
+    # Right keys, wrong value types
+    for sort, values in [
+        ("name", {"name": 5}),
+        ("usage", {"count": "x", "name": "a"}),
+        ("usage", {"count": True, "name": "a"}),
+    ]:
+        resp = await async_client.get(
+            "/tags/", params={"sort": sort, "cursor": encode_cursor(values)}, headers=headers
+        )
+        assert resp.status_code == 400
+
+
+async def test_tag_rename_and_merge_rewrite_content(
+    async_client: AsyncClient,
+    access_token: str,
+    monkeypatch
+):
+    from api.core.config import settings
+    monkeypatch.setattr(settings, "tag_rewrite_chunk_size", 2)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await create_notes(async_client, headers, [
+        "#py and #python", "#py, #py!", "#py #snake", "#snake", "#python",
+    ])
+    tags = {tag["name"]: tag for tag in (await async_client.get("/tags/", headers=headers)).json()}
+
+    async def contents() -> list[str]:
+        resp = await async_client.get("/notes/", params={"limit": 100}, headers=headers)
+        notes = sorted(resp.json(), key=lambda note: note["title"])
+        return [note["content"] for note in notes]
+
+    resp = await async_client.put(f"/tags/{tags['py']['uuid']}", json={"name": "python"}, headers=headers)
+    assert resp.status_code == 400
+    resp = await async_client.put(f"/tags/{tags['py']['uuid']}", json={"name": "bad name"}, headers=headers)
+    assert resp.status_code == 400
+
+    resp = await async_client.put(f"/tags/{tags['py']['uuid']}", json={"name": "serpent"}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["notes_rewritten"] == 3
+    assert await contents() == [
+        "#serpent and #python", "#serpent, #serpent!", "#serpent #snake", "#snake", "#python",
+    ]
+
+    resp = await async_client.post(
+        f"/tags/{tags['snake']['uuid']}/merge", json={"target_uuid": tags["py"]["uuid"]}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "id": tags["py"]["id"], "uuid": tags["py"]["uuid"], "name": "serpent", "notes_rewritten": 2,
+    }
+    assert await contents() == [
+        "#serpent and #python", "#serpent, #serpent!", "#serpent #serpent", "#serpent", "#python",
+    ]
+
+    resp = await async_client.get("/tags/", headers=headers)
+    assert {tag["name"]: tag["note_count"] for tag in resp.json()} == {"serpent": 4, "python": 2}
+    resp = await async_client.get("/notes/", params={"tags": "serpent AND NOT python"}, headers=headers)
+    assert len(resp.json()) == 3
+
+    # the next parse of a rewritten note finds the new name, the old tags stay gone
+    resp = await async_client.get("/notes/", params={"limit": 100}, headers=headers)
+    note = next(note for note in resp.json() if note["content"] == "#serpent #serpent")
+    resp = await async_client.put(f"/notes/{note['uuid']}", json={"content": note["content"]}, headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get("/tags/", headers=headers)
+    assert sorted(tag["name"] for tag in resp.json()) == ["python", "serpent"]
+
+
+async def test_tag_suggest(
+    async_client: AsyncClient,
+    access_token: str
+):
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await create_notes(async_client, headers, ["#pyramid", "#python #pytest", "#python #rust", "#python"])
+
+    async def suggest(prefix: str, **params) -> list[tuple[str, int]]:
+        resp = await async_client.get("/tags/suggest", params={"prefix": prefix, **params}, headers=headers)
+        assert resp.status_code == 200
+        return [(tag["name"], tag["note_count"]) for tag in resp.json()]
+
+    assert await suggest("py") == [("python", 3), ("pyramid", 1), ("pytest", 1)]
+    assert await suggest("py", limit=1) == [("python", 3)]
+    assert await suggest("") == [("python", 3), ("pyramid", 1), ("pytest", 1), ("rust", 1)]
+    assert await suggest("x") == []
+
+    # kept up to date once built
+    resp = await async_client.get("/notes/", params={"limit": 100}, headers=headers)
+    notes = {note["title"]: note for note in resp.json()}
+    resp = await async_client.put(
+        f"/notes/{notes['Note 0']['uuid']}", json={"content": "#pytest #pyx"}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert await suggest("py") == [("python", 3), ("pytest", 2), ("pyx", 1), ("pyramid", 0)]
+
+    tags = {tag["name"]: tag for tag in (await async_client.get("/tags/", headers=headers)).json()}
+    await async_client.put(f"/tags/{tags['pytest']['uuid']}", json={"name": "testing"}, headers=headers)
+    await async_client.delete(f"/tags/{tags['pyramid']['uuid']}", headers=headers)
+    await async_client.post("/tags/", json={"name": "pyre"}, headers=headers)
+    assert await suggest("py") == [("python", 3), ("pyx", 1), ("pyre", 0)]
+    assert await suggest("te") == [("testing", 2)]